@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+规则老化存储 (SQLite，按规范化域名为键)
+• 每个域名记录: 首次出现 | 最近出现 | 最近验证有效 | 最近得出结论 | 连续失效起点
+• 稳定规则免验证: 最近一次验证有效仍在复验周期内（周期按域名哈希错开，避免同批域名同时到期）
+• 失效结论短期复用: 复查间隔内不再重复查询确认失效的域名
+• 泛解析探测结论同样入库（泛解析区过期时，区内域名的结论一并作废，保证后缀规则合并结果稳定）
+• 过期: 连续失效超过宽限期的规则从输出中剔除；上游消失超过保留期的记录从存储中清除
+"""
+
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# === 配置区 ===
+AGING_DB = Path("data") / "stats" / "rule-aging.sqlite"   # 存储位置（相对工作区；不入库，CI 经 Actions 缓存跨运行保留）
+REVALIDATE_AFTER = 3 * 86400     # 验证有效后免验证时长（秒）
+REVALIDATE_JITTER = 0.5          # 复验周期按域名哈希在 [1, 1+JITTER] 倍之间错开
+NEGATIVE_RECHECK = 86400         # 失效结论复用时长（秒）
+UNRESOLVABLE_GRACE = 0           # 连续失效超过该时长（秒）才剔除（0 = 首次确认失效即剔除）
+ABSENT_RETENTION = 30 * 86400    # 上游消失超过该时长的记录被清除
+QUERY_CHUNK = 500                # 单条 IN 查询的参数个数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    domain TEXT PRIMARY KEY,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    last_validated INTEGER,
+    last_checked INTEGER,
+    failing_since INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS zones (
+    parent TEXT PRIMARY KEY,
+    wildcard INTEGER NOT NULL,
+    checked INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def revalidate_after(domain: str) -> float:
+    """该域名的复验周期（稳定哈希错开到期时间）"""
+    return REVALIDATE_AFTER * (1 + REVALIDATE_JITTER * (zlib.crc32(domain.encode()) / 0xFFFFFFFF))
+
+
+class AgingStore:
+    """规则老化存储（readonly: 分片模式只读复用结论，由合并进程统一写入）"""
+
+    def __init__(self, path: Path, readonly: bool = False):
+        self.path = Path(path)
+        self.readonly = readonly
+        self.conn = None
+        self.reused_valid = 0    # 复用有效结论（免验证）的域名数
+        self.reused_invalid = 0  # 复用失效结论的域名数
+        self.graced = 0          # 已确认失效但仍在宽限期内保留的域名数
+        self.pruned = 0          # 清除的过期记录数
+
+    def open(self) -> bool:
+        """打开存储（仅在启用老化时加载 sqlite3）；只读模式下文件不存在时返回 False"""
+        import sqlite3
+        if self.readonly:
+            if not self.path.exists():
+                return False
+            self.conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        return True
+
+    def close(self):
+        if self.conn is not None:
+            if not self.readonly:
+                self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM rules").fetchone()[0]
+
+    def lookup(self, domains: Iterable[str]) -> Dict[str, Tuple[Optional[int], Optional[int], Optional[int]]]:
+        """域名 → (最近验证有效, 最近得出结论, 连续失效起点)"""
+        rows = {}
+        domains = list(domains)
+        for i in range(0, len(domains), QUERY_CHUNK):
+            chunk = domains[i:i + QUERY_CHUNK]
+            cursor = self.conn.execute(
+                "SELECT domain, last_validated, last_checked, failing_since FROM rules "
+                f"WHERE domain IN ({','.join('?' * len(chunk))})", chunk)
+            for domain, validated, checked, failing in cursor:
+                rows[domain] = (validated, checked, failing)
+        return rows
+
+    def reusable(self, domains: Iterable[str], now: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """仍可复用的结论: (有效域名 → 验证时间, 失效域名 → 结论时间)"""
+        valid, invalid = {}, {}
+        for domain, (validated, checked, failing) in self.lookup(domains).items():
+            if failing is None:
+                if validated is not None and now - validated < revalidate_after(domain):
+                    valid[domain] = validated
+            elif checked is not None and now - checked < NEGATIVE_RECHECK:
+                invalid[domain] = checked
+        self.reused_valid += len(valid)
+        self.reused_invalid += len(invalid)
+        return valid, invalid
+
+    def wildcard_zones(self, now: int) -> Tuple[Dict[str, bool], Set[str]]:
+        """泛解析探测结论: (仍在复验周期内的父域 → 是否泛解析, 已过期的泛解析区)"""
+        fresh, stale = {}, set()
+        for parent, wildcard, checked in self.conn.execute("SELECT parent, wildcard, checked FROM zones"):
+            if now - checked < revalidate_after(parent):
+                fresh[parent] = bool(wildcard)
+            elif wildcard:
+                stale.add(parent)
+        return fresh, stale
+
+    def record_zones(self, verdicts: Dict[str, Tuple[bool, int]]):
+        """写入泛解析探测结论（父域 → (是否泛解析, 探测时间)）"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO zones (parent, wildcard, checked) VALUES (?, ?, ?)",
+            ((parent, int(wildcard), ts) for parent, (wildcard, ts) in verdicts.items()))
+
+    def mark_seen(self, domains: Iterable[str], now: int):
+        """记录本次上游中出现的域名（新域名写入首次出现时间）"""
+        self.conn.executemany(
+            "INSERT INTO rules (domain, first_seen, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(domain) DO UPDATE SET last_seen = excluded.last_seen",
+            ((domain, now, now) for domain in domains))
+
+    def record(self, valid: Dict[str, int], invalid: Dict[str, int]):
+        """写入验证结论（域名 → 结论时间）；有效结论清除连续失效起点"""
+        self.conn.executemany(
+            "UPDATE rules SET last_validated = ?1, last_checked = ?1, failing_since = NULL WHERE domain = ?2",
+            ((ts, domain) for domain, ts in valid.items()))
+        self.conn.executemany(
+            "UPDATE rules SET last_checked = ?1, failing_since = COALESCE(failing_since, ?1) WHERE domain = ?2",
+            ((ts, domain) for domain, ts in invalid.items()))
+
+    def expired(self, invalid: Set[str], now: int) -> Set[str]:
+        """已确认失效的域名中连续失效超过宽限期、应从输出剔除的部分"""
+        if UNRESOLVABLE_GRACE <= 0 or not invalid:
+            return set(invalid)
+        rows = self.lookup(invalid)
+        expired = {domain for domain in invalid
+                   if rows.get(domain, (None, None, None))[2] is None
+                   or now - rows[domain][2] >= UNRESOLVABLE_GRACE}
+        self.graced += len(invalid) - len(expired)
+        return expired
+
+    def prune(self, now: int) -> int:
+        """清除上游消失超过保留期的记录（有清除时整理数据库文件）"""
+        cursor = self.conn.execute("DELETE FROM rules WHERE last_seen < ?", (now - ABSENT_RETENTION,))
+        self.conn.execute("DELETE FROM zones WHERE checked < ?", (now - ABSENT_RETENTION,))
+        self.pruned += cursor.rowcount
+        self.conn.commit()
+        if cursor.rowcount:
+            self.conn.execute("VACUUM")
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'rules': len(self),
+            'reused_valid': self.reused_valid,
+            'reused_invalid': self.reused_invalid,
+            'graced': self.graced,
+            'pruned': self.pruned,
+        }
+
+
+def report(path: Path, now: Optional[int] = None) -> List[str]:
+    """存储概况: 规则年龄分布与待复验数量"""
+    now = now or int(time.time())
+    store = AgingStore(path, readonly=True)
+    if not store.open():
+        return [f"⚠️ 未找到老化存储: {path}"]
+    try:
+        total = len(store)
+        lines = [f"🗄️ {path}: {total} 条记录"]
+        for label, condition in (('7天内新增', "? - first_seen < 7 * 86400"),
+                                 ('30天内新增', "? - first_seen < 30 * 86400"),
+                                 ('存在90天以上', "? - first_seen >= 90 * 86400")):
+            count = store.conn.execute(f"SELECT COUNT(*) FROM rules WHERE {condition}", (now,)).fetchone()[0]
+            lines.append(f"  📅 {label}: {count}")
+        failing = store.conn.execute("SELECT COUNT(*) FROM rules WHERE failing_since IS NOT NULL").fetchone()[0]
+        never = store.conn.execute("SELECT COUNT(*) FROM rules WHERE last_checked IS NULL").fetchone()[0]
+        lines.append(f"  ❌ 连续失效: {failing} | ❔ 从未验证: {never}")
+        return lines
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    print("\n".join(report(Path(os.getenv('WORKSPACE', os.getcwd())) / AGING_DB)))
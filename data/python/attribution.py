@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+规则来源归属索引 (合并阶段生成，可 mmap 的二进制文件)
+• 每条合并后的规则 → 贡献该规则的来源位图，以及各来源中的首次出现位置与最优表面形式
+• why(domain): 按规范化域名二分查找，列出命中该域名（含父域子树规则）的规则及其来源
+• rebuild(exclude): 仅凭索引复现"去掉某些来源后"的合并结果（顺序/表面形式/子树覆盖均与重新合并一致）
+• 用法: python attribution.py why ads.example.com [...]
+        python attribution.py without adblock05.txt [...] [--group adblock] [-o 输出文件]
+"""
+
+import os
+import re
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from domains import normalize_domain
+from rules import KIND_ANCHOR, KIND_DOMAIN, KIND_PLAIN, KIND_URL, KIND_WILDCARD, tokenize
+
+# === 配置区 ===
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+INDEX_SUFFIX = ".attr"    # 索引文件: tmp/<合并输出名>.attr，如 tmp/adblock.attr
+MAX_SOURCES = 64          # 来源位图宽度 (u64)
+
+# === 文件格式 ===
+# 头部之后为按列存放的定长数组（本机字节序，8/4/2/1 字节列依次排列以保持对齐），最后是 UTF-8 字符串区
+# 规则按合并顺序编号；出现记录按 (规则, 来源) 排序，规则 i 的记录区间为 [起点[i], 起点[i+1])
+MAGIC = b'EAATTR02'
+HEADER = struct.Struct('<8s?xxxIIIII')   # 魔数, 是否小端, 来源数, 规则数, 有域名的规则数, 出现记录数, 字符串区字节数
+COLUMNS = (
+    # (列名, array 类型码, 长度取自)
+    ('mask', 'Q', 'entries'),            # 来源位图
+    ('source_off', 'I', 'sources'),      # 来源名: 字符串偏移
+    ('source_len', 'I', 'sources'),      # 来源名: 字节数
+    ('key_off', 'I', 'entries'),         # 规范化域名: 字符串偏移（无域名时长度为 0）
+    ('key_len', 'I', 'entries'),
+    ('covered', 'i', 'entries'),         # 覆盖该规则的子树规则下标（-1 无）
+    ('occ_start', 'I', 'entries+1'),     # 出现记录起点
+    ('keys', 'I', 'keyed'),              # 有域名的规则下标，按 (域名, 下标) 排序
+    ('position', 'I', 'occurrences'),    # 来源内首次出现的行号
+    ('text_off', 'I', 'occurrences'),    # 该来源中最优表面形式: 字符串偏移
+    ('text_len', 'I', 'occurrences'),
+    ('source', 'H', 'occurrences'),      # 来源下标
+    ('rank', 'B', 'occurrences'),        # 表面形式优先级
+)
+
+URL_HOST = re.compile(r'\|\|([\w.-]+)')
+
+
+def rule_domain(rule: str) -> Optional[str]:
+    """无语义键的规则（URL路径 / 带通配等）尽量取其主机名，便于 why() 查到"""
+    kind, _, start, end, _, _, _ = tokenize(rule)
+    if kind in (KIND_DOMAIN, KIND_ANCHOR, KIND_PLAIN, KIND_WILDCARD):
+        return normalize_domain(rule[start:end].lstrip('*.'))
+    if kind == KIND_URL:
+        match = URL_HOST.match(rule, start)
+        if match:
+            return normalize_domain(match.group(1))
+    return None
+
+
+class AttributionBuilder:
+    """合并过程中收集归属信息（规则下标与 merge_rules 的 merged 列表一一对应）"""
+
+    def __init__(self):
+        self.sources: List[str] = []
+        self.domains: List[Optional[str]] = []
+        self.covered_by: Dict[int, int] = {}
+        self.occurrences: List[Dict[int, list]] = []   # 每个来源: 规则下标 → [首次行号, 最优优先级, 最优文本]
+        self._current: Dict[int, list] = {}
+
+    def add_source(self, name: str) -> int:
+        """开始记录下一个来源（来源按合并顺序依次处理）"""
+        if len(self.sources) >= MAX_SOURCES:
+            raise ValueError(f"来源数超过位图宽度 {MAX_SOURCES}")
+        self.sources.append(name)
+        self._current = {}
+        self.occurrences.append(self._current)
+        return len(self.sources) - 1
+
+    def add_entry(self, key: Optional[tuple], rule: str):
+        self.domains.append(key[1] if key is not None else rule_domain(rule))
+
+    def record(self, index: int, position: int, rank: int, rule: str):
+        """记录当前来源中的一次出现: 保留首次行号，以及最优（同优先级取最早）表面形式"""
+        slot = self._current.get(index)
+        if slot is None:
+            self._current[index] = [position, rank, rule]
+        elif rank < slot[1]:
+            slot[1] = rank
+            slot[2] = rule
+
+    def cover(self, index: int, covering: int):
+        self.covered_by[index] = covering
+
+    def write(self, path: Path):
+        """写出索引（先写临时文件再原子替换）"""
+        columns = {name: array(code) for name, code, _ in COLUMNS}
+        chunks: List[bytes] = []
+        offsets: Dict[str, tuple] = {}   # 文本 → (字符串区偏移, 字节数)，相同文本只存一份
+        size = 0
+
+        def intern(text: str) -> tuple:
+            nonlocal size
+            ref = offsets.get(text)
+            if ref is None:
+                data = text.encode('utf-8')
+                ref = offsets[text] = (size, len(data))
+                chunks.append(data)
+                size += len(data)
+            return ref
+
+        for name in self.sources:
+            offset, length = intern(name)
+            columns['source_off'].append(offset)
+            columns['source_len'].append(length)
+
+        by_entry: List[list] = [[] for _ in self.domains]   # 按来源顺序追加，天然有序
+        for source, slots in enumerate(self.occurrences):
+            for index, slot in slots.items():
+                by_entry[index].append((source, slot))
+
+        mask_col, occ_start = columns['mask'], columns['occ_start']
+        position_col, source_col, rank_col = columns['position'], columns['source'], columns['rank']
+        text_off, text_len = columns['text_off'], columns['text_len']
+        key_off, key_len = columns['key_off'], columns['key_len']
+        count = 0
+        for index, domain in enumerate(self.domains):
+            occ_start.append(count)
+            mask = 0
+            for source, (position, rank, rule) in by_entry[index]:
+                mask |= 1 << source
+                source_col.append(source)
+                rank_col.append(rank)
+                position_col.append(position)
+                offset, length = offsets.get(rule) or intern(rule)
+                text_off.append(offset)
+                text_len.append(length)
+            count += len(by_entry[index])
+            mask_col.append(mask)
+            offset, length = intern(domain) if domain else (0, 0)
+            key_off.append(offset)
+            key_len.append(length)
+        occ_start.append(count)
+        columns['covered'].extend(self.covered_by.get(i, -1) for i in range(len(self.domains)))
+        columns['keys'].extend(i for _, i in sorted((d, i) for i, d in enumerate(self.domains) if d))
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, sys.byteorder == 'little', len(self.sources), len(self.domains),
+                                len(columns['keys']), count, size))
+            for name, _, _ in COLUMNS:
+                columns[name].tofile(f)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+
+class AttributionIndex:
+    """只读索引（mmap + memoryview 零拷贝按列访问，不整体载入内存）"""
+
+    def __init__(self, path: Path):
+        import mmap
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, little, n_sources, n_entries, n_keyed, n_occurrences, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是归属索引文件: {self.path}")
+        if little != (sys.byteorder == 'little'):
+            raise ValueError(f"索引字节序与本机不一致，请重新运行合并阶段: {self.path}")
+        lengths = {'sources': n_sources, 'entries': n_entries, 'entries+1': n_entries + 1,
+                   'keyed': n_keyed, 'occurrences': n_occurrences}
+        offset = HEADER.size
+        self._columns = {}
+        for name, code, length in COLUMNS:
+            nbytes = lengths[length] * array(code).itemsize
+            self._columns[name] = self._view[offset:offset + nbytes].cast(code)
+            offset += nbytes
+        self._strings_at = offset
+        self.entry_count = n_entries
+        self.sources = [self._string(o, n) for o, n in zip(self._columns['source_off'], self._columns['source_len'])]
+
+    def close(self):
+        self._columns.clear()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_at + offset
+        return str(self._map[start:start + length], 'utf-8')
+
+    def _key(self, index: int) -> str:
+        return self._string(self._columns['key_off'][index], self._columns['key_len'][index])
+
+    def _lookup(self, domain: str) -> List[int]:
+        """二分查找域名完全相同的规则下标"""
+        keys = self._columns['keys']
+        lo, hi = 0, len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(keys[mid]) < domain:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < len(keys) and self._key(keys[lo]) == domain:
+            found.append(keys[lo])
+            lo += 1
+        return found
+
+    def _surface(self, occurrences: Sequence[int]) -> Optional[str]:
+        """最优表面形式: 优先级最小者，同优先级取最早来源（与合并时的替换规则一致）"""
+        rank = self._columns['rank']
+        best = min(occurrences, key=rank.__getitem__, default=None)  # min 取首个最小值，记录已按来源排序
+        if best is None:
+            return None
+        return self._string(self._columns['text_off'][best], self._columns['text_len'][best])
+
+    def rule(self, index: int) -> Optional[str]:
+        occ_start = self._columns['occ_start']
+        return self._surface(range(occ_start[index], occ_start[index + 1]))
+
+    def why(self, domain: str) -> List[dict]:
+        """命中该域名及其各级父域的规则: 规则文本、来源、是否被子树规则覆盖"""
+        normalized = normalize_domain(domain)
+        if normalized is None:
+            return []
+        mask, covered = self._columns['mask'], self._columns['covered']
+        labels = normalized.split('.')
+        results = []
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:])
+            for index in self._lookup(suffix):
+                results.append({
+                    'domain': suffix,
+                    'rule': self.rule(index),
+                    'sources': [name for s, name in enumerate(self.sources) if mask[index] >> s & 1],
+                    'covered_by': self.rule(covered[index]) if covered[index] >= 0 else None,
+                })
+        return results
+
+    def rebuild(self, exclude: Sequence[int] = ()) -> List[str]:
+        """去掉指定来源后的合并结果（不读取、不解析任何来源文件）"""
+        excluded = 0
+        for source in exclude:
+            excluded |= 1 << source
+        columns = self._columns
+        mask, covered, occ_start = columns['mask'], columns['covered'], columns['occ_start']
+        source, position, rank = columns['source'], columns['position'], columns['rank']
+        alive = [m & ~excluded != 0 for m in mask]
+        ordered = []
+        for index in range(self.entry_count):
+            if not alive[index]:
+                continue
+            cover = covered[index]
+            if cover >= 0 and alive[cover]:
+                continue
+            occurrences = range(occ_start[index], occ_start[index + 1])
+            if mask[index] & excluded:
+                occurrences = [o for o in occurrences if not excluded >> source[o] & 1]
+            best = min(occurrences, key=rank.__getitem__)
+            first = occurrences[0]   # 首个剩余来源中的首次出现决定顺序
+            ordered.append((source[first], position[first], best))
+        ordered.sort()
+        text_off, text_len = columns['text_off'], columns['text_len']
+        return [self._string(text_off[best], text_len[best]) for _, _, best in ordered]
+
+    def source_index(self, name: str) -> int:
+        """来源名 (adblock05.txt) 或编号 (05 / 5) → 来源下标"""
+        if name in self.sources:
+            return self.sources.index(name)
+        for i, source in enumerate(self.sources):
+            digits = ''.join(c for c in source if c.isdigit())
+            if name.isdigit() and digits and int(digits) == int(name):
+                return i
+        raise KeyError(name)
+
+
+def index_path(temp_dir, output_file: str) -> Path:
+    return Path(temp_dir) / (Path(output_file).stem + INDEX_SUFFIX)
+
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description="EasyAds 规则来源归属查询")
+    parser.add_argument('--workspace', default=WORKSPACE, help="工作区路径（索引位于 tmp/）")
+    sub = parser.add_subparsers(dest='command', required=True)
+    why = sub.add_parser('why', help="查询域名被哪些规则/来源命中")
+    why.add_argument('domains', nargs='+')
+    without = sub.add_parser('without', help="仅凭索引重建去掉指定来源后的合并结果")
+    without.add_argument('sources', nargs='+', help="来源文件名或编号，如 adblock05.txt / 05")
+    without.add_argument('--group', default='adblock', choices=['adblock', 'allow'])
+    without.add_argument('-o', '--output', help="输出文件（默认只打印统计）")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    temp_dir = Path(args.workspace) / "tmp"
+
+    if args.command == 'why':
+        found = False
+        for group in ('adblock', 'allow'):
+            path = index_path(temp_dir, f"{group}.txt")
+            if not path.exists():
+                print(f"⚠️ 未找到索引: {path}（请先运行合并阶段）")
+                continue
+            with AttributionIndex(path) as index:
+                for domain in args.domains:
+                    for hit in index.why(domain):
+                        found = True
+                        covered = f" | 已被 {hit['covered_by']} 覆盖" if hit['covered_by'] else ''
+                        print(f"🔎 [{group}] {domain} ← {hit['rule']} | 来源: {', '.join(hit['sources'])}{covered}")
+        if not found:
+            print("ℹ️ 没有规则命中")
+        return 0
+
+    path = index_path(temp_dir, f"{args.group}.txt")
+    with AttributionIndex(path) as index:
+        try:
+            exclude = [index.source_index(name) for name in args.sources]
+        except KeyError as e:
+            print(f"❌ 未知来源: {e.args[0]} | 可用: {', '.join(index.sources)}")
+            return 1
+        rules = index.rebuild(exclude)
+        print(f"📊 去掉 {', '.join(index.sources[i] for i in exclude)} 后: "
+              f"{len(rules)} 条规则 (原 {len(index.rebuild())} 条)")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as out:
+            for rule in rules:
+                out.write(rule + '\n')
+        print(f"✅ 已写出: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
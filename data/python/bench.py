@@ -0,0 +1,1828 @@
+#!/usr/bin/env python3
+"""
+规则性能基准工具
+• lookup: 离线查询回放 | 以解析器成本衡量规则变更
+• stages: 合成语料 + 本地HTTP源 | 逐阶段吞吐与峰值内存 | 基线回归检测
+• startup: -X importtime 冷启动预算 | 导入无副作用检查
+• tokenizer: 单遍分词器 vs 旧正则链 | 吞吐与结果等价性
+• dns: 本地桩DNS服务器(注入时延/丢包/SERVFAIL) | 旧验证器 vs 解析器池(有/无对冲) | 误删与尾延迟
+• shards: N 个进程分片验证 + 合并 | 与单进程结果逐字节对照 | 缺失分片重跑
+• attribution: 来源归属索引 | 去掉某来源后的索引重建 vs 重新合并逐条对照 | why() 查询耗时
+• emit: 解析器原生格式 (unbound/dnsmasq/RPZ/smartdns) | 单遍输出耗时 | 解析器替身加载耗时 vs dns.txt/hosts.txt | 判定一致性
+• compact: 紧凑二进制产物 | 体积 vs hosts.txt | 打开耗时/驻留内存 | 查询吞吐 | 判定一致性与布隆误判率
+• aging: 规则老化存储 | 连续运行的查询量与输出对照 | 错开复验 / 过期清除 / 失效宽限期
+• serve: 本地发布服务器 | ETag / 304 / Range / 编码协商行为检查 | 8.8 万行文件各场景每秒请求数
+• split: 输出分片 (hash / tld) | 不同规模更新后重写的分片数与字节 | 仅重载变化分片 vs 整表重载 | 分片完整性与行数上限
+• regex: 正则成本分析 | 已知病态 / 可改写用例的处理是否符合预期 | 改写等价性 | 分析前后单次查询的正则总成本
+• deadline: 运行预算 | 下载截止/源失效后沿用上次成功副本 | DNS截止后停止查询并信任缓存 | 预算不足时跳过可选阶段并记录降级
+• 输出: 控制台报告 (可选JSON)
+"""
+
+import argparse
+import datetime
+import functools
+import http.server
+import importlib
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from itertools import accumulate
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from domains import normalize_domain
+from matcher import LOADERS, load_matcher
+
+# === 配置区 ===
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+LOOKUP_FILES = list(LOADERS)                      # 参与回放的产物
+DEFAULT_QUERIES = 1_000_000                       # 合成查询数量
+DEFAULT_UNIQUE = 50_000                           # 合成流中不同域名数
+DEFAULT_BLOCKED_SHARE = 0.3                       # 合成域名池中被拦截域名占比
+ZIPF_EXPONENT = 1.0                               # Zipf分布指数
+LATENCY_SAMPLE = 200_000                          # 逐次计时的查询样本数
+SEED = 20250818                                   # 固定随机种子，保证可复现
+
+CORPUS_SIZES = {'100k': 100_000, '1m': 1_000_000, '5m': 5_000_000}
+CORPUS_VERSION = 1                                # 语料生成器版本（变更后自动重新生成）
+CORPUS_BLOCK_SOURCES = 10                         # 合成拦截源数量（与dl.py一致）
+CORPUS_ALLOW_SOURCES = 11                         # 合成白名单源数量
+BENCH_DIR = os.path.join(WORKSPACE, "tmp", "bench")
+BASELINE_FILE = os.path.join(WORKSPACE, "data", "bench", "baseline.json")
+REGRESSION_TOLERANCE = 0.15                       # 吞吐下降/内存上涨超过15%视为回归
+SCRIPT_DIR = Path(__file__).resolve().parent
+STARTUP_BUDGETS_MS = {                            # 短阶段脚本的冷导入预算（不含解释器启动）
+    'title': 12,
+    'clean-readme': 12,
+    'clash': 12,
+    'hosts': 10,
+    'merge': 10,
+    'mihomo': 35,
+    'filter-dns': 20,
+    'pipeline': 25,
+    'sketch': 12,
+    'aging': 8,
+    'emit': 10,
+    'compact': 8,
+    'compress': 8,
+    'shard': 10,
+    'regexcost': 10,
+}
+STUB_SERVERS = ['20:0:0', '200:0:0', '30:0.2:0', '30:0:0.2']  # 桩DNS上游: 时延ms:丢包率:SERVFAIL率
+STUB_DOMAINS = {'ok': 400, 'nx': 100, 'nodata': 100}        # 桩域名: 存在 / NXDOMAIN / 无记录
+STUB_DEAD_ZONES = (10, 30)                                  # 不存在的可注册域数 × 每域子域数
+STUB_WILDCARD_ZONES = (5, 40)                               # 泛解析区数 × 每区子域数
+RETRY_SLACK = 1.0                                            # DNS截止场景的耗时余量（秒，含一次重试退避）
+LAZY_MODULES = {'aiodns', 'pycares', 'asyncio', 'pytz', 'requests', 'zoneinfo'}  # 导入阶段不应加载的重依赖
+
+BENIGN_WORDS = [
+    'api', 'cdn', 'img', 'static', 'www', 'mail', 'login', 'news', 'video',
+    'music', 'shop', 'cloud', 'edge', 'app', 'dl', 'update', 'auth', 'm',
+]
+BENIGN_TLDS = ['com', 'net', 'org', 'cn', 'com.cn', 'io', 'co', 'top', 'xyz']
+
+
+# === 查询流 ===
+def read_query_log(path: Path) -> List[str]:
+    """读取查询日志: 每行一个域名，或 AdGuard Home querylog.json (QH字段)"""
+    queries = []
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    domain = json.loads(line).get('QH', '')
+                except ValueError:
+                    continue
+            else:
+                domain = line.split()[0]
+            if domain:
+                queries.append(normalize_domain(domain) or domain.rstrip('.').lower())
+    return queries
+
+
+def synthetic_queries(matchers, count: int, unique: int,
+                      blocked_share: float, seed: int = SEED) -> List[str]:
+    """生成Zipf分布的合成查询流（被拦截域名与普通域名混合）"""
+    rng = random.Random(seed)
+    blocked = set()
+    for matcher in matchers:
+        blocked.update(matcher.exact)
+        stack = [(trie.root, []) for trie in (matcher.suffix, matcher.important)]
+        while stack and len(blocked) < unique * 4:
+            node, labels = stack.pop()
+            for label, child in node.items():
+                if label == '':
+                    blocked.add('.'.join(reversed(labels)))
+                else:
+                    stack.append((child, labels + [label]))
+    blocked = sorted(blocked)
+
+    pool = []
+    wanted_blocked = min(len(blocked), int(unique * blocked_share))
+    for domain in rng.sample(blocked, wanted_blocked):
+        # 部分查询带随机子域名，覆盖后缀树的逐级匹配
+        if rng.random() < 0.3:
+            domain = f"{rng.choice(BENIGN_WORDS)}{rng.randrange(100)}.{domain}"
+        pool.append(domain)
+    while len(pool) < unique:
+        labels = [rng.choice(BENIGN_WORDS) for _ in range(rng.randint(1, 3))]
+        pool.append(f"{'.'.join(labels)}{rng.randrange(10000)}.{rng.choice(BENIGN_TLDS)}")
+    rng.shuffle(pool)
+
+    weights = list(accumulate(1.0 / (rank ** ZIPF_EXPONENT) for rank in range(1, len(pool) + 1)))
+    return rng.choices(pool, cum_weights=weights, k=count)
+
+
+# === 回放 ===
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+def replay(matcher, queries: List[str]) -> Dict[str, float]:
+    """回放查询流，统计吞吐、延迟与拦截率"""
+    is_blocked = matcher.is_blocked
+
+    start = time.perf_counter()
+    blocked = sum(1 for q in queries if is_blocked(q))
+    elapsed = time.perf_counter() - start
+
+    latencies = array('q')
+    clock = time.perf_counter_ns
+    for q in queries[:LATENCY_SAMPLE]:
+        t0 = clock()
+        is_blocked(q)
+        latencies.append(clock() - t0)
+    latencies = sorted(latencies)
+
+    return {
+        'lookups_per_sec': len(queries) / elapsed if elapsed else 0.0,
+        'p50_ns': percentile(latencies, 50),
+        'p99_ns': percentile(latencies, 99),
+        'block_rate': blocked / len(queries) if queries else 0.0,
+    }
+
+
+def cmd_lookup(args) -> int:
+    """lookup 子命令"""
+    root = Path(args.workspace)
+    print("🚀 离线查询回放基准启动")
+    print(f"工作目录: {root}")
+
+    matchers = []
+    results = {}
+    for filename in args.files:
+        tracemalloc.start()
+        load_start = time.perf_counter()
+        matcher = load_matcher(root / filename)
+        load_time = time.perf_counter() - load_start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        if matcher is None:
+            print(f"⚠️ 跳过不存在的文件: {filename}")
+            continue
+        matchers.append(matcher)
+        results[filename] = {
+            'rules': matcher.rule_count,
+            'skipped': matcher.skipped,
+            'load_sec': load_time,
+            'memory_bytes': memory,
+        }
+
+    if not matchers:
+        print("❌ 没有可用的规则文件")
+        return 1
+
+    if args.log:
+        queries = read_query_log(Path(args.log))
+        print(f"📥 查询日志: {args.log} ({len(queries)}条)")
+    else:
+        queries = synthetic_queries(matchers, args.queries, args.unique, args.blocked_share)
+        print(f"🎲 合成Zipf查询流: {len(queries)}条 / {args.unique}个域名")
+    if not queries:
+        print("❌ 查询流为空")
+        return 1
+
+    print("\n" + "=" * 72)
+    print(f"{'文件':<12}{'规则':>9}{'内存MB':>9}{'查询/秒':>12}{'p50 ns':>9}{'p99 ns':>9}{'拦截率':>9}")
+    for matcher in matchers:
+        stats = results[matcher.name]
+        stats.update(replay(matcher, queries))
+        print(f"{matcher.name:<12}{stats['rules']:>9}{stats['memory_bytes'] / 2**20:>9.1f}"
+              f"{stats['lookups_per_sec']:>12,.0f}{stats['p50_ns']:>9.0f}"
+              f"{stats['p99_ns']:>9.0f}{stats['block_rate']:>9.2%}")
+    print("=" * 72)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'queries': len(queries), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已写入: {args.json}")
+    return 0
+
+
+# === 合成语料 ===
+AD_WORDS = [
+    'ad', 'ads', 'adv', 'track', 'stat', 'log', 'pixel', 'beacon', 'union',
+    'promo', 'banner', 'click', 'analytics', 'metric', 'sdk', 'push', 'report',
+]
+AD_TLDS = ['com'] * 6 + ['cn'] * 3 + ['net'] * 2 + ['com.cn', 'org', 'io', 'top', 'xyz', 'cc']
+RULE_SHAPES = [  # (权重, 规则模板)
+    (55, '||{d}^'),
+    (4, '||{d}^$third-party'),
+    (1, '||{d}^$important'),
+    (1, '||{d}^$dnstype=AAAA'),
+    (15, '0.0.0.0 {d}'),
+    (4, '127.0.0.1 {d}'),
+    (5, '{d}'),
+    (3, '@@||{d}^'),
+    (2, '||{d}/ad/'),
+    (2, '##.ad-{n}'),
+    (2, '{d}##div.ad-{n}'),
+    (1, '/^ad[0-9]+\\.{e}$/'),
+    (3, '! comment {n}'),
+    (2, ''),
+]
+PRIORITY_RULES = [  # $important 优先级: important 例外 > important 拦截 > 例外 > 拦截
+    '||prio-a.invalid^', '@@||prio-a.invalid^', '||prio-a.invalid^$important',  # important 胜过同域例外
+    '@@||prio-b.invalid^', '||ads.prio-b.invalid^$important',                   # 例外之下的 important 子域
+    '||prio-c.invalid^$important', '@@||cdn.prio-c.invalid^',                   # 子域普通例外不放行 important 父域
+    '||prio-d.invalid^', '@@||prio-d.invalid^$important', '||x.prio-d.invalid^$important',  # important 例外最优先
+]
+PRIORITY_QUERIES = [
+    'prio-a.invalid', 'www.prio-a.invalid', 'prio-b.invalid', 'ads.prio-b.invalid', 'x.ads.prio-b.invalid',
+    'prio-c.invalid', 'cdn.prio-c.invalid', 'prio-d.invalid', 'x.prio-d.invalid',
+]
+
+
+def corpus_domain(rng: random.Random, registrables: List[str]) -> str:
+    """生成域名：大量子域共享少量可注册域名，贴近真实规则分布"""
+    base = rng.choice(registrables)
+    depth = rng.choices((0, 1, 2), weights=(3, 5, 2))[0]
+    labels = [f"{rng.choice(AD_WORDS)}{rng.randrange(1000) if rng.random() < 0.5 else ''}"
+              for _ in range(depth)]
+    return '.'.join(labels + [base])
+
+
+def generate_corpus(total_rules: int, out_dir: Path, seed: int = SEED) -> Path:
+    """确定性生成AdGuard/Hosts混合语料（拦截源 + 白名单源）"""
+    marker = out_dir / '.complete'
+    if marker.exists():
+        return out_dir
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True)
+
+    rng = random.Random(seed + total_rules)
+    registrables = [f"{rng.choice(AD_WORDS)}{rng.randrange(100000)}.{rng.choice(AD_TLDS)}"
+                    for _ in range(max(1000, total_rules // 20))]
+    shapes = [shape for _, shape in RULE_SHAPES]
+    weights = list(accumulate(weight for weight, _ in RULE_SHAPES))
+
+    block_total = total_rules * 9 // 10
+    allow_total = total_rules - block_total
+    recent: List[str] = []  # 上游互为镜像: 约30%规则在多个源中重复出现
+
+    def write_source(path: Path, count: int, allow: bool):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[Adblock Plus 2.0]\n! Title: synthetic corpus\n')
+            for _ in range(count):
+                if recent and rng.random() < 0.3:
+                    f.write(rng.choice(recent) + '\n')
+                    continue
+                if allow:
+                    rule = f"@@||{corpus_domain(rng, registrables)}^"
+                else:
+                    shape = rng.choices(shapes, cum_weights=weights)[0]
+                    rule = shape.format(d=corpus_domain(rng, registrables),
+                                        e=rng.choice(registrables).replace('.', '\\.'),
+                                        n=rng.randrange(10000))
+                if len(recent) < 50000:
+                    recent.append(rule)
+                else:
+                    recent[rng.randrange(len(recent))] = rule
+                f.write(rule + '\n')
+
+    for i in range(CORPUS_BLOCK_SOURCES):
+        write_source(out_dir / f"adblock{i + 2:02d}.txt", block_total // CORPUS_BLOCK_SOURCES, False)
+    recent.clear()
+    for i in range(CORPUS_ALLOW_SOURCES):
+        write_source(out_dir / f"allow{i + 2:02d}.txt", allow_total // CORPUS_ALLOW_SOURCES, True)
+    marker.touch()
+    return out_dir
+
+
+class CorpusServer:
+    """本地HTTP源服务器（在后台线程中提供语料文件）"""
+
+    def __init__(self, directory: Path):
+        handler = functools.partial(QuietHandler, directory=str(directory))
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# === 阶段基准 ===
+def load_script(name: str):
+    """按文件名导入脚本模块（兼容 filter-dns 等带连字符的文件名）"""
+    return importlib.import_module(name)
+
+
+def read_lines(path: Path) -> List[str]:
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def quiet_call(func: Callable, *args):
+    """调用脚本函数并丢弃其控制台输出"""
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def stage_download(ctx) -> Tuple[int, int]:
+    dl = load_script('dl')
+    sources = sorted(p.name for p in ctx['corpus'].glob('*.txt'))
+    block = [f"{ctx['base_url']}/{n}" for n in sources if n.startswith('adblock')]
+    allow = [f"{ctx['base_url']}/{n}" for n in sources if n.startswith('allow')]
+    shutil.rmtree(ctx['temp'], ignore_errors=True)
+    os.makedirs(ctx['temp'])
+    dl.download_rules(block, allow, temp_dir=str(ctx['temp']), last_good_dir=str(ctx['temp'].parent / "last-good"))
+    files = list(ctx['temp'].glob('*.txt'))
+    return len(files), sum(p.stat().st_size for p in files)
+
+
+def stage_merge(ctx) -> Tuple[int, int]:
+    merge = load_script('merge')
+    merge.merge_files('adblock*.txt', 'adblock.txt', temp_dir=str(ctx['temp']), output_dir=str(ctx['out']))
+    merge.merge_files('allow*.txt', 'allow.txt', temp_dir=str(ctx['temp']), output_dir=str(ctx['out']))
+    size = sum(p.stat().st_size for p in ctx['temp'].glob('*.txt'))
+    return len(read_lines(ctx['out'] / 'adblock.txt')), size
+
+
+def stage_parse_rule(ctx) -> Tuple[int, int]:
+    parse_rule = load_script('filter-dns').RuleProcessor.parse_rule
+    lines = ctx['merged']
+    for line in lines:
+        parse_rule(line)
+    return len(lines), ctx['merged_bytes']
+
+
+def stage_convert_clash(ctx) -> Tuple[int, int]:
+    convert = load_script('clash').convert_adguard_rule
+    lines = ctx['merged']
+    for line in lines:
+        convert(line)
+    return len(lines), ctx['merged_bytes']
+
+
+def stage_filter_hosts(ctx) -> Tuple[int, int]:
+    hosts = load_script('hosts')
+    hosts.filter_hosts_rules(ctx['out'] / 'adblock.txt', ctx['out'] / 'hosts.txt')
+    return len(ctx['merged']), ctx['merged_bytes']
+
+
+def stage_title(ctx) -> Tuple[int, int]:
+    title = load_script('title')
+    target = ctx['out'] / 'title.txt'
+    shutil.copyfile(ctx['out'] / 'adblock.txt', target)
+    title.process_file(target, title.get_beijing_time())
+    return len(ctx['merged']), ctx['merged_bytes']
+
+
+STAGES: List[Tuple[str, Callable]] = [
+    ('download', stage_download),
+    ('merge_files', stage_merge),
+    ('parse_rule', stage_parse_rule),
+    ('convert_adguard_rule', stage_convert_clash),
+    ('filter_hosts_rules', stage_filter_hosts),
+    ('title.process_file', stage_title),
+]
+
+
+def run_stage(func: Callable, ctx, memory: bool) -> Dict[str, float]:
+    """执行单个阶段：计时一次，可选再以tracemalloc测量峰值内存"""
+    start = time.perf_counter()
+    items, size = func(ctx)
+    elapsed = time.perf_counter() - start
+    result = {
+        'items': items,
+        'bytes': size,
+        'seconds': elapsed,
+        'items_per_sec': items / elapsed if elapsed else 0.0,
+        'mb_per_sec': size / 2**20 / elapsed if elapsed else 0.0,
+    }
+    if memory:
+        tracemalloc.start()
+        func(ctx)
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def find_regressions(results, baseline, tolerance: float) -> List[str]:
+    """与基线比较：吞吐下降或峰值内存上涨超过容差即视为回归"""
+    regressions = []
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if not base:
+                continue
+            if current['items_per_sec'] < base['items_per_sec'] * (1 - tolerance):
+                regressions.append(f"{size}/{stage}: 吞吐 {current['items_per_sec']:,.0f} "
+                                   f"< 基线 {base['items_per_sec']:,.0f}")
+            if 'peak_bytes' in current and 'peak_bytes' in base \
+                    and current['peak_bytes'] > base['peak_bytes'] * (1 + tolerance):
+                regressions.append(f"{size}/{stage}: 峰值内存 {current['peak_bytes'] / 2**20:.1f}MB "
+                                   f"> 基线 {base['peak_bytes'] / 2**20:.1f}MB")
+    return regressions
+
+
+def cmd_stages(args) -> int:
+    """stages 子命令"""
+    print("🚀 流水线阶段基准启动")
+    bench_dir = Path(args.bench_dir)
+    results: Dict[str, Dict[str, dict]] = {}
+
+    for size in args.sizes:
+        total = CORPUS_SIZES[size]
+        gen_start = time.perf_counter()
+        corpus = generate_corpus(total, bench_dir / f"corpus-v{CORPUS_VERSION}-{size}")
+        print(f"\n📚 语料 {size}: {corpus} (生成/复用耗时 {time.perf_counter() - gen_start:.1f}s)")
+
+        ctx = {'corpus': corpus, 'temp': bench_dir / f"tmp-{size}", 'out': bench_dir / f"out-{size}"}
+        ctx['out'].mkdir(parents=True, exist_ok=True)
+        results[size] = {}
+        with CorpusServer(corpus) as server:
+            ctx['base_url'] = server.base_url
+            for name, func in STAGES:
+                if args.only and name not in args.only:
+                    continue
+                if name != 'download' and not ctx['temp'].exists():
+                    stage_download(ctx)
+                if 'merged' not in ctx and name not in ('download', 'merge_files'):
+                    stage_merge(ctx)
+                if 'merged' not in ctx and (ctx['out'] / 'adblock.txt').exists():
+                    ctx['merged'] = read_lines(ctx['out'] / 'adblock.txt')
+                    ctx['merged_bytes'] = (ctx['out'] / 'adblock.txt').stat().st_size
+                stats = run_stage(func, ctx, not args.no_memory)
+                results[size][name] = stats
+                if name == 'merge_files':
+                    ctx['merged'] = read_lines(ctx['out'] / 'adblock.txt')
+                    ctx['merged_bytes'] = (ctx['out'] / 'adblock.txt').stat().st_size
+                peak = f"{stats['peak_bytes'] / 2**20:>8.1f}MB" if 'peak_bytes' in stats else ''
+                print(f"  ⏱️ {name:<22}{stats['seconds']:>8.2f}s{stats['items_per_sec']:>14,.0f}/s"
+                      f"{stats['mb_per_sec']:>8.1f}MB/s{peak}")
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'results': results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已写入: {output}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(output, baseline_path)
+        print(f"📌 已保存为基线: {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"⚠️ 基线不存在，跳过回归检测: {baseline_path}")
+        return 0
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f).get('results', {})
+    regressions = find_regressions(results, baseline, args.tolerance)
+    if regressions:
+        print("❌ 检测到性能回归:")
+        for line in regressions:
+            print(f"    {line}")
+        return 1
+    print("✅ 无性能回归")
+    return 0
+
+
+# === 分词器对照 ===
+# 旧正则链（分词器引入前各脚本的解析方式），仅用于吞吐与等价性对照
+LEGACY_FULL_SYNTAX = re.compile(
+    r'^(\|\|)?[\w.-]+\^?(\$[\w,=-]+)?$|'
+    r'^@@(\|\|)?[\w.-]+\^?(\$[\w,=-]+)?$|'
+    r'^/[\w\W]+/$|^@@/[\w\W]+/$|'
+    r'^##.+$|^@@##.+$|'
+    r'^[\w.,~*-]+#@?(#|\?#|\$#|\$\?#|%#).+$|'
+    r'^(@@)?\|\|[\w.-]+/\S*$|'
+    r'^\d+\.\d+\.\d+\.\d+\s+[\w.-]+$|'
+    r'^\|\|[\w.-]+\^\$dnstype=\w+$|'
+    r'^@@\|\|[\w.-]+\^\$dnstype=\w+$|'
+    r'^\|\|[\w.-]+\^\$dnsrewrite=\w+$|'
+    r'^@@\|\|[\w.-]+\^\$dnsrewrite=NOERROR$'
+)
+LEGACY_ADG_SPECIAL = re.compile(r'^!|^\$|^@@|^/.*/$|^\|\|.*\^|\*\.|^\|\|.*/|^\|http?://|^##|^#\?#|^\?|\|\|.*\^\$')
+LEGACY_ADG_DOMAIN = re.compile(r'^\|\|([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\^|\$)|^([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\$|'
+                               r'^\*\.([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\^|\$)')
+LEGACY_ADG_BARE = re.compile(r'^(?:\|\|)?([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\^?$')   # 无修饰符 ||x^ / x（语义去重后同样产出Hosts条目）
+LEGACY_HOSTS_RULE = re.compile(r'^\s*(\d+\.\d+\.\d+\.\d+)\s+([^\s#]+)')
+LEGACY_COMMENT_RULE = re.compile(r'^[!#]|^\[Adblock')
+LEGACY_CLASH_META = re.compile(r'^\[.*\]$')
+LEGACY_CLASH_DOMAIN = re.compile(r'^[a-zA-Z0-9.-]+$')
+LEGACY_CLASH_WILDCARD = re.compile(r'^\*\.([a-zA-Z0-9.-]+)$')
+LEGACY_CLASH_ADGUARD = re.compile(r'^\|\|([a-zA-Z0-9.-]+)\^?$')
+LEGACY_HOSTS_PATTERN = re.compile(
+    r'^(\|\|([\w.-]+)\^($|[\w,=-]*))|'
+    r'^\|\|([\w.-]+)\^\$dnsrewrite=(\d+\.\d+\.\d+\.\d+)|'
+    r'^(\d+\.\d+\.\d+\.\d+)\s+([\w.-]+)$'
+)
+
+
+def legacy_accept(rule: str) -> bool:
+    return bool(LEGACY_FULL_SYNTAX.match(rule))
+
+
+def legacy_parse_rule(rule: str):
+    if LEGACY_COMMENT_RULE.match(rule) or rule.startswith('@@'):
+        return None, None
+    if match := LEGACY_ADG_BARE.match(rule):
+        return rule, [f"0.0.0.0 {match.group(1).lower()}"]
+    if LEGACY_ADG_SPECIAL.match(rule):
+        return rule, None
+    if match := LEGACY_ADG_DOMAIN.match(rule):
+        return rule, [f"0.0.0.0 {next((g for g in match.groups() if g), '').lower()}"]
+    if match := LEGACY_HOSTS_RULE.match(rule):
+        domains = [d.lower() for d in match.group(2).split()]
+        return f"{match.group(1)} {' '.join(domains)}", [f"{match.group(1)} {d}" for d in domains]
+    return rule, None
+
+
+def legacy_convert_clash(rule: str):
+    rule = rule.strip()
+    if not rule:
+        return None
+    if rule[0] in '!#':
+        return f"# {rule[1:].strip()}"
+    if LEGACY_CLASH_META.match(rule):
+        return None
+    body, _, options = rule.partition('$')
+    if options:
+        unsupported = {'dnstype', 'dnsrewrite', 'cname', 'important', 'redirect', 'app', 'extension', 'document'}
+        if any(opt.strip().split('=')[0] in unsupported for opt in options.split(',')):
+            return None
+    action = "DIRECT" if body.startswith('@@') else "REJECT"
+    body = body[2:] if body.startswith('@@') else body
+    if match := LEGACY_CLASH_WILDCARD.match(body):
+        return f"DOMAIN-SUFFIX,{match.group(1)},{action}"
+    if match := LEGACY_CLASH_ADGUARD.match(body):
+        return f"DOMAIN-SUFFIX,{match.group(1)},{action}"
+    if LEGACY_CLASH_DOMAIN.match(body):
+        return f"DOMAIN-SUFFIX,{body},{action}" if '.' in body else f"DOMAIN,{body},{action}"
+    return None
+
+
+def legacy_hosts_entry(rule: str):
+    match = LEGACY_HOSTS_PATTERN.match(rule)
+    if not match:
+        return None
+    if match.group(2):
+        return '0.0.0.0', match.group(2)
+    if match.group(4):
+        return match.group(5), match.group(4)
+    return match.group(6), match.group(7)
+
+
+def tokenizer_consumers():
+    """(名称, 旧正则链实现, 分词器实现, 是否仅DNS族输入)"""
+    merge = load_script('merge')
+    dns = load_script('filter-dns')
+    clash = load_script('clash')
+    hosts = load_script('hosts')
+    return [
+        ('merge.accept', legacy_accept, merge.is_supported, False),
+        ('dns.parse_rule', legacy_parse_rule, dns.RuleProcessor.parse_rule, True),
+        ('clash.convert', legacy_convert_clash, clash.convert_adguard_rule, False),
+        ('hosts.entry', legacy_hosts_entry, hosts.to_hosts_entry, False),
+    ]
+
+
+def canonical_mismatch(line: str) -> bool:
+    """rules.canonical_form 命中的规则是否与分词/规范化结果不一致（类型、例外、主机名、锚点后缀）"""
+    from domains import normalize_domain
+    from rules import KIND_DOMAIN, KIND_HOSTS, KIND_PLAIN, KIND_WILDCARD, canonical_form, tokenize
+    match = canonical_form(line)
+    if match is None:
+        return False
+    kind, exception, start, end, pattern_end, _, _ = tokenize(line)
+    host = line[start:end]
+    if match[1] is not None:
+        return kind != KIND_HOSTS or end != len(line) or host != match[2] or normalize_domain(host) != host
+    expected = {'': KIND_PLAIN, '||': KIND_DOMAIN, '*.': KIND_WILDCARD}[match[4]]
+    return (kind != expected or exception != bool(match[3]) or host != match[5]
+            or normalize_domain(host) != host or line[end:pattern_end] != match[6])
+
+
+def time_calls(funcs: List[Callable], lines: List[str], repeat: int, reset: Optional[Callable] = None) -> float:
+    """多次完整遍历取最短耗时（reset 在每次遍历前调用，用于清空缓存）"""
+    best = float('inf')
+    for _ in range(repeat):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        for func in funcs:
+            for line in lines:
+                func(line)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def cmd_tokenizer(args) -> int:
+    """tokenizer 子命令"""
+    print("🚀 规则分词器对照基准")
+    from rules import FAMILY_DNS, classify_rule, clear_caches, tokenize
+    corpus = generate_corpus(CORPUS_SIZES[args.size], Path(args.bench_dir) / f"corpus-v{CORPUS_VERSION}-{args.size}")
+    lines = []
+    for path in sorted(corpus.glob('*.txt')):
+        lines.extend(read_lines(path))
+    dns_lines = [line for line in lines if classify_rule(line) == FAMILY_DNS]
+    print(f"📚 语料 {args.size}: {len(lines):,} 行 (DNS族 {len(dns_lines):,})")
+
+    cold = time_calls([tokenize], lines, args.repeat, clear_caches)
+    warm = time_calls([tokenize], lines, args.repeat)
+    print(f"  ⏱️ rules.tokenize 冷 {len(lines) / cold:>12,.0f}/s | 缓存命中 {len(lines) / warm:>12,.0f}/s")
+    # 快速通道与分词路径的一致性（语料外补充边界形态：超长标签/域名、通配、空修饰符、制表符Hosts）
+    edge_cases = ['a' * 64 + '.com', '||' + 'a.' * 126 + 'com^', '*.example.com^', '@@*.example.com$important',
+                  'example.com$', '0.0.0.0\texample.com', '||example.com^|', '|example.com^', 'Example.com']
+    mismatches = [line for line in lines + edge_cases if canonical_mismatch(line)]
+    print(f"  {'✅' if not mismatches else '❌'} rules.canonical_form 与分词路径不一致 {len(mismatches):,} 行")
+    for line in mismatches[:args.show]:
+        print(f"      {line!r}")
+
+    # 单个使用方（冷缓存）：独立运行单个脚本时的成本
+    mismatched = 0
+    consumers = tokenizer_consumers()
+    print(f"\n{'使用方(冷缓存)':<18}{'旧正则链':>14}{'分词器':>14}{'加速比':>8}{'结果差异':>10}")
+    for name, legacy, current, dns_only in consumers:
+        subset = dns_lines if dns_only else lines
+        legacy_time = time_calls([legacy], subset, args.repeat)
+        current_time = time_calls([current], subset, args.repeat, clear_caches)
+        diffs = [line for line in subset if legacy(line) != current(line)]
+        mismatched += len(diffs)
+        print(f"{name:<18}{len(subset) / legacy_time:>12,.0f}/s{len(subset) / current_time:>12,.0f}/s"
+              f"{legacy_time / current_time:>7.2f}x{len(diffs):>10,}")
+        for line in diffs[:args.show]:
+            print(f"      {line!r}: {legacy(line)!r} → {current(line)!r}")
+
+    # 完整链路：同一进程内各阶段共享分词结果（流水线编排器的运行方式）
+    legacy_chain = time_calls([legacy for _, legacy, _, _ in consumers], lines, args.repeat)
+    current_chain = time_calls([current for _, _, current, _ in consumers], lines, args.repeat, clear_caches)
+    print(f"{'完整链路':<18}{len(lines) / legacy_chain:>12,.0f}/s{len(lines) / current_chain:>12,.0f}/s"
+          f"{legacy_chain / current_chain:>7.2f}x")
+
+    if mismatched or mismatches:
+        print(f"⚠️ 共 {mismatched + len(mismatches):,} 行结果不一致（见上方示例）")
+        return 1
+    print("✅ 分词器结果与旧正则链一致")
+    return 0
+
+
+
+# === DNS验证 ===
+class StubDNSServer:
+    """
+    本地UDP桩DNS服务器，按标签前缀应答，可注入时延/丢包/SERVFAIL
+    • 首标签 ok → A | 首标签 nodata / 可注册域本身 → 无记录 | 父域标签 wild → 泛解析(任意名称 A)
+    • 任一标签 nx 或其余名称 → NXDOMAIN
+    """
+
+    def __init__(self, delay: float, loss: float, servfail: float, seed: int):
+        self.delay = delay
+        self.loss = loss
+        self.servfail = servfail
+        self.rng = random.Random(seed)
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.sock.getsockname()[1]}"
+
+    def _answer(self, data: bytes) -> bytes:
+        qid = struct.unpack('>H', data[:2])[0]
+        pos, labels = 12, []
+        while data[pos]:
+            labels.append(data[pos + 1:pos + 1 + data[pos]])
+            pos += 1 + data[pos]
+        question = data[12:pos + 5]
+        qtype = struct.unpack('>H', data[pos + 1:pos + 3])[0]
+        if self.rng.random() < self.servfail:
+            return struct.pack('>HHHHHH', qid, 0x8182, 1, 0, 0, 0) + question
+        wildcard = any(label.startswith(b'wild') for label in labels[1:])
+        exists = len(labels) <= 2 or wildcard or labels[0].startswith((b'ok', b'nodata'))
+        if not exists or any(label.startswith(b'nx') for label in labels):
+            return struct.pack('>HHHHHH', qid, 0x8183, 1, 0, 0, 0) + question
+        if labels[0].startswith(b'nodata') or len(labels) <= 2 or qtype != 1:
+            return struct.pack('>HHHHHH', qid, 0x8180, 1, 0, 0, 0) + question
+        answer = struct.pack('>HHHIH', 0xc00c, 1, 1, 60, 4) + bytes([192, 0, 2, 1])
+        return struct.pack('>HHHHHH', qid, 0x8180, 1, 1, 0, 0) + question + answer
+
+    def _serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except OSError:
+                return
+            self.queries += 1
+            if self.rng.random() < self.loss:
+                continue
+            response = self._answer(data)
+            delay = self.delay * (0.5 + self.rng.random())
+            threading.Timer(delay, self._send, (response, addr)).start()
+
+    def _send(self, response: bytes, addr):
+        try:
+            self.sock.sendto(response, addr)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.sock.close()
+
+
+def stub_domains() -> Dict[str, bool]:
+    """桩域名 → 是否存在（含不存在的可注册域下的成批子域）"""
+    domains = {f"{prefix}{i}.bench.test": prefix == 'ok'
+               for prefix, count in STUB_DOMAINS.items() for i in range(count)}
+    zones, hosts = STUB_DEAD_ZONES
+    domains.update({f"ads{i}.nxzone{j}.test": False for j in range(zones) for i in range(hosts)})
+    zones, hosts = STUB_WILDCARD_ZONES
+    domains.update({f"r{i}.wildzone{j}.test": True for j in range(zones) for i in range(hosts)})
+    return domains
+
+
+def legacy_validator(dns, servers: List[str]):
+    """
+    旧验证器: 轮换全部上游、每次只查一个，任何错误（含超时/SERVFAIL）均判为失效，不重试
+    • 查询经解析器池的各上游发出（同一令牌桶限速），与解析器池在相同 RATE_LIMIT 下对比
+    """
+    from itertools import count
+
+    class LegacyValidator(dns.DNSValidator):
+        async def setup(self):
+            await super().setup()
+            self.turn = count()
+
+        async def probe_zones(self, domains, semaphore):
+            pass
+
+        async def probe_wildcards(self, domains, semaphore):
+            pass
+
+        async def check_domain(self, domain: str) -> Optional[bool]:
+            if domain in self.valid_cache:
+                return True
+            if domain in self.invalid_cache:
+                return False
+            upstreams = self.pool.upstreams
+            for qtype in ('A', 'CNAME'):
+                upstream = upstreams[next(self.turn) % len(upstreams)]
+                if await self.pool._query_upstream(upstream, domain, qtype) == dns.RESULT_FOUND:
+                    self.valid_cache.add(domain)
+                    return True
+            self.invalid_cache.add(domain)
+            return False
+
+    return LegacyValidator(servers)
+
+
+async def run_validator(validator, domains: Dict[str, bool], rate: float,
+                        hedge_percentile: Optional[float]) -> dict:
+    """运行一轮验证，返回耗时、误删、尾延迟等统计"""
+    await validator.setup()
+    if validator.pool:
+        validator.pool.hedge_percentile = hedge_percentile
+        for upstream in validator.pool.upstreams:
+            upstream.bucket.rate = rate
+    latencies = []
+    check_domain = validator.check_domain
+
+    async def timed(domain: str):
+        start = time.perf_counter()
+        try:
+            return await check_domain(domain)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    validator.check_domain = timed
+    start = time.perf_counter()
+    try:
+        invalid = await validator.validate(domains)
+    finally:
+        await validator.close()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'seconds': elapsed,
+        'wrong_drops': sum(1 for d in invalid if domains[d]),
+        'missed': sum(1 for d, exists in domains.items() if not exists and d not in invalid),
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'retried': validator.retried,
+        'kept': len(validator.unresolved),
+        'queries': sum(u['queries'] for u in validator.pool.report()) if validator.pool else None,
+        'zone_probes': validator.zone_probes,
+        'zone_skipped': validator.zone_skipped,
+        'wildcard_probes': validator.wildcard_probes,
+        'wildcard_skipped': validator.wildcard_skipped,
+        'pool': validator.pool.report() if validator.pool else [],
+    }
+
+
+def cmd_dns(args) -> int:
+    """dns 子命令"""
+    import asyncio
+    print("🚀 DNS验证基准（本地桩DNS服务器）")
+    dns = load_script('filter-dns')
+    dns.TIMEOUT = args.timeout
+    dns.RETRY_BACKOFF = args.retry_backoff
+    domains = stub_domains()
+    specs = [tuple(float(x) for x in spec.split(':')) for spec in args.servers]
+    servers = [StubDNSServer(delay / 1000, loss, servfail, SEED + i)
+               for i, (delay, loss, servfail) in enumerate(specs)]
+    for server, (delay, loss, servfail) in zip(servers, specs):
+        server.__enter__()
+        print(f"  🧪 {server.address}: 时延 {delay:.0f}ms | 丢包 {loss:.0%} | SERVFAIL {servfail:.0%}")
+    print(f"📚 域名 {len(domains)} 个（存在 {sum(domains.values())}）| 超时 {args.timeout}s | "
+          f"限速 {args.rate:.0f} 查询/秒/上游（各模式相同）")
+
+    addresses = [server.address for server in servers]
+    modes = [
+        ('旧验证器', lambda: legacy_validator(dns, addresses), None),
+        ('解析器池(无对冲)', lambda: dns.DNSValidator(addresses), None),
+        ('解析器池(对冲)', lambda: dns.DNSValidator(addresses), args.hedge_percentile),
+    ]
+    results = {}
+    try:
+        print(f"\n{'模式':<18}{'耗时':>8}{'误删':>6}{'漏判':>6}{'P50':>9}{'P99':>9}{'重试':>6}{'保留':>6}"
+              f"{'查询':>7}{'探测':>6}{'免查':>6}{'泛探测':>6}{'泛免查':>6}")
+        for name, factory, percentile in modes:
+            stats = results[name] = asyncio.run(run_validator(factory(), domains, args.rate, percentile))
+            print(f"{name:<18}{stats['seconds']:>7.2f}s{stats['wrong_drops']:>6}{stats['missed']:>6}"
+                  f"{stats['p50_ms']:>7.0f}ms{stats['p99_ms']:>7.0f}ms{stats['retried']:>6}{stats['kept']:>6}"
+                  f"{stats['queries'] if stats['queries'] is not None else '-':>7}"
+                  f"{stats['zone_probes']:>6}{stats['zone_skipped']:>6}"
+                  f"{stats['wildcard_probes']:>6}{stats['wildcard_skipped']:>6}")
+            for upstream in stats['pool']:
+                print(f"      🌐 {upstream['server']:<18} 查询 {upstream['queries']:>5} | 失败 {upstream['failures']:>4} | "
+                      f"EWMA {upstream['latency_ms']:>6.1f}ms | 错误率 {upstream['error_rate']:>5.1%} | "
+                      f"对冲 {upstream['hedges']} (胜出 {upstream['hedge_wins']})")
+    finally:
+        for server in servers:
+            server.__exit__(None, None, None)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    legacy = results['旧验证器']
+    print(f"\n📉 旧验证器: 暂时失败直接判为失效，误删 {legacy['wrong_drops']} 个存在的域名")
+    for name, stats in results.items():
+        if name != '旧验证器':
+            print(f"⏱️ {name}: 耗时为旧验证器的 {stats['seconds'] / legacy['seconds']:.2f} 倍（同一限速）")
+    wrong = [name for name, stats in results.items() if stats['wrong_drops'] and name != '旧验证器']
+    if wrong:
+        print(f"❌ 暂时失败被误判为失效: {', '.join(wrong)}")
+        return 1
+    print("✅ 解析器池无误删（暂时失败均进入重试队列）")
+    return 0
+
+
+def run_filter_dns(workspace: Path, *args: str) -> subprocess.CompletedProcess:
+    """以独立进程运行 filter-dns.py（工作区为当前目录）"""
+    return subprocess.run([sys.executable, str(SCRIPT_DIR / 'filter-dns.py'), *args],
+                          cwd=workspace, capture_output=True, text=True,
+                          env={k: v for k, v in os.environ.items() if k != 'GITHUB_WORKSPACE'})
+
+
+def cmd_shards(args) -> int:
+    """shards 子命令"""
+    print(f"🚀 分片DNS验证基准（{args.shards} 个进程 + 本地桩DNS服务器）")
+    domains = stub_domains()
+    root = Path(args.bench_dir) / "dns-shards"
+    shutil.rmtree(root, ignore_errors=True)
+    single, sharded = root / "single", root / "sharded"
+    rules = [f"||{domain}^" for domain in domains] + ['##.ad-banner', '||ads.bench.test/pixel.gif']
+    for workspace in (single, sharded):
+        workspace.mkdir(parents=True)
+        (workspace / "adblock.txt").write_text("\n".join(rules) + "\n", encoding='utf-8')
+
+    specs = [tuple(float(x) for x in spec.split(':')) for spec in args.servers]
+    servers = [StubDNSServer(delay / 1000, loss, servfail, SEED + i)
+               for i, (delay, loss, servfail) in enumerate(specs)]
+    for server in servers:
+        server.__enter__()
+    addresses = ['--servers', *(server.address for server in servers)]
+    failures = []
+    try:
+        start = time.perf_counter()
+        proc = run_filter_dns(single, *addresses)
+        single_time = time.perf_counter() - start
+        if proc.returncode:
+            failures.append(f"单进程运行失败: {proc.stdout[-500:]}")
+        print(f"  ⏱️ 单进程: {single_time:.2f}s")
+
+        start = time.perf_counter()
+        procs = [subprocess.Popen([sys.executable, str(SCRIPT_DIR / 'filter-dns.py'), '--shard', f"{i}/{args.shards}",
+                                   *addresses], cwd=sharded, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for i in range(args.shards)]
+        codes = [p.wait() for p in procs]
+        shard_time = time.perf_counter() - start
+        if any(codes):
+            failures.append(f"分片进程退出码: {codes}")
+        print(f"  ⏱️ {args.shards} 个分片并行: {shard_time:.2f}s")
+
+        # 模拟一个分片失败: 合并应拒绝并提示重跑，重跑后合并成功
+        victim = sharded / "tmp" / "dns-shards" / f"shard-{0:03d}-of-{args.shards:03d}.tsv.gz"
+        victim.unlink()
+        proc = run_filter_dns(sharded, '--merge-shards', str(args.shards))
+        rerun_hint = f"--shard 0/{args.shards}" in proc.stdout
+        print(f"  🧩 缺失分片时合并: 退出码 {proc.returncode} | 提示重跑: {'是' if rerun_hint else '否'}")
+        if proc.returncode == 0 or not rerun_hint:
+            failures.append("缺失分片时合并未被拒绝")
+        run_filter_dns(sharded, '--shard', f"0/{args.shards}", *addresses)
+        start = time.perf_counter()
+        proc = run_filter_dns(sharded, '--merge-shards', str(args.shards))
+        print(f"  ⏱️ 重跑分片 0 后合并: {time.perf_counter() - start:.2f}s (退出码 {proc.returncode})")
+        if proc.returncode:
+            failures.append(f"合并失败: {proc.stdout[-500:]}")
+    finally:
+        for server in servers:
+            server.__exit__(None, None, None)
+
+    for filename in ('dns.txt', 'hosts.txt', 'network.txt', 'cosmetic.txt'):
+        a, b = single / filename, sharded / filename
+        same = a.exists() and b.exists() and a.read_bytes() == b.read_bytes()
+        lines = len(read_lines(b)) if b.exists() else 0
+        print(f"  {'✅' if same else '❌'} {filename:<14}{lines:>6} 行 | 与单进程结果{'一致' if same else '不一致'}")
+        if not same:
+            failures.append(f"{filename} 与单进程结果不一致")
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ 分片验证合并结果与单进程一致")
+    return 0
+
+# === 解析器原生格式 ===
+def cmd_emit(args) -> int:
+    """emit 子命令: 合成 dns.txt → 单遍输出原生格式 → 解析器替身逐一加载并与 dns.txt 判定对照"""
+    emit = load_script('emit')
+    hosts = load_script('hosts')
+    bench_dir = Path(args.bench_dir)
+    corpus = generate_corpus(CORPUS_SIZES[args.size], bench_dir / f"corpus-v{CORPUS_VERSION}-{args.size}")
+    workspace = bench_dir / f"emit-{args.size}"
+    shutil.rmtree(workspace, ignore_errors=True)
+    workspace.mkdir(parents=True)
+    rules = dict.fromkeys(line for path in sorted(corpus.glob('adblock*.txt')) for line in read_lines(path))
+    rules.update(dict.fromkeys(PRIORITY_RULES))
+    (workspace / emit.INPUT_FILE).write_text("\n".join(rules) + "\n", encoding='utf-8')
+    hosts.filter_hosts_rules(workspace / emit.INPUT_FILE, workspace / "hosts.txt")
+    print(f"🚀 解析器原生格式基准（{len(rules)} 条 dns.txt 规则）")
+
+    start = time.perf_counter()
+    written = emit.generate(workspace=str(workspace))
+    print(f"  ⏱️ 单遍输出 {len(written)} 种格式: {time.perf_counter() - start:.2f}s")
+
+    matchers = {}
+    print(f"  {'文件':<15}{'条目':>9}{'大小KB':>9}{'加载ms':>9}{'跳过':>7}")
+    for filename in [emit.INPUT_FILE, 'hosts.txt', *written]:
+        path = workspace / filename
+        start = time.perf_counter()
+        matcher = load_matcher(path)
+        elapsed = time.perf_counter() - start
+        matchers[filename] = matcher
+        print(f"  {filename:<15}{matcher.rule_count:>9}{path.stat().st_size / 1024:>9.0f}"
+              f"{elapsed * 1000:>9.1f}{matcher.skipped:>7}")
+
+    # 判定对照: 以 dns.txt 去掉正则后的匹配器为准；无精确语义的格式再去掉精确条目
+    reference = matchers[emit.INPUT_FILE]
+    reference.regexes = []
+    suffix_only = load_matcher(workspace / emit.INPUT_FILE)
+    suffix_only.regexes, suffix_only.exact = [], set()
+    queries = synthetic_queries([reference], args.queries, args.queries // 4, DEFAULT_BLOCKED_SHARE) + PRIORITY_QUERIES
+    failures = []
+    for filename in written:
+        native = next(e for e in emit.EMITTERS.values() if e.filename == filename)
+        expected = reference if native.exact or emit.EXACT_AS_SUFFIX else suffix_only
+        mismatches = sum(1 for q in queries if matchers[filename].is_blocked(q) != expected.is_blocked(q))
+        print(f"  {'✅' if not mismatches else '❌'} {filename:<15}判定不一致: {mismatches}/{len(queries)}")
+        if mismatches:
+            failures.append(f"{filename} 与 dns.txt 判定不一致 {mismatches} 次")
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ 原生格式与 dns.txt 判定一致（正则与无精确语义格式的精确条目除外）")
+    return 0
+
+# === 紧凑二进制产物 ===
+def cmd_compact(args) -> int:
+    """compact 子命令: 合成 dns.txt → dns.bin | mmap 加载器 vs 文本匹配器"""
+    compact = load_script('compact')
+    hosts = load_script('hosts')
+    bench_dir = Path(args.bench_dir)
+    corpus = generate_corpus(CORPUS_SIZES[args.size], bench_dir / f"corpus-v{CORPUS_VERSION}-{args.size}")
+    workspace = bench_dir / f"compact-{args.size}"
+    shutil.rmtree(workspace, ignore_errors=True)
+    workspace.mkdir(parents=True)
+    rules = dict.fromkeys(line for path in sorted(corpus.glob('adblock*.txt')) for line in read_lines(path))
+    rules.update(dict.fromkeys(PRIORITY_RULES))
+    (workspace / compact.INPUT_FILE).write_text("\n".join(rules) + "\n", encoding='utf-8')
+    hosts.filter_hosts_rules(workspace / compact.INPUT_FILE, workspace / "hosts.txt")
+    print(f"🚀 紧凑二进制产物基准（{len(rules)} 条 dns.txt 规则）")
+
+    start = time.perf_counter()
+    stats = compact.generate(workspace=str(workspace))
+    print(f"  ⏱️ 生成: {time.perf_counter() - start:.2f}s")
+
+    rows = []
+    for filename in ('hosts.txt', compact.INPUT_FILE, compact.OUTPUT_FILE):
+        path = workspace / filename
+        tracemalloc.start()
+        start = time.perf_counter()
+        matcher = compact.CompactIndex(path) if filename == compact.OUTPUT_FILE else load_matcher(path)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        rows.append((filename, matcher, path.stat().st_size, elapsed, memory))
+
+    reference = rows[1][1]
+    reference.regexes = []
+    queries = synthetic_queries([reference], args.queries, args.queries // 4, DEFAULT_BLOCKED_SHARE) + PRIORITY_QUERIES
+    print(f"  {'文件':<11}{'大小KB':>9}{'打开ms':>9}{'内存KB':>9}{'查询/秒':>12}")
+    for filename, matcher, size, elapsed, memory in rows:
+        result = replay(matcher, queries[:args.queries])
+        print(f"  {filename:<11}{size / 1024:>9.0f}{elapsed * 1000:>9.1f}{memory / 1024:>9.0f}"
+              f"{result['lookups_per_sec']:>12,.0f}")
+
+    index = rows[2][1]
+    mismatches = sum(1 for q in queries if index.is_blocked(q) != reference.is_blocked(q))
+    index.close()
+    print(f"  🌸 布隆误判率: 目标 {compact.BLOOM_FPR:.2%} | 理论 {stats['expected_fpr']:.3%} | 实测 {stats['measured_fpr']:.3%}")
+    print(f"  {'✅' if not mismatches else '❌'} 与 dns.txt 判定不一致: {mismatches}/{len(queries)}（不含正则规则）")
+    return 1 if mismatches else 0
+
+# === 规则老化存储 ===
+def cmd_aging(args) -> int:
+    """aging 子命令: 同一工作区连续运行（进程内），以改写存储时间戳模拟时间流逝"""
+    import asyncio
+    dns = load_script('filter-dns')
+    aging = sys.modules['aging']
+    print("🚀 规则老化存储基准（本地桩DNS服务器）")
+    domains = stub_domains()
+    workspace = Path(args.bench_dir) / "aging"
+    shutil.rmtree(workspace, ignore_errors=True)
+    workspace.mkdir(parents=True)
+    db = workspace / aging.AGING_DB
+    rules = [f"||{domain}^" for domain in domains]
+    day = 86400
+
+    specs = [tuple(float(x) for x in spec.split(':')) for spec in args.servers]
+    servers = [StubDNSServer(delay / 1000, loss, servfail, SEED + i)
+               for i, (delay, loss, servfail) in enumerate(specs)]
+    default_servers, default_grace = dns.DNSValidator.DNS_SERVERS, aging.UNRESOLVABLE_GRACE
+    dns.DNSValidator.DNS_SERVERS = [server.address for server in servers]
+
+    def run(lines: List[str]):
+        """运行一次，返回 (上游查询数, 耗时, 输出规则, 老化存储计数)"""
+        before = sum(server.queries for server in servers)
+        processor = dns.BlacklistProcessor()
+        start = time.perf_counter()
+        asyncio.run(processor.process(lines, workspace))
+        elapsed = time.perf_counter() - start
+        return sum(server.queries for server in servers) - before, elapsed, processor.adguard_rules, processor.aging
+
+    def shift(sql: str, *params):
+        conn = sqlite3.connect(db)
+        with conn:
+            conn.execute(sql, params)
+        conn.close()
+
+    import sqlite3
+    failures = []
+    for server in servers:
+        server.__enter__()
+    try:
+        cold, cold_time, baseline, _ = run(rules)
+        warm, warm_time, output, stats = run(rules)
+        print(f"  🧊 首次运行: 查询 {cold:>6} | {cold_time:.2f}s | 输出 {len(baseline)} 条")
+        print(f"  🔥 再次运行: 查询 {warm:>6} | {warm_time:.2f}s | 复用结论 {stats.reused_valid + stats.reused_invalid}")
+        if output != baseline:
+            failures.append("复用结论后的输出与首次运行不一致")
+        if warm >= cold:
+            failures.append("再次运行未减少上游查询")
+
+        # 时间流逝 4 天: 有效结论按域名哈希错开到期（过期泛解析区内的域名随区复验），失效结论全部复查
+        now = int(time.time())
+        shift("UPDATE rules SET last_validated = last_validated - ?1, last_checked = last_checked - ?1", 4 * day)
+        shift("UPDATE zones SET checked = checked - ?", 4 * day)
+        store = aging.AgingStore(db, readonly=True)
+        store.open()
+        _, stale = store.wildcard_zones(now)
+        store.close()
+        conn = sqlite3.connect(db)
+        expected = {domain for domain, validated in conn.execute(
+            "SELECT domain, last_validated FROM rules WHERE failing_since IS NULL")
+            if now - validated >= aging.revalidate_after(domain) or dns.DNSValidator.in_zones(domain, stale)}
+        total_valid = conn.execute("SELECT COUNT(*) FROM rules WHERE failing_since IS NULL").fetchone()[0]
+        conn.close()
+        queries, _, output, _ = run(rules)
+        conn = sqlite3.connect(db)
+        revalidated = {domain for domain, in conn.execute(
+            "SELECT domain FROM rules WHERE failing_since IS NULL AND last_validated >= ?", (now,))}
+        conn.close()
+        print(f"  📆 4天后: 到期复验 {len(revalidated)}/{total_valid} 个有效域名（按哈希错开，预期 {len(expected)}）| 查询 {queries}")
+        if revalidated != expected:
+            failures.append("到期复验的域名与复验周期不符")
+        if output != baseline:
+            failures.append("复验后的输出与首次运行不一致")
+
+        # 失效宽限期: 连续失效未超过宽限期的规则保留
+        aging.UNRESOLVABLE_GRACE = 7 * day
+        dead = sorted(domain for domain, exists in domains.items() if not exists)
+        recent, old = dead[:len(dead) // 2], dead[len(dead) // 2:]
+        shift("UPDATE rules SET last_checked = last_checked - ?", 2 * day)
+        shift(f"UPDATE rules SET failing_since = ? WHERE domain IN ({','.join('?' * len(recent))})", now - day, *recent)
+        shift(f"UPDATE rules SET failing_since = ? WHERE domain IN ({','.join('?' * len(old))})", now - 8 * day, *old)
+        _, _, output, stats = run(rules)
+        kept = {f"||{domain}^" for domain in recent} & output
+        dropped = {f"||{domain}^" for domain in old} & output
+        print(f"  ⏳ 宽限期 7 天: 失效 1 天的规则保留 {len(kept)}/{len(recent)} | 失效已久的规则残留 {len(dropped)} | "
+              f"统计 {stats.graced}")
+        if len(kept) != len(recent) or dropped:
+            failures.append("失效宽限期未按预期保留/剔除规则")
+        aging.UNRESOLVABLE_GRACE = default_grace
+
+        # 上游消失超过保留期: 记录被清除
+        shift("UPDATE rules SET last_seen = last_seen - ?", 31 * day)
+        remaining = rules[:len(rules) // 2]
+        _, _, _, stats = run(remaining)
+        conn = sqlite3.connect(db)
+        rows = conn.execute("SELECT COUNT(*) FROM rules").fetchone()[0]
+        conn.close()
+        print(f"  🧹 上游移除 {len(rules) - len(remaining)} 条 31 天后: 清除 {stats.pruned} 条记录 | 剩余 {rows}")
+        if stats.pruned != len(rules) - len(remaining) or rows != len(remaining):
+            failures.append("过期记录清除数量不符")
+    finally:
+        dns.DNSValidator.DNS_SERVERS, aging.UNRESOLVABLE_GRACE = default_servers, default_grace
+        for server in servers:
+            server.__exit__(None, None, None)
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ 老化存储复用结论与输出一致，复验/宽限/清除符合预期")
+    return 0
+
+# === 发布服务器 ===
+def http_request(port: int, path: str, headers: Dict[str, str], method: str = 'GET') -> Tuple[int, dict, bytes]:
+    """单次请求（短连接），返回 (状态码, 响应头, 响应体)"""
+    import http.client
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request(method, path, headers=headers)
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def load_serve(port: int, path: str, headers: Dict[str, str], requests: int, workers: int) -> Tuple[float, int, int]:
+    """多线程长连接压测，返回 (耗时秒, 响应体总字节, 失败数)"""
+    import http.client
+    received, failures = [0] * workers, [0] * workers
+
+    def worker(slot: int):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        for _ in range(requests // workers):
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            received[slot] += len(response.read())
+            failures[slot] += response.status >= 400
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sum(received), sum(failures)
+
+
+def cmd_serve(args) -> int:
+    """serve 子命令: 合成 8.8 万行 dns.txt + 预压缩 → 子进程发布服务器 | 协议行为检查与每秒请求数"""
+    import gzip
+    compress = load_script('compress')
+    bench_dir = Path(args.bench_dir)
+    corpus = generate_corpus(CORPUS_SIZES[args.size], bench_dir / f"corpus-v{CORPUS_VERSION}-{args.size}")
+    workspace = bench_dir / "serve"
+    shutil.rmtree(workspace, ignore_errors=True)
+    workspace.mkdir(parents=True)
+    rules = list(dict.fromkeys(line for path in sorted(corpus.glob('adblock*.txt')) for line in read_lines(path)))
+    name = 'dns.txt'
+    (workspace / name).write_text("\n".join(rules[:args.lines]) + "\n", encoding='utf-8')
+    records = compress.compress_outputs(str(workspace), files=(name,))
+    body = (workspace / name).read_bytes()
+    etag = f'"{records[name]["sha256"][:32]}"'
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, str(SCRIPT_DIR / 'serve.py'), '--host', '127.0.0.1',
+                               '--port', str(port), '--root', str(workspace), '--quiet'],
+                              stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    print("❌ 发布服务器未能启动")
+                    return 1
+                time.sleep(0.05)
+        print(f"🚀 发布服务器基准（{name}: {min(len(rules), args.lines)} 行, {len(body) / 1024:.0f} KB）")
+
+        path = f"/{name}"
+        encodings = {'br': 'br', 'zst': 'zstd', 'gz': 'gzip'}
+        checks = []
+        status, headers, data = http_request(port, path, {})
+        checks.append(("完整 GET 内容与强 ETag", status == 200 and data == body and headers.get('ETag') == etag))
+        status, headers, data = http_request(port, path, {}, 'HEAD')
+        checks.append(("HEAD 无响应体", status == 200 and not data and headers.get('Content-Length') == str(len(body))))
+        status, headers, data = http_request(port, path, {'If-None-Match': f'"stale", W/{etag}'})
+        checks.append(("If-None-Match → 304", status == 304 and not data))
+        status, headers, data = http_request(port, path, {'Range': 'bytes=100-199'})
+        checks.append(("Range → 206", status == 206 and data == body[100:200]
+                       and headers.get('Content-Range') == f"bytes 100-199/{len(body)}"))
+        status, headers, data = http_request(port, path, {'Range': 'bytes=-50'})
+        checks.append(("后缀 Range → 206", status == 206 and data == body[-50:]))
+        status, headers, data = http_request(port, path, {'Range': f'bytes={len(body)}-'})
+        checks.append(("越界 Range → 416", status == 416 and headers.get('Content-Range') == f"bytes */{len(body)}"))
+        status, headers, data = http_request(port, path, {'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        checks.append(("If-Range 不匹配 → 200 完整内容", status == 200 and data == body))
+        status, headers, data = http_request(port, path, {'Accept-Encoding': 'gzip'})
+        checks.append(("Accept-Encoding: gzip → .gz", status == 200 and headers.get('Content-Encoding') == 'gzip'
+                       and gzip.decompress(data) == body and headers.get('Vary') == 'Accept-Encoding'))
+        status, headers, data = http_request(port, path, {'Accept-Encoding': 'gzip;q=0, identity'})
+        checks.append(("q=0 拒绝压缩 → 原文", status == 200 and 'Content-Encoding' not in headers and data == body))
+        status, headers, data = http_request(port, '/../serve.py', {})
+        checks.append(("非发布文件 → 404", status == 404))
+        for label, ok in checks:
+            print(f"  {'✅' if ok else '❌'} {label}")
+
+        scenarios = [("200 原文", {})]
+        scenarios += [(f"200 .{ext}", {'Accept-Encoding': encodings[ext]}) for ext in records[name]['variants']]
+        scenarios += [("304 条件请求", {'If-None-Match': etag}), ("206 区间 64KB", {'Range': 'bytes=0-65535'})]
+        print(f"  {'场景':<14}{'请求/秒':>10}{'MB/秒':>9}{'失败':>6}")
+        failed = 0
+        for label, headers in scenarios:
+            elapsed, received, failures = load_serve(port, path, headers, args.requests, args.workers)
+            failed += failures
+            print(f"  {label:<14}{args.requests / elapsed:>10,.0f}{received / elapsed / 1e6:>9.1f}{failures:>6}")
+    finally:
+        server.terminate()
+        server.wait()
+    return 0 if all(ok for _, ok in checks) and not failed else 1
+
+
+# === 输出分片 ===
+def cmd_split(args) -> int:
+    """split 子命令: 合成 dns.txt 分片 → 模拟不同规模的更新 | 重写分片数与字节 | 按变化分片重载 vs 整表重载"""
+    from rules import KIND_COMMENT, tokenize
+    shard = load_script('shard')
+    bench_dir = Path(args.bench_dir)
+    corpus = generate_corpus(CORPUS_SIZES[args.size], bench_dir / f"corpus-v{CORPUS_VERSION}-{args.size}")
+    workspace = bench_dir / f"split-{args.size}"
+    shutil.rmtree(workspace, ignore_errors=True)
+    workspace.mkdir(parents=True)
+    rules = [rule for rule in dict.fromkeys(line for path in sorted(corpus.glob('adblock*.txt')) for line in read_lines(path))
+             if tokenize(rule).kind != KIND_COMMENT]
+    name = 'dns.txt'
+    path = workspace / name
+    start = time.perf_counter()
+    path.write_text("\n".join(rules) + "\n", encoding='utf-8')
+    load_matcher(path)
+    full = time.perf_counter() - start
+    print(f"🚀 输出分片基准（{len(rules)} 条 | 整表 {path.stat().st_size / 1024:.0f}KB，重载 {full * 1000:.0f}ms）")
+
+    failed = False
+    for mode in shard.MODES:
+        shutil.rmtree(workspace / shard.SHARD_DIR, ignore_errors=True)
+        path.write_text("\n".join(rules) + "\n", encoding='utf-8')
+        index = quiet_call(shard.generate, str(workspace), mode, (name,))
+        base = {label: record['sha256'] for label, record in index['files'][name]['shards'].items()}
+        print(f"  [{mode}] {len(base)} 个分片")
+        # 完整性: 原始规则表（含 !/# 注释与 ## 元素隐藏规则）分片后的总行数 = 非注释规则数
+        source = [line for path in sorted(corpus.glob('adblock*.txt')) for line in read_lines(path)]
+        (workspace / 'adblock.txt').write_text("\n".join(source) + "\n", encoding='utf-8')
+        records = quiet_call(shard.generate, str(workspace), mode, ('adblock.txt',))['files']['adblock.txt']['shards']
+        expected = sum(1 for rule in source if tokenize(rule).kind != KIND_COMMENT)
+        total = sum(record['lines'] for record in records.values())
+        failed |= total != expected
+        print(f"  {'✅' if total == expected else '❌'} adblock.txt 分片行数 {total} / 非注释规则 {expected}")
+        print(f"  {'变化规则':>8}{'重写分片':>10}{'重写KB':>9}{'重载ms':>9}{'完整':>6}")
+        for changes in args.changes:
+            rng = random.Random(SEED + changes)
+            removed = set(rng.sample(range(len(rules)), changes // 2))
+            updated = [rule for i, rule in enumerate(rules) if i not in removed]
+            updated += [f"||churn-{i}.{rng.choice(['com', 'net', 'cn', 'org'])}^" for i in range(changes - len(removed))]
+            path.write_text("\n".join(updated) + "\n", encoding='utf-8')
+            records = quiet_call(shard.generate, str(workspace), mode, (name,))['files'][name]['shards']
+            changed = [record for label, record in records.items() if base.get(label) != record['sha256']]
+            start = time.perf_counter()
+            for record in changed:
+                load_matcher(workspace / record['path'])
+            partial = time.perf_counter() - start
+            sharded = [line for record in records.values() for line in read_lines(workspace / record['path'])
+                       if not line.startswith('!')]
+            ok = sorted(sharded) == sorted(updated) and all(r['lines'] <= shard.MAX_SHARD_LINES for r in records.values())
+            failed |= not ok
+            print(f"  {changes:>8}{len(changed):>7}/{len(records):<3}{sum(r['bytes'] for r in changed) / 1024:>8.0f}"
+                  f"{partial * 1000:>9.0f}{'✅' if ok else '❌':>5}")
+            path.write_text("\n".join(rules) + "\n", encoding='utf-8')
+            quiet_call(shard.generate, str(workspace), mode, (name,))
+    return 1 if failed else 0
+
+
+# === 正则成本分析 ===
+REGEX_CASES = [   # (规则, 期望处理)
+    ('/^(a+)+$/', 'quarantined'),
+    ('/^([a-z0-9]+)*x\\.com$/', 'quarantined'),
+    ('/^(\\w+\\.?)+ad$/', 'quarantined'),
+    ('/^(.+\\.)*tracker\\.example\\.com$/', 'rewritten'),
+    ('/^(.+\\.)?ads\\.example\\.net$/', 'rewritten'),
+    ('/(^|\\.)(pix|beacon)\\.example\\.org$/', 'rewritten'),
+    ('@@/^([^.]+\\.)*cdn\\.example\\.io$/', 'rewritten'),
+    ('/^ad[0-9]+\\./', 'kept'),
+    ('/track(ing)?[0-9]*\\./', 'kept'),
+    ('/(?<=ad)x/', 'kept'),
+    ('/[/', 'invalid'),
+]
+
+
+def cmd_regex(args) -> int:
+    """regex 子命令: 合成语料中的正则 + 已知病态/可改写用例 → 分析处理是否符合预期 | 改写等价性 | 单次查询成本前后对照"""
+    regexcost = load_script('regexcost')
+    from rules import KIND_REGEX, tokenize
+    bench_dir = Path(args.bench_dir)
+    corpus = generate_corpus(CORPUS_SIZES[args.size], bench_dir / f"corpus-v{CORPUS_VERSION}-{args.size}")
+    rules = list(dict.fromkeys(line for path in sorted(corpus.glob('adblock*.txt')) for line in read_lines(path)))
+    rules += [rule for rule, _ in REGEX_CASES]
+    regexes = [rule for rule in rules if tokenize(rule).kind == KIND_REGEX]
+    print(f"🚀 正则成本分析基准（{len(rules)} 条规则，其中正则 {len(regexes)} 条）")
+
+    start = time.perf_counter()
+    output, report = regexcost.analyze({'adblock.txt': rules})
+    elapsed = time.perf_counter() - start
+    regexcost.print_report(report)
+    actions = {entry['rule']: entry for entry in report['rules']}
+
+    failed = 0
+    for rule, expected in REGEX_CASES:
+        entry = actions.get(rule, {'action': 'kept', 'flags': []})
+        ok = entry['action'] == expected
+        failed += not ok
+        print(f"  {'✅' if ok else '❌'} {rule:<40} {entry['action']:<12} {','.join(entry['flags'])}")
+
+    domains = regexcost.build_corpus()
+    typical = domains[-1000:]   # 改写前的病态正则在对抗样本上会回溯爆炸，等价性只在常规域名上对照
+    mismatches = 0
+    for entry in report['rules']:
+        if entry['action'] != 'rewritten':
+            continue
+        kind, _, start, end, _, _, _ = tokenize(entry['rule'])
+        pattern = re.compile(entry['rule'][start:end])
+        hosts = [tokenize(rule) for rule in entry['replacement']]
+        hosts = [rule[t.start:t.end] for rule, t in zip(entry['replacement'], hosts)]
+        probes = typical + [p + host for host in hosts for p in ('', 'a.', 'x.y.', 'not')] + [host + '.evil' for host in hosts]
+        for domain in probes:
+            expected = any(domain == host or domain.endswith('.' + host) for host in hosts)
+            mismatches += bool(pattern.search(domain)) != expected
+    output_set = set(output['adblock.txt'])
+    missing = sum(1 for rule in rules if rule not in regexes and rule not in output_set)
+    before = sum(cost for _, cost in regexcost.measure(list(dict.fromkeys(r[1:-1] for r in regexes if r.startswith('/'))),
+                                                        domains) if cost is not None)
+    print(f"  {'✅' if not mismatches else '❌'} 改写规则与原正则判定不一致: {mismatches}")
+    print(f"  {'✅' if not missing else '❌'} 非正则规则丢失: {missing}")
+    print(f"  ⏱️ 分析耗时 {elapsed:.1f}s | 单次查询正则总成本: 分析前 ≥{before:.1f}µs（不含超时规则）→ 分析后 {report['total_cost_us']:.1f}µs")
+    return 1 if failed or mismatches or missing else 0
+
+
+# === 运行预算与降级 ===
+def cmd_deadline(args) -> int:
+    """deadline 子命令: 下载截止后沿用上次成功副本 | DNS截止后停止查询并信任缓存 | 预算不足时跳过可选阶段并记录降级"""
+    import asyncio
+    dl = load_script('dl')
+    dns = load_script('filter-dns')
+    pipeline = load_script('pipeline')
+    bench_dir = Path(args.bench_dir)
+    corpus = generate_corpus(CORPUS_SIZES['100k'], bench_dir / f"corpus-v{CORPUS_VERSION}-100k")
+    workspace = bench_dir / "deadline"
+    shutil.rmtree(workspace, ignore_errors=True)
+    served, temp, last_good = workspace / "served", workspace / "tmp", workspace / "last-good"
+    shutil.copytree(corpus, served)
+    temp.mkdir(parents=True)
+    print("🚀 运行预算与降级基准")
+    failures = []
+
+    # 下载: 首次全部成功并保存副本 → 已过截止时间 / 源失效时沿用副本
+    with CorpusServer(served) as server:
+        sources = sorted(p.name for p in served.glob('*.txt'))
+        block = [f"{server.base_url}/{n}" for n in sources if n.startswith('adblock')]
+        allow = [f"{server.base_url}/{n}" for n in sources if n.startswith('allow')]
+        total = len(block) + len(allow)
+        success = quiet_call(dl.download_rules, block, allow, str(temp), None, str(last_good))
+        fresh = {p.name: p.read_bytes() for p in temp.glob('*.txt')}
+        for p in temp.glob('*.txt'):
+            p.unlink()
+        restored: List[str] = []
+        start = time.perf_counter()
+        expired = quiet_call(dl.download_rules, block, allow, str(temp), time.monotonic(), str(last_good), restored)
+        elapsed = time.perf_counter() - start
+        same = {p.name: p.read_bytes() for p in temp.glob('*.txt')} == fresh
+        print(f"  📥 首次下载 {success}/{total} | 截止后: 下载 {expired}，沿用副本 {len(restored)} 个 | "
+              f"{elapsed * 1000:.0f}ms | 内容一致 {'✅' if same else '❌'}")
+        if success != total or expired or len(restored) != total or not same:
+            failures.append("下载截止后未完整沿用上次成功副本")
+        (served / sources[0]).unlink()
+        restored = []
+        partial = quiet_call(dl.download_rules, block, allow, str(temp), None, str(last_good), restored)
+        print(f"  📥 源 {sources[0]} 失效: 下载 {partial}，沿用副本 {', '.join(restored) or '无'}")
+        if partial != total - 1 or len(restored) != 1 or (temp / restored[0]).read_bytes() != fresh[restored[0]]:
+            failures.append("失效源未沿用上次成功副本")
+
+    # DNS: 完整验证（写入老化存储）→ 截止后的运行不发起查询，信任已有结论
+    domains = stub_domains()
+    rules = [f"||{domain}^" for domain in domains]
+    specs = [tuple(float(x) for x in spec.split(':')) for spec in args.servers]
+    servers = [StubDNSServer(delay / 1000, loss, servfail, SEED + i)
+               for i, (delay, loss, servfail) in enumerate(specs)]
+    default_servers = dns.DNSValidator.DNS_SERVERS
+    dns.DNSValidator.DNS_SERVERS = [server.address for server in servers]
+
+    def covered(output) -> int:
+        """输出规则仍覆盖的存在域名数（泛解析区合并后的后缀规则按覆盖计）"""
+        hosts = {rule[2:-1] for rule in output}
+        count = 0
+        for domain, exists in domains.items():
+            name = domain
+            while exists and name and name not in hosts:
+                name = name.partition('.')[2]
+            count += exists and bool(name)
+        return count
+
+    def run(aging: bool, deadline: Optional[float]):
+        before = sum(server.queries for server in servers)
+        processor = dns.BlacklistProcessor(aging=aging, deadline=time.monotonic() + deadline if deadline is not None else None)
+        start = time.perf_counter()
+        asyncio.run(processor.process(rules, workspace))
+        return (sum(server.queries for server in servers) - before, time.perf_counter() - start,
+                processor.adguard_rules, processor.dns_validator.deadline_skipped)
+
+    for server in servers:
+        server.__enter__()
+    try:
+        queries, elapsed, baseline, _ = run(True, None)
+        alive = sum(domains.values())
+        print(f"  🔍 完整验证: 查询 {queries} | {elapsed:.2f}s | 输出 {len(baseline)}/{len(rules)} 条 | 覆盖存在域名 {covered(baseline)}/{alive}")
+        queries, elapsed, output, skipped = run(True, 0)
+        ok = queries == 0 and output == baseline
+        print(f"  {'✅' if ok else '❌'} 截止后 + 老化存储: 查询 {queries} | {elapsed:.2f}s | 未查询 {skipped} | 输出与完整验证一致 {output == baseline}")
+        if not ok:
+            failures.append("截止后未完全信任老化存储结论")
+        queries, elapsed, output, skipped = run(False, 0)
+        ok = queries == 0 and len(output) == len(rules) and skipped == len(rules)
+        print(f"  {'✅' if ok else '❌'} 截止后 + 无缓存: 查询 {queries} | 未查询 {skipped} | 全部保留 {len(output)} 条（不误删）")
+        if not ok:
+            failures.append("无缓存时截止后仍发起查询或误删规则")
+        queries, elapsed, output, skipped = run(False, args.dns_deadline)
+        bound = args.dns_deadline + 2 * dns.TIMEOUT + RETRY_SLACK
+        ok = elapsed <= bound and skipped > 0 and covered(output) == alive
+        print(f"  {'✅' if ok else '❌'} 截止 {args.dns_deadline}s: 查询 {queries} | {elapsed:.2f}s（上限 {bound:.1f}s）| 未查询 {skipped} | "
+              f"输出 {len(output)} 条 | 覆盖存在域名 {covered(output)}/{alive}")
+        if not ok:
+            failures.append("DNS验证未在截止时间附近结束")
+    finally:
+        dns.DNSValidator.DNS_SERVERS = default_servers
+        for server in servers:
+            server.__exit__(None, None, None)
+
+    # 编排: 预算为 0 时可选阶段不启动，沿用上次产物，降级写入运行元数据
+    mrs = workspace / "adb.mrs"
+    mrs.write_bytes(b"last-good")
+    (workspace / pipeline.TIMINGS_FILE).parent.mkdir(parents=True, exist_ok=True)
+    (workspace / pipeline.TIMINGS_FILE).write_text(json.dumps({'mrs': 30.0, 'sketch': 5.0}), encoding='utf-8')
+    saved = os.environ.get('WORKSPACE')
+    try:
+        code = quiet_call(pipeline.main, ['run', '--only', 'mrs', 'sketch', '--budget', '0', '--workspace', str(workspace)])
+    finally:
+        if saved is None:
+            os.environ.pop('WORKSPACE', None)
+        else:
+            os.environ['WORKSPACE'] = saved
+    meta = json.loads((workspace / pipeline.RUN_FILE).read_text(encoding='utf-8'))
+    statuses = {name: r['status'] for name, r in meta['stages'].items()}
+    fired = sorted((f['stage'], f['action']) for f in meta['fallbacks'])
+    ok = (code == 0 and statuses == {'mrs': 'degraded', 'sketch': 'degraded'} and mrs.read_bytes() == b"last-good"
+          and fired == [('mrs', 'skip-stage'), ('sketch', 'skip-stage')] and meta['over_budget'])
+    print(f"  {'✅' if ok else '❌'} 预算 0s: 退出码 {code} | 阶段 {statuses} | 降级 {fired} | adb.mrs 保留 {mrs.read_bytes() == b'last-good'}")
+    if not ok:
+        failures.append("预算不足时可选阶段未按预期降级或未记录")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ 各截止点按预定方式降级，输出完整，降级已记录")
+    return 0
+
+
+# === 来源归属索引 ===
+def cmd_attribution(args) -> int:
+    """attribution 子命令: 索引重建 vs 真实重新合并逐条对照 | why() 查询耗时"""
+    attribution = load_script('attribution')
+    merge = load_script('merge')
+    bench_dir = Path(args.bench_dir)
+    corpus = generate_corpus(CORPUS_SIZES[args.size], bench_dir / f"corpus-v{CORPUS_VERSION}-{args.size}")
+    work = bench_dir / "attribution"
+    shutil.rmtree(work, ignore_errors=True)
+    full = work / "full"
+    full.mkdir(parents=True)
+    for path in sorted(corpus.glob('adblock*.txt')):
+        shutil.copy2(path, full / path.name)
+    print(f"🚀 来源归属索引基准（语料 {args.size}）")
+
+    start = time.perf_counter()
+    merged = merge.merge_rules('adblock*.txt', str(full))
+    plain_time = time.perf_counter() - start
+    start = time.perf_counter()
+    merged_indexed = merge.merge_files('adblock*.txt', 'adblock.txt', str(full), str(work))
+    indexed_time = time.perf_counter() - start
+    index_file = attribution.index_path(full, 'adblock.txt')
+    print(f"  ⏱️ 合并: {plain_time:.2f}s | 合并+索引: {indexed_time:.2f}s | "
+          f"索引 {index_file.stat().st_size / 2**20:.1f}MB")
+
+    failures = []
+    with attribution.AttributionIndex(index_file) as index:
+        if index.rebuild() != merged or merged_indexed != merged:
+            failures.append("索引重建（不排除来源）与合并结果不一致")
+        for k, name in enumerate(index.sources[:args.sources]):
+            partial = work / f"without-{k:02d}"
+            partial.mkdir()
+            for path in full.glob('adblock*.txt'):
+                if path.name != name:
+                    os.link(path, partial / path.name)
+            start = time.perf_counter()
+            expected = merge.merge_rules('adblock*.txt', str(partial))
+            merge_time = time.perf_counter() - start
+            start = time.perf_counter()
+            rebuilt = index.rebuild([k])
+            rebuild_time = time.perf_counter() - start
+            same = rebuilt == expected
+            print(f"  {'✅' if same else '❌'} 去掉 {name}: {len(rebuilt)} 条 | "
+                  f"重新合并 {merge_time:.2f}s vs 索引重建 {rebuild_time:.2f}s")
+            if not same:
+                failures.append(f"去掉 {name} 后索引重建与重新合并不一致")
+
+        rng = random.Random(SEED)
+        probes = [f"sub.{corpus_domain(rng, ['example.com'])}" for _ in range(100)]
+        probes += [rule[2:-1] for rule in rng.sample(merged, min(len(merged), 900))
+                   if rule.startswith('||') and rule.endswith('^')]
+        start = time.perf_counter()
+        hits = sum(1 for domain in probes if index.why(domain))
+        elapsed = time.perf_counter() - start
+        print(f"  🔎 why(): {len(probes)} 次查询 | 命中 {hits} | 平均 {elapsed / len(probes) * 1e6:.0f}µs")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ 索引重建结果与重新合并一致")
+    return 1 if failures else 0
+
+
+# === 冷启动 ===
+STARTUP_MARKER = '-- probe end --'
+STARTUP_PROBE = (
+    "import sys; "
+    "__import__({name!r}); "
+    f"sys.stderr.write({STARTUP_MARKER!r} + '\\n'); "
+    "import json, logging; "
+    "print(json.dumps({{'modules': sorted(sys.modules), 'handlers': len(logging.getLogger().handlers)}}))"
+)
+
+
+def measure_import(name: str) -> Tuple[float, List[Tuple[float, str]], dict]:
+    """以 -X importtime 冷导入模块（__import__ 计入模块自身），返回 (总耗时ms, 最重的直接依赖, 导入后状态)"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_PROBE.format(name=name)],
+        cwd=SCRIPT_DIR, capture_output=True, text=True, check=True,
+        env={**os.environ, 'EASYADS_PROFILE': ''},
+    )
+    total_us = 0
+    top = []
+    after_site = False
+    for line in proc.stderr.splitlines():
+        if line == STARTUP_MARKER:
+            break
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        if not after_site:
+            after_site = module.strip() == 'site'
+            continue
+        depth = (len(module) - len(module.lstrip(' ')) - 1) // 2
+        if depth == 0:    # 被测模块本身（含全部依赖）
+            total_us += int(cumulative)
+        elif depth == 1:  # 被测模块的直接依赖
+            top.append((int(cumulative) / 1000, module.strip()))
+    return total_us / 1000, sorted(top, reverse=True)[:5], json.loads(proc.stdout)
+
+
+def cmd_startup(args) -> int:
+    """startup 子命令"""
+    print("🚀 冷启动预算检查")
+    failures = []
+    for name in args.modules:
+        budget = STARTUP_BUDGETS_MS.get(name, args.default_budget) * args.scale
+        best, top, state = None, [], {}
+        for _ in range(args.repeat):  # 取多次中的最小值，削弱磁盘缓存抖动
+            elapsed, heavy, probe = measure_import(name)
+            if best is None or elapsed < best:
+                best, top, state = elapsed, heavy, probe
+        loaded = sorted(LAZY_MODULES & set(state['modules']))
+        ok = best <= budget and not loaded and state['handlers'] == 0
+        print(f"{'✅' if ok else '❌'} {name:<14}{best:>8.1f}ms / 预算 {budget:.0f}ms"
+              f"  | 重依赖: {', '.join(loaded) or '无'} | 根日志处理器: {state['handlers']}")
+        if not ok:
+            failures.append(name)
+            for ms, module in top:
+                print(f"      {ms:>8.1f}ms  {module}")
+    if failures:
+        print(f"❌ 超出预算或导入有副作用: {', '.join(failures)}")
+        return 1
+    print("✅ 全部模块满足冷启动预算")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="EasyAds 规则性能基准工具")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    lookup = sub.add_parser('lookup', help="离线查询回放（解析器查询成本）")
+    lookup.add_argument('--workspace', default=WORKSPACE, help="规则产物所在目录")
+    lookup.add_argument('--files', nargs='+', default=LOOKUP_FILES, help="参与回放的产物文件")
+    lookup.add_argument('--log', help="查询日志路径（不指定则生成合成Zipf查询流）")
+    lookup.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help="合成查询数量")
+    lookup.add_argument('--unique', type=int, default=DEFAULT_UNIQUE, help="合成流中不同域名数")
+    lookup.add_argument('--blocked-share', type=float, default=DEFAULT_BLOCKED_SHARE,
+                        help="合成域名池中被拦截域名占比")
+    lookup.add_argument('--json', help="将结果写入JSON文件")
+    lookup.set_defaults(func=cmd_lookup)
+
+    stages = sub.add_parser('stages', help="合成语料上的逐阶段吞吐与内存基准")
+    stages.add_argument('--sizes', nargs='+', choices=list(CORPUS_SIZES), default=list(CORPUS_SIZES),
+                        help="语料规模")
+    stages.add_argument('--only', nargs='+', choices=[name for name, _ in STAGES], help="仅运行指定阶段")
+    stages.add_argument('--bench-dir', default=BENCH_DIR, help="语料与中间文件目录")
+    stages.add_argument('--output', default=os.path.join(BENCH_DIR, "results.json"), help="结果JSON路径")
+    stages.add_argument('--baseline', default=BASELINE_FILE, help="基线JSON路径")
+    stages.add_argument('--save-baseline', action='store_true', help="将本次结果保存为基线")
+    stages.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help="回归容差")
+    stages.add_argument('--no-memory', action='store_true', help="跳过峰值内存测量（耗时减半）")
+    stages.set_defaults(func=cmd_stages)
+
+    startup = sub.add_parser('startup', help="冷启动导入预算与副作用检查")
+    startup.add_argument('--modules', nargs='+', default=list(STARTUP_BUDGETS_MS), help="检查的脚本模块")
+    startup.add_argument('--repeat', type=int, default=3, help="每个模块重复测量次数（取最小值）")
+    startup.add_argument('--scale', type=float, default=1.0, help="预算放大系数（慢速机器）")
+    startup.add_argument('--default-budget', type=float, default=12, help="未登记模块的预算(ms)")
+    startup.set_defaults(func=cmd_startup)
+
+    tokenizer = sub.add_parser('tokenizer', help="单遍分词器与旧正则链的吞吐/等价性对照")
+    tokenizer.add_argument('--size', choices=list(CORPUS_SIZES), default='1m', help="语料规模")
+    tokenizer.add_argument('--bench-dir', default=BENCH_DIR, help="语料目录")
+    tokenizer.add_argument('--repeat', type=int, default=3, help="每个实现重复遍历次数（取最短）")
+    tokenizer.add_argument('--show', type=int, default=3, help="每个使用方展示的差异样例数")
+    tokenizer.set_defaults(func=cmd_tokenizer)
+
+    dns = sub.add_parser('dns', help="桩DNS服务器上的验证器对照（时延/丢包/SERVFAIL注入）")
+    dns.add_argument('--servers', nargs='+', default=STUB_SERVERS, help="桩上游: 时延ms:丢包率:SERVFAIL率")
+    dns.add_argument('--timeout', type=float, default=0.5, help="单次查询超时（秒）")
+    dns.add_argument('--retry-backoff', type=float, default=0.1, help="首轮重试前等待（秒）")
+    dns.add_argument('--rate', type=float, default=100.0, help="每上游每秒查询数（令牌桶）")
+    dns.add_argument('--hedge-percentile', type=float, default=0.9, help="对冲时延分位数")
+    dns.add_argument('--json', help="将结果写入JSON文件")
+    dns.set_defaults(func=cmd_dns)
+
+    shards = sub.add_parser('shards', help="多进程分片DNS验证与合并（桩DNS服务器）")
+    shards.add_argument('--shards', type=int, default=4, help="分片（进程）数")
+    shards.add_argument('--servers', nargs='+', default=['20:0:0', '40:0:0'], help="桩上游: 时延ms:丢包率:SERVFAIL率")
+    shards.add_argument('--bench-dir', default=BENCH_DIR, help="工作目录")
+    shards.set_defaults(func=cmd_shards)
+
+    attribution = sub.add_parser('attribution', help="来源归属索引: 去掉来源后的重建对照与 why() 查询耗时")
+    attribution.add_argument('--size', choices=list(CORPUS_SIZES), default='100k', help="语料规模")
+    attribution.add_argument('--sources', type=int, default=CORPUS_BLOCK_SOURCES, help="逐一排除对照的来源数")
+    attribution.add_argument('--bench-dir', default=BENCH_DIR, help="语料与中间文件目录")
+    attribution.set_defaults(func=cmd_attribution)
+
+    emit = sub.add_parser('emit', help="解析器原生格式: 单遍输出、替身加载耗时与判定一致性")
+    emit.add_argument('--size', choices=list(CORPUS_SIZES), default='100k', help="语料规模")
+    emit.add_argument('--queries', type=int, default=200_000, help="对照查询数")
+    emit.add_argument('--bench-dir', default=BENCH_DIR, help="语料与中间文件目录")
+    emit.set_defaults(func=cmd_emit)
+
+    compact = sub.add_parser('compact', help="紧凑二进制产物: 体积、打开耗时、查询吞吐与判定一致性")
+    compact.add_argument('--size', choices=list(CORPUS_SIZES), default='100k', help="语料规模")
+    compact.add_argument('--queries', type=int, default=200_000, help="对照查询数")
+    compact.add_argument('--bench-dir', default=BENCH_DIR, help="语料与中间文件目录")
+    compact.set_defaults(func=cmd_compact)
+
+    aging = sub.add_parser('aging', help="规则老化存储: 连续运行的查询量、错开复验、宽限期与过期清除")
+    aging.add_argument('--servers', nargs='+', default=['20:0:0', '40:0:0'], help="桩上游: 时延ms:丢包率:SERVFAIL率")
+    aging.add_argument('--bench-dir', default=BENCH_DIR, help="工作目录")
+    aging.set_defaults(func=cmd_aging)
+
+    serve = sub.add_parser('serve', help="发布服务器: ETag/304/Range/编码协商检查与每秒请求数")
+    serve.add_argument('--size', choices=list(CORPUS_SIZES), default='1m', help="语料规模（取其去重规则的前 --lines 行）")
+    serve.add_argument('--lines', type=int, default=88_000, help="发布文件行数")
+    serve.add_argument('--requests', type=int, default=2000, help="每个场景的请求数")
+    serve.add_argument('--workers', type=int, default=8, help="并发长连接数")
+    serve.add_argument('--bench-dir', default=BENCH_DIR, help="工作目录")
+    serve.set_defaults(func=cmd_serve)
+
+    split = sub.add_parser('split', help="输出分片: 小幅更新后的重写分片数/字节与重载耗时")
+    split.add_argument('--size', choices=list(CORPUS_SIZES), default='1m', help="语料规模")
+    split.add_argument('--changes', type=int, nargs='+', default=[5, 50, 500, 5000], help="模拟更新的变化规则数（半数删除、半数新增）")
+    split.add_argument('--bench-dir', default=BENCH_DIR, help="语料与中间文件目录")
+    split.set_defaults(func=cmd_split)
+
+    regex = sub.add_parser('regex', help="正则成本分析: 病态/可改写用例的处理、改写等价性与查询成本对照")
+    regex.add_argument('--size', choices=list(CORPUS_SIZES), default='100k', help="语料规模")
+    regex.add_argument('--bench-dir', default=BENCH_DIR, help="语料与中间文件目录")
+    regex.set_defaults(func=cmd_regex)
+
+    deadline = sub.add_parser('deadline', help="运行预算: 下载/DNS截止后的降级、可选阶段跳过与降级记录")
+    deadline.add_argument('--servers', nargs='+', default=['300:0:0'], help="桩上游: 时延ms:丢包率:SERVFAIL率")
+    deadline.add_argument('--dns-deadline', type=float, default=0.5, help="部分验证场景的DNS截止时间（秒）")
+    deadline.add_argument('--bench-dir', default=BENCH_DIR, help="语料与中间文件目录")
+    deadline.set_defaults(func=cmd_deadline)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
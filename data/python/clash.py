@@ -7,37 +7,55 @@ AdGuard规则转换器 (Clash/Mihomo兼容版)
 """
 
 import os
-import re
 import sys
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Iterable, List, Optional, Set
 from pathlib import Path
 
+import instrument
+from domains import label_key, normalize_domain
+from rules import (KIND_COMMENT, KIND_DOMAIN, KIND_PLAIN, KIND_WILDCARD,
+                   MOD_APP, MOD_CNAME, MOD_DNSREWRITE, MOD_DNSTYPE, MOD_DOCUMENT,
+                   MOD_EXTENSION, MOD_IMPORTANT, MOD_REDIRECT, canonical_form, parse_modifiers, tokenize)
+
 # 配置区
 INPUT_FILE = "dns.txt"           # 根目录输入文件
 OUTPUT_FILE = "ads.yaml"          # 根目录输出文件
 WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
 
-# 预编译正则表达式 - 提升性能
-COMMENT_PATTERN = re.compile(r'^[!#]')
-META_PATTERN = re.compile(r'^\[.*\]$')
-DOMAIN_PATTERN = re.compile(r'^[a-zA-Z0-9.-]+$')
-WILDCARD_PATTERN = re.compile(r'^\*\.([a-zA-Z0-9.-]+)$')
-ADGUARD_DOMAIN_PATTERN = re.compile(r'^\|\|([a-zA-Z0-9.-]+)\^?$')
+# 不支持的AdGuard选项（黑名单方式，单次按位与判断）
+UNSUPPORTED_MODIFIERS = (MOD_DNSTYPE | MOD_DNSREWRITE | MOD_CNAME | MOD_IMPORTANT
+                         | MOD_REDIRECT | MOD_APP | MOD_EXTENSION | MOD_DOCUMENT)
+
 
 # 时区处理
-try:
-    from zoneinfo import ZoneInfo
-    beijing_tz = ZoneInfo("Asia/Shanghai")
-except ImportError:
-    import pytz
-    beijing_tz = pytz.timezone("Asia/Shanghai")
+_beijing_tz = None
+
+def get_beijing_tz():
+    """按需加载北京时区（zoneinfo 不可用时回退 pytz）"""
+    global _beijing_tz
+    if _beijing_tz is None:
+        try:
+            from zoneinfo import ZoneInfo
+            _beijing_tz = ZoneInfo("Asia/Shanghai")
+        except ImportError:
+            import pytz
+            _beijing_tz = pytz.timezone("Asia/Shanghai")
+    return _beijing_tz
 
 def convert_adguard_rule(adguard_rule: str) -> Optional[str]:
     """
     高性能AdGuard规则转换
     返回: Clash兼容规则 或 None(无效规则)
     """
+    match = canonical_form(adguard_rule)
+    if match is not None:   # 规范形式: 主机名即规范化结果；Hosts 行与带 ^ 的无锚点/通配规则不可转换
+        if match[1] is not None or (match[6] and match[4] != '||'):
+            return None
+        options = match[7]
+        if options is not None and parse_modifiers(options)[0] & UNSUPPORTED_MODIFIERS:
+            return None
+        return f"DOMAIN-SUFFIX,{match[5]},{'DIRECT' if match[3] else 'REJECT'}"
     stripped_rule = adguard_rule.strip()
     
     # 处理空行
@@ -45,94 +63,63 @@ def convert_adguard_rule(adguard_rule: str) -> Optional[str]:
         return None
     
     # 处理注释
-    if COMMENT_PATTERN.match(stripped_rule):
+    if stripped_rule[0] in '!#':
         return f"# {stripped_rule[1:].strip()}"
     
-    # 忽略元信息行
-    if META_PATTERN.match(stripped_rule):
+    # 单遍分词；忽略元信息行
+    kind, exception, start, end, pattern_end, modifiers, _ = tokenize(stripped_rule)
+    if kind == KIND_COMMENT:
         return None
     
-    # 提取规则主体和选项
-    rule_body, options = parse_rule(stripped_rule)
-    if not rule_body:
+    # 检查是否支持选项
+    if modifiers & UNSUPPORTED_MODIFIERS:
         return None
     
-    # 检查是否支持选项
-    if options and not is_supported_option(options):
+    # 跳过正则规则和其他复杂规则
+    if kind != KIND_WILDCARD and kind != KIND_DOMAIN and kind != KIND_PLAIN:
         return None
     
-    # 确定策略类型
-    is_whitelist = rule_body.startswith('@@')
-    action = "DIRECT" if is_whitelist else "REJECT"
-    rule_body = rule_body[2:] if is_whitelist else rule_body
+    # 分词器主机名为 [\w*.-]，Clash 仅接受规范化后的 [a-z0-9.-]（国际化域名转为 punycode）
+    domain = normalize_domain(stripped_rule[start:end])
+    if domain is None or '_' in domain:
+        return None
     
-    # 转换规则类型
-    return convert_rule_body(rule_body, action)
-
-def parse_rule(full_rule: str) -> Tuple[Optional[str], Optional[str]]:
-    """分离规则主体和选项部分"""
-    if '$' in full_rule:
-        parts = full_rule.split('$', 1)
-        return parts[0].strip(), parts[1].strip()
-    return full_rule.strip(), None
-
-def is_supported_option(options: str) -> bool:
-    """检查是否支持AdGuard选项"""
-    # 支持的选项列表（黑名单方式）
-    unsupported_options = {
-        'dnstype', 'dnsrewrite', 'cname', 'important', 
-        'redirect', 'app', 'extension', 'document'
-    }
+    # 确定策略类型
+    action = "DIRECT" if exception else "REJECT"
     
-    # 检查是否包含不支持选项
-    for opt in options.split(','):
-        opt_name = opt.strip().split('=')[0]
-        if opt_name in unsupported_options:
-            return False
-    return True
-
-def convert_rule_body(rule_body: str, action: str) -> Optional[str]:
-    """转换规则主体为Clash格式"""
-    # 处理通配符规则 (*.example.com)
-    if wildcard_match := WILDCARD_PATTERN.match(rule_body):
-        return f"DOMAIN-SUFFIX,{wildcard_match.group(1)},{action}"
+    # 处理通配符规则 (*.example.com)：不带锚点后缀
+    if kind == KIND_WILDCARD:
+        return f"DOMAIN-SUFFIX,{domain},{action}" if end == pattern_end else None
     
     # 处理AdGuard域名规则 (||example.com^)
-    if domain_match := ADGUARD_DOMAIN_PATTERN.match(rule_body):
-        return f"DOMAIN-SUFFIX,{domain_match.group(1)},{action}"
+    if kind == KIND_DOMAIN:
+        suffix = stripped_rule[end:pattern_end]
+        return f"DOMAIN-SUFFIX,{domain},{action}" if suffix in ('', '^') else None
     
     # 处理纯域名规则 (example.com)
-    if DOMAIN_PATTERN.match(rule_body):
-        if '.' in rule_body:
-            return f"DOMAIN-SUFFIX,{rule_body},{action}"
-        return f"DOMAIN,{rule_body},{action}"
-    
-    # 跳过正则规则和其他复杂规则
-    return None
+    if end != pattern_end:
+        return None
+    if '.' in domain:
+        return f"DOMAIN-SUFFIX,{domain},{action}"
+    return f"DOMAIN,{domain},{action}"
 
-def generate_ads_yaml() -> bool:
-    """生成ads.yaml文件 - 返回是否成功"""
-    input_path = Path(WORKSPACE) / INPUT_FILE
-    output_path = Path(WORKSPACE) / OUTPUT_FILE
-    
-    # 验证输入文件
-    if not input_path.exists():
-        print(f"错误：输入文件不存在: {input_path}")
-        return False
-    
-    # 读取并转换规则
+def convert_rules(lines: Iterable[str]) -> Set[str]:
+    """批量转换规则（自动去重）"""
     converted_rules = set()
-    try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if converted := convert_adguard_rule(line):
-                    converted_rules.add(converted)
-    except Exception as e:
-        print(f"文件处理错误: {e}")
-        return False
-    
-    # 准备YAML内容
-    beijing_time = datetime.now(beijing_tz)
+    for line in lines:
+        if converted := convert_adguard_rule(line):
+            converted_rules.add(converted)
+    return converted_rules
+
+def clash_order_key(rule: str):
+    """ads.yaml 排序键: 注释在前，其余按域名的反转标签排序"""
+    if rule.startswith('#'):
+        return 0, (), rule
+    return 1, label_key(rule.split(',', 2)[1]), rule
+
+def build_ads_yaml(converted_rules: Iterable[str]) -> str:
+    """生成ads.yaml文本内容"""
+    beijing_time = datetime.now(get_beijing_tz())
     time_str = beijing_time.strftime('%Y-%m-%d %H:%M:%S')
     
     yaml_content = [
@@ -145,25 +132,52 @@ def generate_ads_yaml() -> bool:
         "payload:"
     ]
     
-    # 添加规则并排序
-    sorted_rules = sorted(converted_rules)
-    for rule in sorted_rules:
+    # 添加规则并排序（注释在前，规则按反转标签排序，同一父域下的规则相邻）
+    for rule in sorted(converted_rules, key=clash_order_key):
         if rule.startswith('#'):
             yaml_content.append(rule)
         else:
             yaml_content.append(f"  - {rule}")
-    
-    # 写入输出文件
+    return '\n'.join(yaml_content)
+
+def write_ads_yaml(content: str, output_path: Path) -> bool:
+    """写入输出文件 - 返回是否成功"""
     try:
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(yaml_content))
+            f.write(content)
         print(f"转换成功！生成规则文件: {output_path}")
-        print(f"有效规则数量: {len(sorted_rules)}")
         return True
     except Exception as e:
         print(f"写入文件失败: {e}")
         return False
 
+def generate_ads_yaml(rules: Optional[Iterable[str]] = None, workspace: str = WORKSPACE) -> bool:
+    """生成ads.yaml文件 - 返回是否成功（rules为空时读取dns.txt）"""
+    input_path = Path(workspace) / INPUT_FILE
+    output_path = Path(workspace) / OUTPUT_FILE
+    
+    # 读取并转换规则
+    try:
+        with instrument.stage('clash:convert'):
+            if rules is not None:
+                converted_rules = convert_rules(rules)
+            elif not input_path.exists():
+                print(f"错误：输入文件不存在: {input_path}")
+                return False
+            else:
+                with open(input_path, 'r', encoding='utf-8') as f:
+                    converted_rules = convert_rules(f)
+                instrument.count('clash.bytes_read', input_path.stat().st_size)
+        instrument.count('clash.rules_converted', len(converted_rules))
+    except Exception as e:
+        print(f"文件处理错误: {e}")
+        return False
+    
+    if not write_ads_yaml(build_ads_yaml(converted_rules), output_path):
+        return False
+    print(f"有效规则数量: {len(converted_rules)}")
+    return True
+
 if __name__ == "__main__":
     print("🚀 AdGuard规则转换器启动")
     print(f"工作目录: {WORKSPACE}")
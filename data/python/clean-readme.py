@@ -13,6 +13,8 @@ import datetime
 from pathlib import Path
 from typing import Dict, Optional
 
+import instrument
+
 # === 配置区 ===
 WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
 RULE_FILES = {
@@ -25,16 +27,23 @@ RULE_FILES = {
 README_FILE = 'README.md'
 
 # === 时区处理 ===
-try:
-    from zoneinfo import ZoneInfo
-    beijing_tz = ZoneInfo("Asia/Shanghai")
-except ImportError:
-    import pytz
-    beijing_tz = pytz.timezone("Asia/Shanghai")
+_beijing_tz = None
+
+def get_beijing_tz():
+    """按需加载北京时区（zoneinfo 不可用时回退 pytz）"""
+    global _beijing_tz
+    if _beijing_tz is None:
+        try:
+            from zoneinfo import ZoneInfo
+            _beijing_tz = ZoneInfo("Asia/Shanghai")
+        except ImportError:
+            import pytz
+            _beijing_tz = pytz.timezone("Asia/Shanghai")
+    return _beijing_tz
 
 def get_beijing_time() -> str:
     """获取当前北京时间（高效版）"""
-    return datetime.datetime.now(beijing_tz).strftime('%Y-%m-%d %H:%M:%S')
+    return datetime.datetime.now(get_beijing_tz()).strftime('%Y-%m-%d %H:%M:%S')
 
 def count_valid_lines(file_path: Path) -> int:
     """高效统计有效规则行数"""
@@ -106,36 +115,43 @@ def update_readme(readme_path: Path, counts: Dict[str, int], timestamp: str) ->
             temp_path.unlink()
         return False
 
-def main():
-    """主处理流程"""
-    print("🚀 README更新器启动")
-    print(f"工作目录: {WORKSPACE}")
-    
-    # 获取路径
-    rules_dir = Path(WORKSPACE)
+def refresh_readme(rules_dir: Path) -> bool:
+    """统计规则并更新README - 返回是否成功"""
     readme_path = rules_dir / README_FILE
     
-    # 验证目录
-    if not rules_dir.exists():
-        print(f"❌ 错误: 目录不存在 - {rules_dir}")
-        sys.exit(1)
-    
     # 获取规则计数
     timestamp = get_beijing_time()
-    counts = get_rule_counts(rules_dir)
+    with instrument.stage('readme:count'):
+        counts = get_rule_counts(rules_dir)
     
     # 更新README
-    if update_readme(readme_path, counts, timestamp):
+    with instrument.stage('readme:update'):
+        updated = update_readme(readme_path, counts, timestamp)
+    if updated:
         print(f"✅ 成功更新 {README_FILE}")
         print("=" * 50)
         print(f"更新时间: {timestamp}")
         for name, count in counts.items():
             print(f"{name.capitalize()}规则: {count}")
         print("=" * 50)
-        sys.exit(0)
-    else:
-        print("❌ 更新失败")
+        return True
+    print("❌ 更新失败")
+    return False
+
+def main():
+    """主处理流程"""
+    print("🚀 README更新器启动")
+    print(f"工作目录: {WORKSPACE}")
+    
+    # 获取路径
+    rules_dir = Path(WORKSPACE)
+    
+    # 验证目录
+    if not rules_dir.exists():
+        print(f"❌ 错误: 目录不存在 - {rules_dir}")
         sys.exit(1)
+    
+    sys.exit(0 if refresh_readme(rules_dir) else 1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+紧凑二进制查询产物 (低内存路由器用，mmap 直接查询)
+• 由与 dns.txt 相同的规则集生成（折叠逻辑同 emit.py）: 后缀拦截 / 精确拦截 / 后缀放行三组 64 位域名哈希
+• 布隆过滤器在前，命中后再在有序哈希数组中二分查找；||domain^ 语义按反转后缀逐级查询（com → example.com → ads.example.com）
+• 查询无需解析、不为条目分配对象；加载器只依赖标准库，可单独拷贝本文件到路由器使用
+• dns.bin 不入库（.gitignore，每次构建整体变化）: CI 上传为 Release 附件
+• 用法: python compact.py                       (由 dns.txt 生成 dns.bin)
+        python compact.py check ads.example.com  (查询 dns.bin)
+"""
+
+import math
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from hashlib import blake2b
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# === 配置区 ===
+INPUT_FILE = "dns.txt"            # 根目录输入文件
+OUTPUT_FILE = "dns.bin"           # 根目录输出文件
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+BLOOM_FPR = 0.01                  # 布隆过滤器目标误判率
+FPR_PROBES = 100_000              # 生成后实测误判率的随机探测次数
+
+# === 文件格式 (小端) ===
+# 头部 | 布隆位图 (bloom_bits / 8 字节) | 后缀拦截哈希 u64[] | 精确拦截哈希 u64[] | 后缀放行哈希 u64[]（各组升序）
+MAGIC = b'EASYADSB'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHBxIIIQQ')   # 魔数, 版本, 布隆哈希数k, 后缀拦截数, 精确拦截数, 后缀放行数, 布隆位数, 生成时间
+
+
+def domain_hash(domain: str) -> int:
+    """规范化域名的 64 位哈希"""
+    return int.from_bytes(blake2b(domain.encode(), digest_size=8).digest(), 'little')
+
+
+def bloom_positions(h: int, k: int, bits: int) -> Iterable[int]:
+    """双重哈希: 由一个 64 位哈希派生 k 个位置"""
+    h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+    return ((h1 + i * h2) % bits for i in range(k))
+
+
+def bloom_size(count: int, fpr: float = BLOOM_FPR) -> Tuple[int, int]:
+    """(位数, 哈希数)；位数按 64 对齐，保证其后的 u64 数组对齐"""
+    bits = max(64, math.ceil(-count * math.log(fpr) / math.log(2) ** 2 / 64) * 64)
+    k = max(1, round(bits / max(1, count) * math.log(2)))
+    return bits, min(k, 16)
+
+
+def expected_fpr(bits: int, k: int, count: int) -> float:
+    return (1 - math.exp(-k * count / bits)) ** k
+
+
+def build(suffix: Iterable[str], exact: Iterable[str], allow: Iterable[str], built_at: int = 0) -> bytes:
+    """生成产物字节串"""
+    groups = [sorted({domain_hash(domain) for domain in domains}) for domains in (suffix, exact, allow)]
+    total = sum(len(group) for group in groups)
+    bits, k = bloom_size(total)
+    bloom = bytearray(bits // 8)
+    for group in groups:
+        for h in group:
+            for pos in bloom_positions(h, k, bits):
+                bloom[pos >> 3] |= 1 << (pos & 7)
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, k, *(len(group) for group in groups), bits, built_at), bloom]
+    parts.extend(struct.pack(f'<{len(group)}Q', *group) for group in groups)
+    return b''.join(parts)
+
+
+class _LittleEndianU64(Sequence):
+    """大端主机上的 u64 小端数组视图（按需解码单个元素，供二分查找使用）"""
+
+    def __init__(self, buffer, offset: int, count: int):
+        self.buffer, self.offset, self.count = buffer, offset, count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> int:
+        return struct.unpack_from('<Q', self.buffer, self.offset + index * 8)[0]
+
+
+class CompactIndex:
+    """mmap 加载器: 打开时只校验头部，查询直接读映射内存"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.k, *counts, self.bloom_bits, self.built_at = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"不支持的产物格式: {magic!r} v{version}")
+        view = memoryview(self._mmap)
+        self._bloom = view[HEADER.size:HEADER.size + self.bloom_bits // 8]
+        self.suffix, self.exact, self.allow = self._arrays(view, HEADER.size + self.bloom_bits // 8, counts)
+
+    @staticmethod
+    def _arrays(view: memoryview, offset: int, counts: List[int]) -> List[Sequence[int]]:
+        arrays = []
+        for count in counts:
+            if sys.byteorder == 'little':
+                arrays.append(view[offset:offset + count * 8].cast('Q'))
+            else:
+                arrays.append(_LittleEndianU64(view, offset, count))
+            offset += count * 8
+        return arrays
+
+    def __len__(self) -> int:
+        return len(self.suffix) + len(self.exact) + len(self.allow)
+
+    def close(self):
+        self._bloom.release()
+        for array in (self.suffix, self.exact, self.allow):
+            if isinstance(array, memoryview):
+                array.release()
+        self._mmap.close()
+
+    def __enter__(self) -> 'CompactIndex':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def maybe_contains(self, h: int) -> bool:
+        """布隆过滤器前置判断（False 则必不在任何一组中）"""
+        bloom, bits = self._bloom, self.bloom_bits
+        pos, step = h & 0xFFFFFFFF, (h >> 32) | 1   # 与 bloom_positions 相同的位置序列（内联以省去生成器开销）
+        for _ in range(self.k):
+            bit = pos % bits
+            if not bloom[bit >> 3] & (1 << (bit & 7)):
+                return False
+            pos += step
+        return True
+
+    @staticmethod
+    def _member(array: Sequence[int], h: int) -> bool:
+        i = bisect_left(array, h)
+        return i < len(array) and array[i] == h
+
+    def is_blocked(self, domain: str) -> bool:
+        """模拟单次解析器查询（domain 需已规范化: 小写、无尾点、国际化域名为 punycode）"""
+        blocked = False
+        start = domain.rfind('.') + 1
+        while True:
+            h = domain_hash(domain[start:])
+            if self.maybe_contains(h):  # 由父域到子域逐级查询，最具体的条目生效（同 emit.py 原生格式）
+                if self._member(self.allow, h):
+                    blocked = False
+                elif self._member(self.suffix, h) or (start == 0 and self._member(self.exact, h)):
+                    blocked = True
+            if start == 0:
+                return blocked
+            start = domain.rfind('.', 0, start - 1) + 1
+
+
+def measured_fpr(index: CompactIndex, probes: int = FPR_PROBES) -> float:
+    """随机不存在域名的布隆误判率实测"""
+    hits = sum(1 for i in range(probes) if index.maybe_contains(domain_hash(f"probe-{i}.bloom.invalid")))
+    return hits / probes if probes else 0.0
+
+
+def generate(rules: Optional[Iterable[str]] = None, workspace: str = WORKSPACE) -> Optional[dict]:
+    """由 dns.txt 规则集生成 dns.bin，返回统计（rules为空时读取dns.txt）"""
+    import time
+    from emit import ALLOW, BLOCK, EXACT, collect
+    workspace = Path(workspace)
+    if rules is None:
+        input_path = workspace / INPUT_FILE
+        if not input_path.exists():
+            print(f"❌ 输入文件不存在: {input_path}")
+            return None
+        with open(input_path, 'r', encoding='utf-8') as f:
+            sets = collect(f)
+    else:
+        sets = collect(rules)
+    groups = {BLOCK: [], EXACT: [], ALLOW: []}
+    for domain, kind in sets.collapse():
+        groups[kind].append(domain)
+
+    data = build(groups[BLOCK], groups[EXACT], groups[ALLOW], int(time.time()))
+    output_path = workspace / OUTPUT_FILE
+    temp_path = output_path.with_name(output_path.name + '.tmp')
+    temp_path.write_bytes(data)
+    os.replace(temp_path, output_path)
+
+    with CompactIndex(output_path) as index:
+        stats = {
+            'entries': len(index),
+            'bytes': len(data),
+            'bloom_bits': index.bloom_bits,
+            'bloom_k': index.k,
+            'expected_fpr': expected_fpr(index.bloom_bits, index.k, len(index)),
+            'measured_fpr': measured_fpr(index),
+        }
+    print(f"💾 {OUTPUT_FILE}: {stats['entries']} 条 | {stats['bytes'] / 1024:.0f} KB "
+          f"({stats['bytes'] / max(1, stats['entries']):.1f} 字节/条)")
+    print(f"🌸 布隆过滤器: {stats['bloom_bits'] / 8192:.1f} KB, k={stats['bloom_k']} | "
+          f"误判率 理论 {stats['expected_fpr']:.3%} / 实测 {stats['measured_fpr']:.3%}")
+    return stats
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['check']:
+        with CompactIndex(Path(WORKSPACE) / OUTPUT_FILE) as index:
+            for name in sys.argv[2:]:
+                domain = name.strip().rstrip('.').lower()
+                print(f"{'🚫' if index.is_blocked(domain) else '✅'} {domain}")
+        sys.exit(0)
+    print("🚀 紧凑二进制查询产物生成")
+    print(f"工作目录: {WORKSPACE}")
+    sys.exit(0 if generate() else 1)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+输出产物预压缩 (.gz / .br / .zst) 与清单
+• 每个输出文件生成 gzip / brotli / zstd 三种压缩版本，客户端按需下载
+• 压缩任务 (文件 × 格式) 在线程池中并行执行（各压缩库在压缩时释放 GIL）
+• 清单 manifest.json 记录原文件及各压缩版本的大小与 SHA-256；原文件未变且压缩文件完好时跳过重压缩
+• brotli / zstandard 为可选依赖，未安装时跳过对应格式并删除已过期的旧压缩文件
+• 压缩文件不入库（.gitignore）: CI 上传为 Release 附件，自建分发 (serve.py) 在本地构建时生成
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import instrument
+
+# === 配置区 ===
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+OUTPUT_FILES = (                  # 需要预压缩的根目录输出文件（adb.mrs 已是 zstd 压缩、dns.bin 为哈希数据，均不再处理）
+    'adblock.txt', 'allow.txt', 'dns.txt', 'hosts.txt', 'ads.yaml',
+    'network.txt', 'cosmetic.txt', 'scriptlet.txt',
+    'unbound.conf', 'dnsmasq.conf', 'rpz.zone', 'smartdns.conf',
+)
+MANIFEST_FILE = "manifest.json"   # 根目录清单文件
+MAX_WORKERS = 4                   # 并行压缩线程数
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+ZSTD_LEVEL = 19
+
+
+def _gzip(data: bytes) -> bytes:
+    import gzip
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)  # 固定时间戳，内容不变时压缩结果不变
+
+
+def _brotli(data: bytes) -> bytes:
+    import brotli
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def _zstd(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+CODECS: Dict[str, Tuple[str, Callable[[bytes], bytes]]] = {  # 扩展名 → (依赖模块, 压缩函数)
+    'gz': ('gzip', _gzip),
+    'br': ('brotli', _brotli),
+    'zst': ('zstandard', _zstd),
+}
+
+
+def available_codecs() -> List[str]:
+    """已安装依赖的压缩格式"""
+    import importlib.util
+    return [ext for ext, (module, _) in CODECS.items() if importlib.util.find_spec(module) is not None]
+
+
+def sha256(data: bytes) -> str:
+    from hashlib import sha256 as _sha256
+    return _sha256(data).hexdigest()
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def up_to_date(path: Path, record: Optional[dict]) -> bool:
+    """压缩文件存在且与清单记录一致（大小 + 校验和）"""
+    if not record or not path.exists() or path.stat().st_size != record.get('bytes'):
+        return False
+    return sha256(path.read_bytes()) == record.get('sha256')
+
+
+def compress_file(source: Path, ext: str) -> dict:
+    """压缩单个文件（先写临时文件再原子替换）"""
+    data = CODECS[ext][1](source.read_bytes())
+    target = source.with_name(f"{source.name}.{ext}")
+    temp = target.with_name(target.name + '.tmp')
+    temp.write_bytes(data)
+    os.replace(temp, target)
+    return {'bytes': len(data), 'sha256': sha256(data)}
+
+
+def compress_outputs(workspace: str = WORKSPACE, files: Tuple[str, ...] = OUTPUT_FILES,
+                     workers: int = MAX_WORKERS) -> Dict[str, dict]:
+    """并行预压缩全部输出文件并更新清单，返回清单中的文件记录"""
+    import concurrent.futures
+    workspace = Path(workspace)
+    manifest_path = workspace / MANIFEST_FILE
+    previous = load_manifest(manifest_path).get('files', {})
+    codecs = available_codecs()
+    for ext in CODECS:
+        if ext not in codecs:
+            print(f"⚠️ 未安装 {CODECS[ext][0]}，跳过 .{ext} 压缩")
+
+    records: Dict[str, dict] = {}
+    tasks = {}
+    reused = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for name in files:
+            source = workspace / name
+            if not source.exists():
+                continue
+            data = source.read_bytes()
+            record = {'bytes': len(data), 'sha256': sha256(data), 'variants': {}}
+            records[name] = record
+            old = previous.get(name, {})
+            unchanged = old.get('sha256') == record['sha256']
+            for ext in CODECS:
+                target = source.with_name(f"{name}.{ext}")
+                old_variant = old.get('variants', {}).get(ext)
+                if unchanged and up_to_date(target, old_variant):
+                    record['variants'][ext] = old_variant
+                    reused += 1
+                elif ext in codecs:
+                    tasks[pool.submit(compress_file, source, ext)] = (name, ext)
+                elif target.exists():
+                    target.unlink()  # 无法更新的旧压缩文件与原文件不再对应
+        with instrument.stage('compress:pool'):
+            for future in concurrent.futures.as_completed(tasks):
+                name, ext = tasks[future]
+                records[name]['variants'][ext] = future.result()
+    instrument.count('compress.jobs', len(tasks))
+
+    manifest = {'generated': int(time.time()), 'files': records}
+    temp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+
+    for name, record in records.items():
+        sizes = " | ".join(f".{ext} {variant['bytes'] / 1024:.0f}KB ({variant['bytes'] / max(1, record['bytes']):.0%})"
+                           for ext, variant in record['variants'].items())
+        print(f"🗜️ {name}: {record['bytes'] / 1024:.0f}KB → {sizes}")
+    print(f"💾 {MANIFEST_FILE}: {len(records)} 个文件 | 压缩任务 {len(tasks)} 个 | 未变化复用 {reused} 个")
+    return records
+
+
+if __name__ == "__main__":
+    print("🚀 输出产物预压缩")
+    print(f"工作目录: {WORKSPACE}")
+    sys.exit(0 if compress_outputs() else 1)
@@ -3,18 +3,52 @@ import concurrent.futures
 import requests
 import shutil
 import time
+import zlib
 from glob import glob
 
+import instrument
+
 # 高性能路径处理
 WORKSPACE = os.getenv('WORKSPACE', os.getcwd())
 TEMP_DIR = os.path.join(WORKSPACE, "tmp")
 DATA_MOD_DIR = os.path.join(WORKSPACE, "data", "mod")
+LAST_GOOD_DIR = os.path.join(WORKSPACE, "data", "cache", "sources")  # 各源上次下载成功的副本（不入库，CI 经 Actions 缓存跨运行保留）
+
+# === 规则源 ===
+ADBLOCK_SOURCES = [
+    "https://raw.githubusercontent.com/damengzhu/banad/main/jiekouAD.txt",
+    "https://raw.githubusercontent.com/afwfv/DD-AD/main/rule/DD-AD.txt",
+    "https://raw.hellogithub.com/hosts",
+    "https://raw.githubusercontent.com/790953214/qy-Ads-Rule/main/black.txt",
+    "https://raw.githubusercontent.com/2771936993/HG/main/hg1.txt",
+    "https://github.com/entr0pia/fcm-hosts/raw/fcm/fcm-hosts",
+    "https://raw.githubusercontent.com/TG-Twilight/AWAvenue-Ads-Rule/main/AWAvenue-Ads-Rule.txt",
+    "https://raw.githubusercontent.com/TG-Twilight/AWAvenue-Ads-Rule/main/Filters/AWAvenue-Ads-Rule-Replenish.txt",
+    "https://raw.githubusercontent.com/2Gardon/SM-Ad-FuckU-hosts/master/SMAdHosts",
+    "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/main/FuLingRules/FuLingBlockList.txt"
+]
+
+ALLOW_SOURCES = [
+    "https://raw.githubusercontent.com/qq5460168/dangchu/main/white.txt",
+    "https://raw.githubusercontent.com/mphin/AdGuardHomeRules/main/Allowlist.txt",
+    "https://file-git.trli.club/file-hosts/allow/Domains",
+    "https://raw.githubusercontent.com/jhsvip/ADRuls/main/white.txt",
+    "https://raw.githubusercontent.com/liwenjie119/adg-rules/master/white.txt",
+    "https://raw.githubusercontent.com/miaoermua/AdguardFilter/main/whitelist.txt",
+    "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/main/FuLingRules/FuLingAllowList.txt",
+    "https://raw.githubusercontent.com/Cats-Team/AdRules/script/script/allowlist.txt",
+    "https://raw.githubusercontent.com/user001235/112/main/white.txt",
+    "https://raw.githubusercontent.com/urkbio/adguardhomefilter/main/whitelist.txt",
+    "https://anti-ad.net/easylist.txt"
+]
 
-def clean_files():
-    """极速清理根目录下的.txt和.mrs文件"""
+def clean_files(workspace=WORKSPACE, keep=()):
+    """极速清理根目录下的.txt和.mrs文件（keep 中的文件名保留，供本次跳过重新生成时沿用）"""
     deleted = 0
     for ext in ("*.txt", "*.mrs"):
-        for file_path in glob(os.path.join(WORKSPACE, ext)):
+        for file_path in glob(os.path.join(workspace, ext)):
+            if os.path.basename(file_path) in keep:
+                continue
             try:
                 os.remove(file_path)
                 deleted += 1
@@ -22,15 +56,22 @@ def clean_files():
                 pass  # 静默失败
     print(f"清理完成: {deleted}文件")
 
-def create_temp_dir():
+def create_temp_dir(temp_dir=TEMP_DIR, mod_dir=DATA_MOD_DIR):
     """原子性创建临时目录并复制关键文件"""
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    shutil.copy2(os.path.join(DATA_MOD_DIR, "adblock.txt"), os.path.join(TEMP_DIR, "adblock01.txt"))
-    shutil.copy2(os.path.join(DATA_MOD_DIR, "whitelist.txt"), os.path.join(TEMP_DIR, "allow01.txt"))
+    os.makedirs(temp_dir, exist_ok=True)
+    shutil.copy2(os.path.join(mod_dir, "adblock.txt"), os.path.join(temp_dir, "adblock01.txt"))
+    shutil.copy2(os.path.join(mod_dir, "whitelist.txt"), os.path.join(temp_dir, "allow01.txt"))
 
-def download_file(url, filename):
-    """高性能下载函数（带智能重试）"""
+def last_good_path(url, last_good_dir=LAST_GOOD_DIR):
+    """源URL对应的上次成功副本路径（按URL哈希命名，源列表调整顺序后仍能对应）"""
+    return os.path.join(last_good_dir, f"{zlib.crc32(url.encode()):08x}.txt")
+
+def download_file(url, filename, deadline=None):
+    """高性能下载函数（带智能重试；deadline 为 time.monotonic() 截止时间，超过后不再发起请求、不再写入）"""
     for attempt in range(3):  # 最多重试3次
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"⏰ 已到下载截止时间 [{url}]")
+            return False
         try:
             # 极简请求配置
             response = requests.get(
@@ -39,71 +80,65 @@ def download_file(url, filename):
                 timeout=(2, 4)  # 激进超时: 连接2秒, 读取4秒
             )
             response.raise_for_status()
+            if deadline is not None and time.monotonic() >= deadline:
+                print(f"⏰ 截止时间后才完成下载，改用上次成功副本 [{url}]")
+                return False
             
-            # 直接写入文件避免内存占用
-            with open(filename, 'wb') as f:
+            # 先写临时文件再原子替换，避免读到半个文件
+            with open(filename + '.part', 'wb') as f:
                 f.write(response.content)
+            os.replace(filename + '.part', filename)
+            instrument.count('dl.files')
+            instrument.count('dl.bytes_read', len(response.content))
                 
             return True
         except requests.RequestException as e:
+            instrument.count('dl.errors')
             if attempt < 2:  # 前两次失败等待1秒重试
                 time.sleep(1)
             else:
                 print(f"最终失败 [{url}]: {type(e).__name__}")
     return False
 
-def download_rules():
-    """规则下载主函数（智能并发控制）"""
-    # 保留全部规则源
-    ADBLOCK_SOURCES = [
-        "https://raw.githubusercontent.com/damengzhu/banad/main/jiekouAD.txt",
-        "https://raw.githubusercontent.com/afwfv/DD-AD/main/rule/DD-AD.txt",
-        "https://raw.hellogithub.com/hosts",
-        "https://raw.githubusercontent.com/790953214/qy-Ads-Rule/main/black.txt",
-        "https://raw.githubusercontent.com/2771936993/HG/main/hg1.txt",
-        "https://github.com/entr0pia/fcm-hosts/raw/fcm/fcm-hosts",
-        "https://raw.githubusercontent.com/TG-Twilight/AWAvenue-Ads-Rule/main/AWAvenue-Ads-Rule.txt",
-        "https://raw.githubusercontent.com/TG-Twilight/AWAvenue-Ads-Rule/main/Filters/AWAvenue-Ads-Rule-Replenish.txt",
-        "https://raw.githubusercontent.com/2Gardon/SM-Ad-FuckU-hosts/master/SMAdHosts",
-        "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/main/FuLingRules/FuLingBlockList.txt"
-    ]
-    
-    ALLOW_SOURCES = [
-        "https://raw.githubusercontent.com/qq5460168/dangchu/main/white.txt",
-        "https://raw.githubusercontent.com/mphin/AdGuardHomeRules/main/Allowlist.txt",
-        "https://file-git.trli.club/file-hosts/allow/Domains",
-        "https://raw.githubusercontent.com/jhsvip/ADRuls/main/white.txt",
-        "https://raw.githubusercontent.com/liwenjie119/adg-rules/master/white.txt",
-        "https://raw.githubusercontent.com/miaoermua/AdguardFilter/main/whitelist.txt",
-        "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/main/FuLingRules/FuLingAllowList.txt",
-        "https://raw.githubusercontent.com/Cats-Team/AdRules/script/script/allowlist.txt",
-        "https://raw.githubusercontent.com/user001235/112/main/white.txt",
-        "https://raw.githubusercontent.com/urkbio/adguardhomefilter/main/whitelist.txt",
-        "https://anti-ad.net/easylist.txt"
-    ]
-    
+def download_rules(adblock_sources=ADBLOCK_SOURCES, allow_sources=ALLOW_SOURCES, temp_dir=TEMP_DIR,
+                   deadline=None, last_good_dir=LAST_GOOD_DIR, restored=None):
+    """
+    规则下载主函数（智能并发控制）
+    • 下载成功的源另存为上次成功副本；失败或超过 deadline 的源改用上次成功副本（文件名追加到 restored）
+    • 返回本次下载成功的源数量
+    """
     # 智能并发控制：根据源数量动态调整
-    max_workers = min(8, len(ADBLOCK_SOURCES) + len(ALLOW_SOURCES))
-    print(f"并发下载: {max_workers}线程 | 拦截规则:{len(ADBLOCK_SOURCES)} 白名单:{len(ALLOW_SOURCES)}")
+    max_workers = min(8, len(adblock_sources) + len(allow_sources))
+    print(f"并发下载: {max_workers}线程 | 拦截规则:{len(adblock_sources)} 白名单:{len(allow_sources)}")
     
     success_count = 0
     start_time = time.time()
     
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         # 批量提交任务
-        futures = []
-        for i, url in enumerate(ADBLOCK_SOURCES, 2):
-            filepath = os.path.join(TEMP_DIR, f"adblock{i:02d}.txt")
-            futures.append(executor.submit(download_file, url, filepath))
+        futures = {}
+        for i, url in enumerate(adblock_sources, 2):
+            filepath = os.path.join(temp_dir, f"adblock{i:02d}.txt")
+            futures[executor.submit(download_file, url, filepath, deadline)] = (url, filepath)
             
-        for i, url in enumerate(ALLOW_SOURCES, 2):
-            filepath = os.path.join(TEMP_DIR, f"allow{i:02d}.txt")
-            futures.append(executor.submit(download_file, url, filepath))
+        for i, url in enumerate(allow_sources, 2):
+            filepath = os.path.join(temp_dir, f"allow{i:02d}.txt")
+            futures[executor.submit(download_file, url, filepath, deadline)] = (url, filepath)
         
         # 流式处理结果
+        os.makedirs(last_good_dir, exist_ok=True)
         for future in concurrent.futures.as_completed(futures):
+            url, filepath = futures[future]
+            backup = last_good_path(url, last_good_dir)
             if future.result():
                 success_count += 1
+                shutil.copyfile(filepath, backup)
+            elif os.path.exists(backup):
+                shutil.copyfile(backup, filepath)
+                instrument.count('dl.last_good')
+                if restored is not None:
+                    restored.append(os.path.basename(filepath))
+                print(f"♻️ 沿用上次成功副本: {os.path.basename(filepath)} [{url}]")
     
     total_time = time.time() - start_time
     print(f"下载完成: {success_count}/{len(futures)} 成功 | 耗时 {total_time:.1f}秒")
@@ -117,9 +152,11 @@ if __name__ == "__main__":
     global_start = time.time()
     
     # 执行核心流程
-    clean_files()
-    create_temp_dir()
-    success_count = download_rules()
+    with instrument.stage('clean'):
+        clean_files()
+        create_temp_dir()
+    with instrument.stage('download'):
+        success_count = download_rules()
     
     # 最终状态报告
     total_time = time.time() - global_start
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+域名规范化公共模块
+• normalize_domain(): 大小写折叠 | 去除末尾点 | IDNA(punycode) 编码 | 标签校验
+• 有界 LRU 缓存: 各上游规则源大量重复同一批域名，每个域名只规范化一次
+• 结果经 sys.intern 驻留: 合并/DNS/Hosts 各阶段集合共享同一字符串对象
+• label_key(): 按反转标签排序的键（同一父域下的域名在输出中相邻，利于压缩）
+• 国际化域名优先使用 idna 包 (IDNA 2008 / UTS46)，未安装时回退到标准库 idna 编解码器 (IDNA 2003)
+"""
+
+import re
+import sys
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# === 配置区 ===
+DOMAIN_CACHE_SIZE = 1 << 18   # 规范化结果 LRU 缓存上限
+MAX_DOMAIN_LENGTH = 253       # 域名总长度上限（不含末尾点）
+
+# 单个标签: 1-63 个 [a-z0-9_-]（规则源中常见 _dmarc 等下划线标签，予以保留）
+DOMAIN_LABELS = re.compile(r'(?:[a-z0-9_-]{1,63}\.)*[a-z0-9_-]{1,63}')
+
+
+def _to_ascii(domain: str) -> Optional[str]:
+    """国际化域名 → 小写 punycode（xn--），无法编码时返回 None"""
+    try:
+        try:
+            import idna  # 可选依赖，仅在遇到非ASCII域名时加载
+        except ImportError:
+            return domain.encode('idna').decode('ascii').lower()
+        return idna.encode(domain, uts46=True).decode('ascii').lower()
+    except (UnicodeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def normalize_domain(domain: str) -> Optional[str]:
+    """
+    域名规范形式（小写 ASCII / punycode，无末尾点），非法域名返回 None
+    • Bücher.DE. → xn--bcher-kva.de
+    • 空标签、超长标签/域名、非法字符均视为非法
+    """
+    if domain.endswith('.'):
+        domain = domain[:-1]
+    if domain.isascii():
+        domain = domain.lower()
+    else:
+        domain = _to_ascii(domain)  # UTS46 / nameprep 映射自带大小写折叠
+        if domain is None:
+            return None
+    if len(domain) > MAX_DOMAIN_LENGTH or not DOMAIN_LABELS.fullmatch(domain):
+        return None
+    return sys.intern(domain)
+
+
+def label_key(domain: str) -> Tuple[str, ...]:
+    """反转标签排序键: ads.example.com → ('com', 'example', 'ads')"""
+    return tuple(reversed(domain.split('.')))
+
+
+def clear_cache():
+    """清空规范化缓存（基准测试冷启动用）"""
+    normalize_domain.cache_clear()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+解析器原生格式输出 (unbound / dnsmasq / BIND RPZ / smartdns)
+• 一次解析 dns.txt 得到域名集合，单遍流式写出全部格式，解析器启动时无需再解析 Hosts/AdGuard 语法
+• ||domain^ / 纯域名 / *.domain → 后缀拦截 | Hosts行(拦截地址) → 精确拦截 | @@||domain^ → 放行
+• 各格式均为原生后缀语义（最具体的条目生效）: 按 AdGuard 优先级判定后，仅输出与上级判定不同的条目
+• 优先级: $important 例外 > $important 拦截 > 例外 > 拦截（important 拦截不被普通例外放行）
+• 正则、带修饰符（$important 除外）的规则无原生等价，跳过并计数
+• 输入: 根目录/dns.txt
+• 输出: 根目录/unbound.conf, dnsmasq.conf, rpz.zone, smartdns.conf
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import instrument
+from domains import label_key, normalize_domain
+from rules import BLOCK_IPS, KIND_COMMENT, KIND_DOMAIN, KIND_HOSTS, KIND_PLAIN, KIND_WILDCARD, MOD_IMPORTANT, tokenize
+
+# === 配置区 ===
+INPUT_FILE = "dns.txt"            # 根目录输入文件
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+EXACT_AS_SUFFIX = False           # 无精确匹配语义的格式(dnsmasq/smartdns)是否将 Hosts 精确规则按后缀输出（会连带拦截子域）
+RPZ_TTL = 300                     # RPZ 区域默认TTL（秒）
+
+BLOCK, EXACT, ALLOW = 0, 1, 2     # 条目类型: 后缀拦截 / 精确拦截 / 后缀放行
+
+
+class Emitter(NamedTuple):
+    """输出格式: 每类条目一个模板（{d} 为域名；exact 为 None 表示该格式无精确匹配语义）"""
+    filename: str
+    comment: str
+    preamble: Tuple[str, ...]
+    block: str
+    exact: Optional[str]
+    allow: str
+
+
+EMITTERS: Dict[str, Emitter] = {
+    'unbound': Emitter(
+        'unbound.conf', '#', ('server:',),
+        '    local-zone: "{d}." always_nxdomain',
+        '    local-data: "{d}. A 0.0.0.0"\n    local-data: "{d}. AAAA ::"',
+        '    local-zone: "{d}." transparent'),
+    'dnsmasq': Emitter(
+        'dnsmasq.conf', '#', (),
+        'address=/{d}/#', None,
+        'server=/{d}/#'),
+    'rpz': Emitter(
+        'rpz.zone', ';',
+        (f'$TTL {RPZ_TTL}', '@ IN SOA localhost. root.localhost. {serial} 3600 600 86400 300', '@ IN NS localhost.'),
+        '{d} CNAME .\n*.{d} CNAME .', '{d} CNAME .',
+        '{d} CNAME rpz-passthru.\n*.{d} CNAME rpz-passthru.'),
+    'smartdns': Emitter(
+        'smartdns.conf', '#', (),
+        'address /{d}/#', None,
+        'address /{d}/-'),
+}
+
+
+class DomainSets:
+    """dns.txt 中可原生表达的域名集合"""
+
+    def __init__(self):
+        self.block: Set[str] = set()   # 后缀拦截
+        self.exact: Set[str] = set()   # 精确拦截（Hosts 行）
+        self.allow: Set[str] = set()   # 后缀放行
+        self.important: Set[str] = set()        # $important 后缀拦截（优先于普通例外）
+        self.important_allow: Set[str] = set()  # $important 后缀放行（最优先）
+        self.skipped = 0               # 无原生等价的规则数
+        self.folded = 0                # 折叠 / 被覆盖而省去的条目数
+
+    def add_rule(self, rule: str):
+        """按规则语义归类（与 matcher.DomainMatcher.load_adguard 一致）"""
+        kind, exception, start, end, pattern_end, modifiers, _ = tokenize(rule)
+        if kind == KIND_COMMENT:
+            return
+        if kind == KIND_HOSTS:
+            domain = normalize_domain(rule[start:end]) if end == len(rule) else None
+            if domain is None or rule.split(None, 1)[0] not in BLOCK_IPS:
+                self.skipped += 1
+            else:
+                self.exact.add(domain)
+            return
+        if (kind not in (KIND_DOMAIN, KIND_PLAIN, KIND_WILDCARD) or modifiers & ~MOD_IMPORTANT
+                or rule[end:pattern_end] not in ('', '^')):
+            self.skipped += 1
+            return
+        domain = normalize_domain(rule[start:end])
+        if domain is None:
+            self.skipped += 1
+        elif modifiers & MOD_IMPORTANT:
+            (self.important_allow if exception else self.important).add(domain)
+        else:
+            (self.allow if exception else self.block).add(domain)
+
+    def blocked(self, domain: str) -> bool:
+        """按 AdGuard 优先级判定域名是否被后缀规则拦截"""
+        if covered(domain, self.important_allow):
+            return False
+        if covered(domain, self.important):
+            return True
+        return covered(domain, self.block) and not covered(domain, self.allow)
+
+    def collapse(self) -> List[Tuple[str, int]]:
+        """
+        折叠为原生后缀语义（最具体的条目生效）下的最小条目集（按反转标签排序）
+        • 后缀: 父域在前逐个判定，仅当判定与最近的已输出上级条目不同时输出拦截 / 放行
+        • 精确拦截: 已被后缀拦截或任一放行覆盖的省去
+        """
+        entries = []
+        decided: Dict[str, bool] = {}  # 已输出的后缀条目 → 是否拦截
+        for domain in sorted(self.block | self.allow | self.important | self.important_allow, key=label_key):
+            blocked = self.blocked(domain)
+            if blocked != inherited(domain, decided):
+                decided[domain] = blocked
+                entries.append((domain, BLOCK if blocked else ALLOW))
+        for domain in self.exact:
+            if not (self.blocked(domain) or covered(domain, self.allow) or covered(domain, self.important_allow)):
+                entries.append((domain, EXACT))
+        self.folded = (len(self.block) + len(self.allow) + len(self.important) + len(self.important_allow)
+                       + len(self.exact) - len(entries))
+        entries.sort(key=lambda entry: (label_key(entry[0]), entry[1]))
+        return entries
+
+
+def under(domain: str, zones: Set[str]) -> bool:
+    """任一上级域（不含自身）在集合中"""
+    parent = domain.partition('.')[2]
+    while parent:
+        if parent in zones:
+            return True
+        parent = parent.partition('.')[2]
+    return False
+
+
+def covered(domain: str, zones: Set[str]) -> bool:
+    """自身或任一上级域在集合中"""
+    return domain in zones or under(domain, zones)
+
+
+def inherited(domain: str, decided: Dict[str, bool]) -> bool:
+    """最近的已输出上级条目（不含自身）的判定，无上级条目时为不拦截"""
+    parent = domain.partition('.')[2]
+    while parent:
+        if parent in decided:
+            return decided[parent]
+        parent = parent.partition('.')[2]
+    return False
+
+
+def collect(lines: Iterable[str]) -> DomainSets:
+    sets = DomainSets()
+    for line in lines:
+        if rule := line.strip():
+            sets.add_rule(rule)
+    return sets
+
+
+def header(emitter: Emitter, counts: Dict[int, int], skipped: int, timestamp: str) -> List[str]:
+    c = emitter.comment
+    lines = [
+        f"{c} Title: EasyAds ({emitter.filename})",
+        f"{c} Homepage: https://github.com/045200/EasyAds",
+        f"{c} Version: {timestamp}（北京时间）",
+        f"{c} Blocked suffixes: {counts[BLOCK]} | Exact: {counts[EXACT]} | Allowed: {counts[ALLOW]}",
+    ]
+    if skipped:
+        lines.append(f"{c} Skipped (no native equivalent): {skipped}")
+    serial = int(time.time())
+    return lines + [line.format(serial=serial) for line in emitter.preamble]
+
+
+def write_all(sets: DomainSets, workspace: Path, formats: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """单遍写出全部格式，返回 文件名 → 条目数"""
+    from title import get_beijing_time
+    emitters = [EMITTERS[name] for name in (formats or EMITTERS)]
+    entries = sets.collapse()
+    totals = {BLOCK: 0, EXACT: 0, ALLOW: 0}
+    for _, kind in entries:
+        totals[kind] += 1
+    timestamp = get_beijing_time()
+
+    outputs = []
+    try:
+        for emitter in emitters:
+            exact = emitter.exact or (emitter.block if EXACT_AS_SUFFIX else None)
+            templates = {BLOCK: emitter.block + '\n', EXACT: exact and exact + '\n', ALLOW: emitter.allow + '\n'}
+            counts = dict(totals)
+            skipped = sets.skipped
+            if exact is None:
+                skipped += counts[EXACT]
+                counts[EXACT] = 0
+            elif emitter.exact is None:
+                counts[BLOCK] += counts.pop(EXACT)
+                counts[EXACT] = 0
+            path = workspace / emitter.filename
+            f = open(path.with_name(path.name + '.tmp'), 'w', encoding='utf-8')
+            outputs.append((f, path, templates, counts))
+            f.write('\n'.join(header(emitter, counts, skipped, timestamp)) + '\n')
+
+        for domain, kind in entries:
+            for f, _, templates, _ in outputs:
+                if template := templates[kind]:
+                    f.write(template.format(d=domain))
+    finally:
+        for f, _, _, _ in outputs:
+            f.close()
+    for f, path, _, _ in outputs:
+        os.replace(f.name, path)
+    return {path.name: sum(counts.values()) for _, path, _, counts in outputs}
+
+
+def generate(rules: Optional[Iterable[str]] = None, workspace: str = WORKSPACE,
+             formats: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """生成原生格式文件（rules为空时读取dns.txt）"""
+    workspace = Path(workspace)
+    with instrument.stage('emit:collect'):
+        if rules is None:
+            input_path = workspace / INPUT_FILE
+            if not input_path.exists():
+                print(f"❌ 输入文件不存在: {input_path}")
+                return {}
+            with open(input_path, 'r', encoding='utf-8') as f:
+                sets = collect(f)
+        else:
+            sets = collect(rules)
+    with instrument.stage('emit:write'):
+        written = write_all(sets, workspace, formats)
+    instrument.count('emit.folded', sets.folded)
+    instrument.count('emit.skipped', sets.skipped)
+    for filename, count in written.items():
+        print(f"💾 {filename}: {count} 条")
+    print(f"🪢 折叠/覆盖省去: {sets.folded} 条 | 无原生等价跳过: {sets.skipped} 条")
+    return written
+
+
+if __name__ == "__main__":
+    print("🚀 解析器原生格式输出")
+    print(f"工作目录: {WORKSPACE}")
+    sys.exit(0 if generate(formats=sys.argv[1:] or None) else 1)
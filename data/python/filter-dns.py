@@ -2,6 +2,8 @@
 """
 高效黑名单处理器 - GitHub Actions 优化版
 支持完整 AdGuard Home 语法 | 特殊语法跳过验证 | 极速 DNS 验证
+分片验证: python filter-dns.py --shard i/N   (按域名哈希只验证第 i 片，结果写入分片目录)
+          python filter-dns.py --merge-shards N (合并 N 个分片结果，生成 dns.txt / hosts.txt)
 """
 
 # ======================
@@ -10,9 +12,24 @@
 INPUT_FILE = "adblock.txt"         # 输入文件（仓库根目录）
 OUTPUT_ADGUARD = "dns.txt"         # AdGuard输出（仓库根目录）
 OUTPUT_HOSTS = "hosts.txt"         # Hosts输出（仓库根目录）
+ALLOWLIST_FILE = "allow.txt"       # 白名单（仓库根目录，泛解析区合并时含白名单条目的区不合并）
+OUTPUT_FAMILIES = {                # 非DNS规则族分流输出（仓库根目录）
+    "network": "network.txt",      # URL路径 / 请求类修饰符规则
+    "cosmetic": "cosmetic.txt",    # 元素隐藏规则
+    "scriptlet": "scriptlet.txt",  # 脚本注入规则
+}
 MAX_WORKERS = 6                    # 优化线程数（GitHub Actions 推荐）
 TIMEOUT = 1.5                      # DNS查询超时（1.5秒）
+MAX_CONCURRENT_QUERIES = 64        # 并发DNS验证上限（各上游另有令牌桶限速）
+RETRY_ROUNDS = 2                   # 暂时失败（SERVFAIL/超时）的重试轮数
+RETRY_BACKOFF = 1.0                # 首轮重试前等待（秒，逐轮翻倍）
+ZONE_PROBE_MIN_HOSTS = 2           # 同一可注册域下待验证域名达到该数量时，先探测可注册域
+WILDCARD_PROBE_MIN_HOSTS = 3       # 同一父域下待验证域名达到该数量时，探测父域是否泛解析
+WILDCARD_FOLD = False              # 是否将泛解析区内的成批子域规则合并为一条后缀规则（仅限可注册域以下的区）
+WILDCARD_FOLD_MIN_HOSTS = 20       # 合并为后缀规则所需的最少子域规则数
 DNS_VALIDATION = True              # DNS验证开关
+RULE_AGING = True                  # 规则老化存储（稳定规则免验证、失效宽限期，见 aging.py）
+SHARD_DIR = "tmp/dns-shards"       # 分片验证结果目录（相对工作区）
 BATCH_SIZE = 10000                 # 分批处理大小（内存优化）
 
 # ======================
@@ -22,31 +39,40 @@ import os
 import sys
 import re
 import time
+import gzip
+import zlib
+import random
 import logging
-import concurrent.futures
-import asyncio
-import aiodns
+import argparse
+from collections import Counter, defaultdict
 from pathlib import Path
-from typing import Tuple, Optional, List, Set, Iterator
+from typing import Tuple, Optional, List, Set, Iterable, Iterator
 
-# 预编译正则表达式 - 提升性能
-ADG_SPECIAL = re.compile(r'^!|^\$|^@@|^/.*/$|^\|\|.*\^|\*\.|^\|\|.*/|^\|http?://|^##|^#\?#|^\?|\|\|.*\^\$')
-ADG_DOMAIN = re.compile(r'^\|\|([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\^|\$)|^([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\$|^\*\.([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(\^|\$)')
-HOSTS_RULE = re.compile(r'^\s*(\d+\.\d+\.\d+\.\d+)\s+([^\s#]+)')
-COMMENT_RULE = re.compile(r'^[!#]|^\[Adblock')
-EXCEPTION_RULE = re.compile(r'^@@')
+import instrument
+from aging import AGING_DB, AgingStore
+from domains import normalize_domain
+from psl import registrable_domain
+from resolver import RESULT_FOUND, RESULT_NODATA, RESULT_NXDOMAIN, RESULT_TRANSIENT, ResolverPool
+from rules import (FAMILY_DNS, KIND_COMMENT, KIND_DOMAIN, KIND_HOSTS, KIND_PLAIN, Token,
+                   canonical_form, order_key, token_family, tokenize)
 
-# 初始化日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
-logger = logging.getLogger(__name__)
+# 预编译正则表达式 - 提升性能（匹配规范化后的域名，顶级域可为 punycode）
+HOST_DOMAIN = instrument.pattern('dns.host_domain', re.compile(r'[a-z0-9.-]+\.(?:[a-z]{2,}|xn--[a-z0-9-]+)'))
+
+# 日志（处理器在入口处配置，导入本模块无副作用）
+logger = logging.getLogger("filter-dns")
 logger.setLevel(logging.INFO)
 
+def setup_logging():
+    """初始化日志输出"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+
 class DNSValidator:
-    """高性能异步DNS验证器"""
+    """高性能异步DNS验证器（多上游对冲查询 + 暂时失败重试队列 + 可注册域 NXDOMAIN 短路 + 泛解析区识别）"""
     DNS_SERVERS = [
         "223.5.5.5",        # 阿里DNS（亚洲）
         "119.29.29.29",     # 腾讯DNS（亚洲）
@@ -54,122 +80,401 @@ class DNSValidator:
         "8.8.8.8",          # Google DNS（全球）
     ]
     
-    def __init__(self):
-        self.resolver = None
+    def __init__(self, servers: Optional[List[str]] = None, deadline: Optional[float] = None):
+        self.servers = list(servers or self.DNS_SERVERS)
+        self.pool = None
+        self.deadline = deadline    # time.monotonic() 截止时间: 之后不再发起新查询，未缓存的域名按有效保留
+        self.deadline_skipped = 0   # 因超过截止时间未查询、按有效保留的域名数
         self.valid_cache = set()
         self.invalid_cache = set()
+        self.retried = 0        # 进入重试队列的查询次数
+        self.unresolved = set()  # 重试耗尽仍未确认、按有效保留的域名
+        self.checked_at = {}    # 域名 → 得出结论的时间戳（写入分片结果）
+        self.zones = {}         # 可注册域 → 是否存在（NXDOMAIN 为 False）
+        self.zone_probes = 0    # 可注册域探测查询次数
+        self.zone_skipped = 0   # 因可注册域不存在而免于查询的域名数
+        self.wildcards = {}     # 父域 → 是否泛解析（随机不存在标签可解析）
+        self.wildcard_probes = 0
+        self.wildcard_skipped = 0   # 位于泛解析区、免于逐个查询的域名数
+        self.wildcard_checked = {}  # 父域 → 泛解析探测时间（写入老化存储）
+        self.aging: Optional[AgingStore] = None   # 老化存储（复用仍在有效期内的结论）
         
     async def setup(self):
-        """初始化异步解析器"""
-        loop = asyncio.get_running_loop()
-        self.resolver = aiodns.DNSResolver(loop=loop, timeout=TIMEOUT)
-        # 随机化服务器列表
-        self.resolver.nameservers = self.DNS_SERVERS.copy()
-        random.shuffle(self.resolver.nameservers)
+        """初始化解析器池（仅在开启DNS验证时加载 aiodns）"""
+        self.pool = ResolverPool(self.servers, TIMEOUT)
+        await self.pool.setup()
+    
+    async def close(self):
+        """释放解析器池（报告统计仍保留在上游对象中）"""
+        if self.pool is not None:
+            await self.pool.close()
     
-    async def is_valid_domain(self, domain: str) -> bool:
-        """验证域名有效性"""
+    def past_deadline(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+    
+    async def check_domain(self, domain: str) -> Optional[bool]:
+        """验证域名有效性: True 存在 | False 不存在 (NXDOMAIN/NODATA) | None 暂时失败"""
         # 检查缓存
         if domain in self.valid_cache:
+            instrument.count('dns.cache_hits')
             return True
         if domain in self.invalid_cache:
+            instrument.count('dns.cache_hits')
             return False
             
-        # 异步DNS查询
-        try:
-            await self.resolver.query(domain, 'A')
+        # 可注册域不存在时，其下所有域名必然不存在（RFC 8020），无需查询
+        zone = registrable_domain(domain)
+        if self.zones.get(zone) is False:
+            self.zone_skipped += 1
+            instrument.count('dns.zone_skipped')
+            self.invalid_cache.add(domain)
+            return False
+        
+        # 泛解析区内任何名称都可解析，逐个查询无法证明规则有效
+        if zone is not None and self.wildcard_parent(domain, zone):
+            self.wildcard_skipped += 1
+            instrument.count('dns.wildcard_skipped')
+            self.valid_cache.add(domain)
+            return True
+            
+        # 超过截止时间: 只信任已有结论，不再发起查询（按暂时失败处理，规则保留）
+        if self.past_deadline():
+            self.deadline_skipped += 1
+            instrument.count('dns.deadline_skipped')
+            return None
+            
+        # 异步DNS查询（名称存在但无A记录时尝试CNAME记录）
+        instrument.count('dns.cache_misses')
+        result = await self.pool.query(domain, 'A')
+        if result == RESULT_NXDOMAIN and domain == zone:
+            self.zones[zone] = False
+        if result == RESULT_NODATA:
+            result = await self.pool.query(domain, 'CNAME')
+        if result == RESULT_TRANSIENT:
+            return None
+        if result == RESULT_FOUND:
             self.valid_cache.add(domain)
             return True
-        except (aiodns.error.DNSError, asyncio.TimeoutError):
-            try:
-                # 尝试CNAME记录
-                await self.resolver.query(domain, 'CNAME')
-                self.valid_cache.add(domain)
+        self.invalid_cache.add(domain)
+        return False
+    
+    async def probe_zones(self, domains: List[str], semaphore):
+        """按可注册域分组: 待验证域名足够多的可注册域先查询 NS，NXDOMAIN 则整组免查"""
+        import asyncio
+        counts = Counter(registrable_domain(domain) for domain in domains
+                         if domain not in self.valid_cache and domain not in self.invalid_cache)
+        zones = [zone for zone, count in counts.items()
+                 if zone is not None and zone not in self.zones and count >= ZONE_PROBE_MIN_HOSTS]
+        if self.past_deadline():
+            return
+        
+        async def probe(zone: str):
+            async with semaphore:
+                result = await self.pool.query(zone, 'NS')
+            self.zone_probes += 1
+            instrument.count('dns.zone_probes')
+            if result != RESULT_TRANSIENT:
+                self.zones[zone] = result != RESULT_NXDOMAIN
+        
+        await asyncio.gather(*(probe(zone) for zone in zones))
+    
+    def wildcard_parent(self, domain: str, zone: str) -> Optional[str]:
+        """域名所在的已识别泛解析区（自父域向上查找至可注册域）"""
+        parent = domain.partition('.')[2]
+        while parent:
+            if self.wildcards.get(parent):
+                return parent
+            if parent == zone:
+                break
+            parent = parent.partition('.')[2]
+        return None
+    
+    async def probe_wildcards(self, domains: List[str], semaphore):
+        """按父域分组: 以随机不存在标签探测一次父域，可解析即为泛解析区"""
+        import asyncio
+        counts = Counter(domain.partition('.')[2] for domain in domains
+                         if domain not in self.valid_cache and domain not in self.invalid_cache)
+        parents = []
+        for parent, count in counts.items():
+            if count < WILDCARD_PROBE_MIN_HOSTS or parent in self.wildcards:
+                continue
+            zone = registrable_domain(parent)  # 公共后缀本身不做探测
+            if zone is not None and self.zones.get(zone) is not False:
+                parents.append(parent)
+        if self.past_deadline():
+            return
+        
+        async def probe(parent: str):
+            label = f"ea-{random.getrandbits(48):012x}"
+            async with semaphore:
+                result = await self.pool.query(f"{label}.{parent}", 'A')
+            self.wildcard_probes += 1
+            instrument.count('dns.wildcard_probes')
+            if result != RESULT_TRANSIENT:
+                self.wildcards[parent] = result == RESULT_FOUND
+                self.wildcard_checked[parent] = int(time.time())
+        
+        await asyncio.gather(*(probe(parent) for parent in parents))
+    
+    def reuse_verdicts(self, domains: List[str]) -> List[str]:
+        """
+        复用老化存储中仍在有效期内的结论（按原结论时间记入），返回仍需查询的域名
+        已过期泛解析区内的域名不复用，随区重新探测
+        """
+        now = int(time.time())
+        fresh, stale = self.aging.wildcard_zones(now)
+        for parent, wildcard in fresh.items():
+            self.wildcards.setdefault(parent, wildcard)
+        pending = [domain for domain in domains
+                   if domain not in self.valid_cache and domain not in self.invalid_cache
+                   and not (stale and self.in_zones(domain, stale))]
+        valid, invalid = self.aging.reusable(pending, now)
+        self.valid_cache.update(valid)
+        self.invalid_cache.update(invalid)
+        self.checked_at.update(valid)
+        self.checked_at.update(invalid)
+        instrument.count('dns.aging_reused', len(valid) + len(invalid))
+        return [domain for domain in domains if domain not in valid and domain not in invalid]
+    
+    @staticmethod
+    def in_zones(domain: str, zones: Set[str]) -> bool:
+        """域名是否位于给定父域之下"""
+        parent = domain.partition('.')[2]
+        while parent:
+            if parent in zones:
                 return True
-            except (aiodns.error.DNSError, asyncio.TimeoutError):
-                self.invalid_cache.add(domain)
-                return False
+            parent = parent.partition('.')[2]
+        return False
+    
+    async def validate(self, domains: Iterable[str]) -> Set[str]:
+        """并发验证一批域名，返回确认失效的域名；暂时失败的域名重试耗尽后按有效保留"""
+        import asyncio
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+        
+        async def check(domain: str) -> Tuple[str, Optional[bool]]:
+            async with semaphore:
+                return domain, await self.check_domain(domain)
+        
+        queue = list(dict.fromkeys(domains))
+        checked = list(queue)
+        if self.aging is not None:
+            queue = self.reuse_verdicts(queue)
+        await self.probe_zones(queue, semaphore)
+        await self.probe_wildcards(queue, semaphore)
+        for attempt in range(RETRY_ROUNDS + 1):
+            if attempt:
+                if self.past_deadline():
+                    break   # 截止后不再重试，剩余域名按有效保留
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+                self.retried += len(queue)
+                instrument.count('dns.retried', len(queue))
+            results = await asyncio.gather(*(check(domain) for domain in queue))
+            now = int(time.time())
+            queue = []
+            for domain, verdict in results:
+                if verdict is None:
+                    queue.append(domain)
+                else:
+                    self.checked_at.setdefault(domain, now)
+            if not queue:
+                break
+        self.unresolved.update(queue)
+        instrument.count('dns.unresolved_kept', len(queue))
+        return {domain for domain in checked if domain in self.invalid_cache}
+
+# ======================
+# 分片验证
+# ======================
+SHARD_FORMAT = "easyads-dns-shard/1"
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """解析分片参数 i/N（i 从 0 开始）"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/N: {spec}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"分片序号越界: {spec}")
+    return index, count
+
+def shard_of(domain: str, count: int) -> int:
+    """域名所属分片: 按域名稳定哈希（大型可注册域也能均匀分散；可注册域/泛解析探测由各分片各做一次）"""
+    return zlib.crc32(domain.encode()) % count
+
+def shard_path(shard_dir: Path, index: int, count: int) -> Path:
+    return shard_dir / f"shard-{index:03d}-of-{count:03d}.tsv.gz"
+
+def write_shard(path: Path, index: int, count: int, validator: 'DNSValidator'):
+    """
+    写出分片结果（gzip TSV: 类型 名称 结论 时间戳），先写临时文件再原子替换，中断的分片不留残缺文件
+    • V 域名 1 / 0 / ? : 存在 / 不存在 / 重试耗尽未确认
+    • W 父域 1         : 泛解析区（合并时用于后缀规则合并）
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + '.tmp')
+    now = int(time.time())
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        f.write(f"# {SHARD_FORMAT} {index}/{count}\n")
+        for domain, checked_at in validator.checked_at.items():
+            f.write(f"V\t{domain}\t{'0' if domain in validator.invalid_cache else '1'}\t{checked_at}\n")
+        for domain in validator.unresolved:
+            if domain not in validator.checked_at:
+                f.write(f"V\t{domain}\t?\t{now}\n")
+        for zone, wildcard in validator.wildcards.items():
+            if wildcard:
+                f.write(f"W\t{zone}\t1\t{now}\n")
+    os.replace(temp_path, path)
+
+def load_shards(shard_dir: Path, count: int, validator: 'DNSValidator') -> List[int]:
+    """将 N 个分片结果读入验证器缓存，返回缺失或损坏（需重跑）的分片序号"""
+    missing = []
+    for index in range(count):
+        path = shard_path(shard_dir, index, count)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                if f.readline().split()[1:] != [SHARD_FORMAT, f"{index}/{count}"]:
+                    raise ValueError("分片头不匹配")
+                for line in f:
+                    kind, name, value, checked_at = line.rstrip('\n').split('\t')
+                    if kind == 'W':
+                        validator.wildcards[name] = True
+                        validator.wildcard_checked[name] = int(checked_at)
+                    elif value == '?':
+                        validator.unresolved.add(name)
+                    else:
+                        (validator.valid_cache if value == '1' else validator.invalid_cache).add(name)
+                        validator.checked_at[name] = int(checked_at)
+        except (OSError, EOFError, ValueError) as e:
+            logger.error(f"❌ 分片 {index}/{count} 不可用: {path} ({e})")
+            missing.append(index)
+    return missing
 
 class RuleProcessor:
     """规则处理器（无状态）"""
     @staticmethod
-    def parse_rule(rule: str) -> Tuple[Optional[str], Optional[List[str]]]:
-        """解析单条规则"""
-        # 跳过注释和头部声明
-        if COMMENT_RULE.match(rule):
-            return None, None
+    def parse_rule(rule: str, token: Optional[Token] = None) -> Tuple[Optional[str], Optional[List[str]]]:
+        """解析单条规则（token 为调用方已有的分词结果）"""
+        if token is None:
+            if rule.startswith('@@'):
+                return None, None
+            fast = RuleProcessor.fast_parse(rule)
+            if fast is not None:
+                return fast
+        kind, exception, start, end, pattern_end, _, _ = token or tokenize(rule)
 
-        # 跳过例外规则
-        if EXCEPTION_RULE.match(rule):
+        # 跳过注释、头部声明和例外规则
+        if kind == KIND_COMMENT or exception:
             return None, None
 
-        # 特殊语法直接写入
-        if ADG_SPECIAL.match(rule):
-            return rule, None
+        # 尝试解析为AdGuard规则（输出中的域名统一为规范形式）
+        if kind == KIND_DOMAIN or kind == KIND_PLAIN:
+            domain = normalize_domain(rule[start:end])
+            if domain is not None and HOST_DOMAIN.fullmatch(domain):
+                if domain != rule[start:end]:
+                    shift = len(domain) - (end - start)
+                    rule = rule[:start] + domain + rule[end:]
+                    end += shift
+                    pattern_end += shift
+                # 无修饰符的 ||example.com^ / example.com（合并阶段的语义去重以此承载等价的Hosts规则）
+                if pattern_end == len(rule) and rule[end:] in ('', '^'):
+                    return rule, [f"0.0.0.0 {domain}"]
+                # 带修饰符的域名规则（||example.com$opt / example.com$opt）
+                if end == pattern_end < len(rule) and (kind == KIND_PLAIN or ('^' not in rule and '/' not in rule)):
+                    return rule, [f"0.0.0.0 {domain}"]
 
-        # 尝试解析为AdGuard规则
-        if domain := RuleProcessor._parse_adguard(rule):
-            return rule, [f"0.0.0.0 {domain}"]
+        # 尝试解析为Hosts规则（非法域名丢弃）
+        elif kind == KIND_HOSTS:
+            domain = normalize_domain(rule[start:end])
+            if domain is None:
+                return None, None
+            ip = rule.split(None, 1)[0]
+            return f"{ip} {domain}", [f"{ip} {domain}"]
 
-        # 尝试解析为Hosts规则
-        if result := RuleProcessor._parse_hosts(rule):
-            ip, domains = result
-            return f"{ip} {' '.join(domains)}", [f"{ip} {d}" for d in domains]
-
-        # 无法识别的规则直接写入
+        # 特殊语法及无法识别的规则直接写入
         return rule, None
 
     @staticmethod
-    def _parse_adguard(rule: str) -> Optional[str]:
-        """解析AdGuard规则"""
-        if match := ADG_DOMAIN.match(rule):
-            return next((g for g in match.groups() if g), "").lower()
-        return None
-
-    @staticmethod
-    def _parse_hosts(rule: str) -> Optional[Tuple[str, List[str]]]:
-        """解析Hosts规则"""
-        if match := HOSTS_RULE.match(rule):
-            ip = match.group(1)
-            domains = [d.lower() for d in match.group(2).split()]
-            return ip, domains
-        return None
+    def fast_parse(rule: str) -> Optional[Tuple[Optional[str], Optional[List[str]]]]:
+        """快速通道: 规范形式的无修饰符域名/Hosts规则（必属DNS族），结果与分词路径相同；其余规则返回 None"""
+        match = canonical_form(rule)
+        if match is None:
+            return None
+        if match[1] is not None:
+            entry = f"{match[1]} {match[2]}"
+            return entry, [entry]
+        # 例外规则需经分词收集例外主机名；*. 通配与带修饰符的规则走分词路径
+        if match[3] or match[7] is not None or match[4] == '*.':
+            return None
+        return rule, [f"0.0.0.0 {match[5]}"]
 
 class BlacklistProcessor:
-    """黑名单处理器"""
-    def __init__(self):
+    """
+    黑名单处理器（shard: 仅验证并写出该分片结果 | merged: 使用已载入的分片结果，不发起查询）
+    aging: 启用规则老化存储（分片进程只读复用结论，由单进程/合并进程写入）
+    deadline: DNS验证截止时间（time.monotonic()），超过后信任缓存/老化存储结论，其余域名按有效保留
+    """
+    def __init__(self, shard: Optional[Tuple[int, int]] = None, merged: bool = False,
+                 shard_dir: Optional[Path] = None, aging: bool = RULE_AGING,
+                 deadline: Optional[float] = None):
+        self.shard = shard
+        self.merged = merged
+        self.shard_dir = shard_dir
+        self.use_aging = aging
+        self.aging: Optional[AgingStore] = None
         self.adguard_rules = set()
         self.hosts_rules = set()
+        self.family_rules = {family: set() for family in OUTPUT_FAMILIES}
         self.processed_count = 0
+        self.folded_rules = 0
+        self.folded_zones = 0
+        self.exception_hosts = set()   # 输入中 @@ 例外规则的主机名（泛解析区合并时视同白名单）
         self.start_time = time.time()
-        self.dns_validator = DNSValidator()
+        self.dns_validator = DNSValidator(deadline=deadline)
         
-    async def process(self):
-        """主处理流程"""
+    async def process(self, rules: Optional[Iterable[str]] = None, workspace: Optional[Path] = None):
+        """主处理流程（rules为空时从输入文件读取）"""
         logger.info("🚀 启动规则处理引擎")
         
         # 获取工作区路径
-        workspace = self._get_workspace()
-        input_path = workspace / INPUT_FILE
-        logger.info(f"📂 输入文件: {input_path}")
-        
-        # 检查文件是否存在
-        if not input_path.exists():
-            logger.error(f"❌ 输入文件不存在: {input_path}")
-            logger.info("💡 请确保文件位于仓库根目录")
-            sys.exit(1)
+        workspace = workspace or self._get_workspace()
         
-        # 初始化DNS验证器
-        if DNS_VALIDATION:
+        # 初始化DNS验证器（分片模式总是验证，合并模式使用分片结果）
+        if (DNS_VALIDATION or self.shard) and not self.merged:
             logger.info("🔍 初始化DNS验证器...")
             await self.dns_validator.setup()
         
-        # 处理规则
-        await self._process_file(input_path)
+        # 打开老化存储（分片模式只读，存储尚不存在时跳过）
+        if self.use_aging:
+            store = AgingStore(workspace / AGING_DB, readonly=bool(self.shard))
+            if store.open():
+                self.aging = self.dns_validator.aging = store
         
-        # 保存结果
-        self._save_results(workspace)
-        self._print_summary()
+        try:
+            # 处理规则
+            with instrument.stage('dns:process'):
+                if rules is not None:
+                    logger.info("📂 输入: 内存规则集")
+                    await self._process_rules(rules)
+                else:
+                    await self._process_file(workspace / INPUT_FILE)
+                self._fold_wildcard_zones(workspace)
+            
+            # 保存结果
+            with instrument.stage('dns:save'):
+                if self.shard:
+                    index, count = self.shard
+                    path = shard_path(self.shard_dir or workspace / SHARD_DIR, index, count)
+                    write_shard(path, index, count, self.dns_validator)
+                    logger.info(f"🧩 分片 {index}/{count}: 验证域名 {len(self.dns_validator.checked_at)} → {path}")
+                else:
+                    self._save_results(workspace)
+                    if self.aging is not None:
+                        self.aging.prune(int(time.time()))
+            self._print_summary()
+        finally:
+            await self.dns_validator.close()
+            if self.aging is not None:
+                self.aging.close()
     
     def _get_workspace(self) -> Path:
         """获取工作区路径"""
@@ -179,38 +484,79 @@ class BlacklistProcessor:
     
     async def _process_file(self, input_path: Path):
         """处理输入文件"""
+        logger.info(f"📂 输入文件: {input_path}")
+        
+        # 检查文件是否存在
+        if not input_path.exists():
+            logger.error(f"❌ 输入文件不存在: {input_path}")
+            logger.info("💡 请确保文件位于仓库根目录")
+            sys.exit(1)
+        
+        with open(input_path, 'r', encoding='utf-8') as f:
+            await self._process_rules(f)
+    
+    async def _process_rules(self, rules: Iterable[str]):
+        """分批处理规则"""
         batch_count = 0
-        for batch in self._read_batches(input_path):
+        for batch in self._read_batches(rules):
             batch_count += 1
             await self._process_batch(batch, batch_count)
     
-    def _read_batches(self, input_path: Path) -> Iterator[List[str]]:
-        """分批读取文件"""
+    def _read_batches(self, rules: Iterable[str]) -> Iterator[List[str]]:
+        """分批读取规则"""
         batch = []
-        with open(input_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if stripped := line.strip():
-                    batch.append(stripped)
-                    if len(batch) >= BATCH_SIZE:
-                        yield batch
-                        batch = []
-            if batch:
-                yield batch
+        for line in rules:
+            if stripped := line.strip():
+                batch.append(stripped)
+                if len(batch) >= BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
     
     async def _process_batch(self, batch: List[str], batch_num: int):
         """处理一批规则"""
         batch_start = time.time()
         valid_count = 0
+        instrument.count('dns.lines_read', len(batch))
         
         # 处理规则
+        parsed = []
         for rule in batch:
-            adguard_rule, hosts_rules = RuleProcessor.parse_rule(rule)
+            fast = RuleProcessor.fast_parse(rule)
+            if fast is not None:
+                parsed.append((fast[0], fast[1], fast[1][0].split()[-1]))
+                continue
+            # 规则族路由：非DNS规则分流到各自输出，不进入dns.txt/hosts.txt
+            token = tokenize(rule)
+            family = token_family(token)
+            if family != FAMILY_DNS:
+                if family in self.family_rules:
+                    self.family_rules[family].add(rule)
+                continue
             
-            # 验证规则
-            if adguard_rule and hosts_rules and DNS_VALIDATION:
-                domain = rule.split()[-1] if hosts_rules else ""
-                if domain and not await self.dns_validator.is_valid_domain(domain):
-                    continue
+            if token[1] and (token[0] == KIND_DOMAIN or token[0] == KIND_PLAIN):
+                self.exception_hosts.add(rule[token[2]:token[3]])
+            adguard_rule, hosts_rules = RuleProcessor.parse_rule(rule, token)
+            domain = hosts_rules[0].split()[-1] if adguard_rule and hosts_rules else None
+            parsed.append((adguard_rule, hosts_rules, domain))
+        
+        # 验证规则（整批域名并发查询；分片模式只验证本分片的域名，合并模式直接采用分片结论）
+        invalid = set()
+        if self.merged:
+            invalid = {domain for _, _, domain in parsed if domain in self.dns_validator.invalid_cache}
+        elif DNS_VALIDATION or self.shard:
+            domains = (domain for _, _, domain in parsed if domain)
+            if self.shard:
+                index, count = self.shard
+                domains = (domain for domain in domains if shard_of(domain, count) == index)
+            invalid = await self.dns_validator.validate(domains)
+        if self.aging is not None and not self.shard:
+            invalid = self._age_batch({domain for _, _, domain in parsed if domain}, invalid)
+        
+        for adguard_rule, hosts_rules, domain in parsed:
+            if domain in invalid:
+                continue
                 
             # 添加有效规则
             if adguard_rule:
@@ -232,18 +578,87 @@ class BlacklistProcessor:
             f"总耗时: {total_time:.1f}s"
         )
     
+    def _age_batch(self, domains: Set[str], invalid: Set[str]) -> Set[str]:
+        """老化存储: 记录本批域名的出现与验证结论，返回连续失效超过宽限期、应剔除的域名"""
+        validator = self.dns_validator
+        now = int(time.time())
+        self.aging.mark_seen(domains, now)
+        decided = [domain for domain in domains if domain in validator.checked_at]
+        self.aging.record(
+            {domain: validator.checked_at[domain] for domain in decided if domain in validator.valid_cache},
+            {domain: validator.checked_at[domain] for domain in decided if domain in validator.invalid_cache})
+        self.aging.record_zones({parent: (validator.wildcards[parent], ts)
+                                 for parent, ts in validator.wildcard_checked.items()})
+        return self.aging.expired(invalid, now)
+    
+    def _allowed_zones(self, workspace: Path) -> Set[str]:
+        """白名单条目（白名单文件与输入中的 @@ 例外规则）的域名及其全部父域"""
+        hosts = set(self.exception_hosts)
+        allowlist = workspace / ALLOWLIST_FILE
+        if allowlist.exists():
+            with open(allowlist, 'r', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    rule = line.strip()
+                    kind, _, start, end, _, _, _ = tokenize(rule)
+                    if kind == KIND_DOMAIN or kind == KIND_PLAIN or kind == KIND_HOSTS:
+                        hosts.add(rule[start:end])
+        zones = set()
+        for host in hosts:
+            domain = normalize_domain(host)
+            while domain:
+                zones.add(domain)
+                domain = domain.partition('.')[2]
+        return zones
+    
+    def _fold_wildcard_zones(self, workspace: Path):
+        """
+        泛解析区内的成批 ||host^ 规则合并为一条 ||zone^（WILDCARD_FOLD 策略控制）
+        • 仅合并严格位于可注册域以下的区: ||example.com^ 会拦截整个站点
+        • 区内（含区本身）有白名单条目时不合并: 后缀规则会覆盖白名单意图放行的子域
+        """
+        zones = {zone for zone, wildcard in self.dns_validator.wildcards.items()
+                 if wildcard and registrable_domain(zone) not in (None, zone)}
+        if not (WILDCARD_FOLD and zones):
+            return
+        zones -= self._allowed_zones(workspace)
+        if not zones:
+            return
+        members = defaultdict(list)
+        for rule in self.adguard_rules:
+            kind, exception, start, end, pattern_end, _, _ = tokenize(rule)
+            if kind != KIND_DOMAIN or exception or pattern_end != len(rule) or rule[end:] not in ('', '^'):
+                continue
+            parent = rule[start:end].partition('.')[2]
+            while parent:
+                if parent in zones:
+                    members[parent].append(rule)
+                    break
+                parent = parent.partition('.')[2]
+        for zone, rules in members.items():
+            if len(rules) >= WILDCARD_FOLD_MIN_HOSTS:
+                self.adguard_rules.difference_update(rules)
+                self.adguard_rules.add(f"||{zone}^")
+                self.folded_rules += len(rules)
+                self.folded_zones += 1
+        instrument.count('dns.folded_rules', self.folded_rules)
+    
     def _save_results(self, workspace: Path):
         """保存结果文件"""
         # AdGuard规则
         adguard_path = workspace / OUTPUT_ADGUARD
         adguard_path.parent.mkdir(parents=True, exist_ok=True)
         with open(adguard_path, 'w', encoding='utf-8') as f:
-            f.write("\n".join(sorted(self.adguard_rules)))
+            f.write("\n".join(sorted(self.adguard_rules, key=order_key)))
         
         # Hosts规则
         hosts_path = workspace / OUTPUT_HOSTS
         with open(hosts_path, 'w', encoding='utf-8') as f:
-            f.write("\n".join(sorted(self.hosts_rules)))
+            f.write("\n".join(sorted(self.hosts_rules, key=order_key)))
+        
+        # 非DNS规则族
+        for family, filename in OUTPUT_FAMILIES.items():
+            with open(workspace / filename, 'w', encoding='utf-8') as f:
+                f.write("\n".join(sorted(self.family_rules[family], key=order_key)))
     
     def _print_summary(self):
         """打印摘要信息"""
@@ -253,17 +668,74 @@ class BlacklistProcessor:
         logger.info(f"📊 处理规则: {self.processed_count}")
         logger.info(f"🛡️ AdGuard规则: {len(self.adguard_rules)}")
         logger.info(f"💾 Hosts规则: {len(self.hosts_rules)}")
-        logger.info(f"💾 输出文件: {OUTPUT_ADGUARD}, {OUTPUT_HOSTS}")
+        for family, filename in OUTPUT_FAMILIES.items():
+            logger.info(f"🔀 {filename}: {len(self.family_rules[family])}")
+        if self.dns_validator.pool:
+            validator = self.dns_validator
+            logger.info(f"🔁 重试查询: {validator.retried} | 重试耗尽按有效保留: {len(validator.unresolved)}")
+            if validator.deadline_skipped:
+                logger.warning(f"⏰ 超过验证截止时间: {validator.deadline_skipped} 个域名未查询，按有效保留")
+            dead_zones = sum(1 for exists in validator.zones.values() if not exists)
+            logger.info(
+                f"🗂️ 可注册域探测: {validator.zone_probes} 次 | 不存在: {dead_zones} 个 | "
+                f"免查子域: {validator.zone_skipped} | 净节省查询: {validator.zone_skipped - validator.zone_probes}"
+            )
+            wildcard_zones = sum(1 for wildcard in validator.wildcards.values() if wildcard)
+            logger.info(
+                f"✳️ 泛解析探测: {validator.wildcard_probes} 次 | 泛解析区: {wildcard_zones} 个 | "
+                f"免查子域: {validator.wildcard_skipped} | 合并规则: {self.folded_rules} → {self.folded_zones} 条后缀规则"
+            )
+            for stats in validator.pool.report():
+                logger.info(
+                    f"🌐 {stats['server']} | 查询 {stats['queries']} | 失败 {stats['failures']} | "
+                    f"时延EWMA {stats['latency_ms']}ms | 错误率 {stats['error_rate']:.1%} | "
+                    f"对冲 {stats['hedges']} (胜出 {stats['hedge_wins']})"
+                )
+        if self.aging is not None:
+            stats = self.aging.stats()
+            logger.info(
+                f"🗄️ 老化存储: {stats['rules']} 条记录 | 复用结论: 有效 {stats['reused_valid']} / "
+                f"失效 {stats['reused_invalid']} | 宽限期内保留: {stats['graced']} | 清除过期记录: {stats['pruned']}"
+            )
+        logger.info(f"💾 输出文件: {OUTPUT_ADGUARD}, {OUTPUT_HOSTS}, {', '.join(OUTPUT_FAMILIES.values())}")
 
-if __name__ == "__main__":
-    import random
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="DNS规则处理器（支持分片验证）")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--shard', type=parse_shard, metavar='i/N', help="仅验证第 i 个分片（从0开始），结果写入分片目录")
+    mode.add_argument('--merge-shards', type=int, metavar='N', help="合并 N 个分片的验证结果，生成 dns.txt / hosts.txt")
+    parser.add_argument('--shard-dir', help=f"分片结果目录（默认 工作区/{SHARD_DIR}）")
+    parser.add_argument('--servers', nargs='+', help="DNS上游（覆盖内置列表，可写 ip:port）")
+    parser.add_argument('--no-aging', action='store_true', help="不读写规则老化存储")
+    parser.add_argument('--deadline', type=float, metavar='秒', help="DNS验证时限，超过后不再发起查询、信任已有结论")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import asyncio
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    if args.servers:
+        DNSValidator.DNS_SERVERS = args.servers
+    processor = BlacklistProcessor(shard=args.shard, merged=bool(args.merge_shards),
+                                   shard_dir=Path(args.shard_dir) if args.shard_dir else None,
+                                   aging=RULE_AGING and not args.no_aging,
+                                   deadline=time.monotonic() + args.deadline if args.deadline is not None else None)
     try:
-        processor = BlacklistProcessor()
+        if args.merge_shards:
+            shard_dir = processor.shard_dir or processor._get_workspace() / SHARD_DIR
+            missing = load_shards(shard_dir, args.merge_shards, processor.dns_validator)
+            if missing:
+                logger.error("💡 请重跑缺失分片: " + " ".join(f"--shard {i}/{args.merge_shards}" for i in missing))
+                return 1
+            logger.info(f"🧩 已载入 {args.merge_shards} 个分片的验证结果")
         asyncio.run(processor.process())
-        sys.exit(0)
+        return 0
     except KeyboardInterrupt:
         logger.info("⛔ 处理已中断")
-        sys.exit(1)
+        return 1
     except Exception as e:
         logger.error(f"🔥 处理失败: {str(e)}")
-        sys.exit(1)
\ No newline at end of file
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
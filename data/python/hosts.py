@@ -1,6 +1,49 @@
 import re
 from pathlib import Path
 
+import instrument
+from domains import normalize_domain
+from rules import BLOCK_IPS, KIND_DOMAIN, KIND_HOSTS, MOD_DNSREWRITE, canonical_form, parse_modifiers, tokenize
+
+IPV4_PATTERN = re.compile(r'\d+\.\d+\.\d+\.\d+')
+
+def to_hosts_entry(rule):
+    """
+    将单条DNS规则转换为 (IP, 规范化域名)，不可转换时返回 None
+    • ||domain.com^ 格式(含修饰符) → 0.0.0.0
+    • ||domain.com^$dnsrewrite=IP → 重写目标IP
+    • 原生Hosts格式 → 原IP
+    """
+    head = rule[0]
+    if head != '|' and not head.isdigit():   # 仅 || 规则与Hosts行可转换
+        return None
+    match = canonical_form(rule)
+    if match is not None:   # 规范形式: 主机名即规范化结果，仅 dnsrewrite 需分词解析
+        if match[1] is not None:
+            return match[1], match[2]
+        if match[3] or match[4] != '||' or not match[6]:
+            return None
+        options = match[7]
+        if options is None or not parse_modifiers(options)[0] & MOD_DNSREWRITE:
+            return '0.0.0.0', match[5]
+    kind, exception, start, end, pattern_end, modifiers, values = tokenize(rule)
+    if kind == KIND_DOMAIN and not exception and pattern_end > end and rule[end] == '^':
+        domain = normalize_domain(rule[start:end])
+        if domain is None:  # 含通配符等非法域名
+            return None
+        ip = '0.0.0.0'
+        if modifiers & MOD_DNSREWRITE and values:
+            target = values.get('dnsrewrite', '').rsplit(';', 1)[-1]
+            if IPV4_PATTERN.fullmatch(target):
+                ip = target
+        return ip, domain
+
+    if kind == KIND_HOSTS and end == len(rule):
+        domain = normalize_domain(rule[start:end])
+        if domain is not None:
+            return rule.split(None, 1)[0], domain
+    return None
+
 def filter_hosts_rules(input_path, output_path):
     """
     从DNS规则文件(dns.txt)中提取并转换Hosts格式规则
@@ -12,13 +55,6 @@ def filter_hosts_rules(input_path, output_path):
     input_path = Path(input_path)
     output_path = Path(output_path)
 
-    # 增强版Hosts规则匹配正则（适配dns.txt格式）
-    HOSTS_RULE_PATTERN = re.compile(
-        r'^(\|\|([\w.-]+)\^($|[\w,=-]*))|'        # 基础域名规则(含修饰符)
-        r'^\|\|([\w.-]+)\^\$dnsrewrite=(\d+\.\d+\.\d+\.\d+)|'  # DNS重写规则
-        r'^(\d+\.\d+\.\d+\.\d+)\s+([\w.-]+)$'    # 原生Hosts格式
-    )
-
     if not input_path.exists():
         raise FileNotFoundError(f"DNS规则文件不存在: {input_path}")
 
@@ -27,34 +63,32 @@ def filter_hosts_rules(input_path, output_path):
              output_path.open('w', encoding='utf-8') as outfile:
 
             count = 0
-            seen = set()
+            collapsed = 0
+            seen = set()  # 语义去重: (拦截/重写目标, 域名)，0.0.0.0 与 127.0.0.1 视为同一拦截
             
             for line in infile:
                 line = line.strip()
                 if not line or line.startswith(('!', '#')):
                     continue
                 
-                match = HOSTS_RULE_PATTERN.match(line)
-                if match:
-                    # 处理三种匹配情况
-                    if match.group(2):  # ||domain.com^ 格式
-                        ip = '0.0.0.0'
-                        domain = match.group(2)
-                    elif match.group(4):  # DNS重写格式
-                        ip = match.group(5)
-                        domain = match.group(4)
-                    else:  # 原生Hosts格式
-                        ip = match.group(7)
-                        domain = match.group(8)
+                entry = to_hosts_entry(line)
+                if entry:
+                    ip, domain = entry
                     
-                    # 标准化输出
-                    entry = f"{ip} {domain}".lower()
-                    if entry not in seen:
-                        seen.add(entry)
+                    # 标准化输出（拦截地址统一为 0.0.0.0）
+                    if ip in BLOCK_IPS:
+                        ip = BLOCK_IPS[0]
+                    key = (ip, domain)
+                    if key not in seen:
+                        seen.add(key)
                         outfile.write(f"{ip} {domain}\n")
                         count += 1
+                    else:
+                        collapsed += 1
 
-            print(f"从DNS规则转换 {count} 条Hosts记录")
+            instrument.count('hosts.entries', count)
+            instrument.count('hosts.collapsed', collapsed)
+            print(f"从DNS规则转换 {count} 条Hosts记录 (合并重复 {collapsed} 条)")
 
     except Exception as e:
         print(f"处理失败: {e}")
@@ -66,4 +100,5 @@ if __name__ == "__main__":
     output_file = base_dir / "hosts.txt"
 
     output_file.parent.mkdir(exist_ok=True)
-    filter_hosts_rules(input_file, output_file)
+    with instrument.stage('hosts:filter'):
+        filter_hosts_rules(input_file, output_file)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+运行时埋点 (按需开启，所有脚本共用)
+• 开关: 环境变量 EASYADS_PROFILE = metrics | cprofile | tracemalloc (逗号分隔, 1 等同 metrics)
+• 产物: EASYADS_PROFILE_DIR (默认 tmp/profile) 下的 metrics JSON 与火焰图折叠栈
+• 关闭时接口均为空操作: pattern() 原样返回正则对象，stage() 返回共享空上下文
+"""
+
+import atexit
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# === 配置区 ===
+ENV_FLAG = "EASYADS_PROFILE"
+ENV_DIR = "EASYADS_PROFILE_DIR"
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+
+_raw_modes = {m.strip().lower() for m in os.getenv(ENV_FLAG, "").split(",") if m.strip()}
+if _raw_modes & {"1", "true", "on", "yes"}:
+    _raw_modes.add("metrics")
+PROFILE = "cprofile" in _raw_modes
+TRACE_MEMORY = "tracemalloc" in _raw_modes
+ENABLED = PROFILE or TRACE_MEMORY or "metrics" in _raw_modes
+
+_NULL_STAGE = contextlib.nullcontext()
+_counters = defaultdict(int)
+_timers = defaultdict(lambda: [0, 0.0])    # 名称 → [调用次数, 累计秒数]
+_gauges = defaultdict(lambda: [0, 0])       # 名称 → [当前值, 峰值]
+_stages = []                                # 阶段记录（按完成顺序）
+_profiles = {}                              # 阶段名 → cProfile.Profile
+_local = None                               # 每线程的进行中阶段栈（嵌套阶段共用外层剖析器、峰值逐层上报）
+
+
+# === 计数器 / 计量 ===
+def count(name: str, n: int = 1):
+    """累加计数器（热循环中请按批次调用）"""
+    if ENABLED:
+        _counters[name] += n
+
+
+def add_time(name: str, seconds: float, calls: int = 1):
+    """累加计时器"""
+    if ENABLED:
+        timer = _timers[name]
+        timer[0] += calls
+        timer[1] += seconds
+
+
+@contextlib.contextmanager
+def _inflight(name: str):
+    gauge = _gauges[name]
+    gauge[0] += 1
+    if gauge[0] > gauge[1]:
+        gauge[1] = gauge[0]
+    try:
+        yield
+    finally:
+        gauge[0] -= 1
+
+
+def inflight(name: str):
+    """并发中计量（如在途DNS查询数），记录峰值"""
+    return _inflight(name) if ENABLED else _NULL_STAGE
+
+
+# === 阶段 ===
+def _active_stages() -> list:
+    global _local
+    if _local is None:
+        import threading
+        _local = threading.local()
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextlib.contextmanager
+def _stage(name: str):
+    """
+    阶段可嵌套（如流水线阶段内的子阶段）:
+    • cProfile: 仅最外层阶段启用剖析器，内层调用计入外层剖析；已有其他剖析器运行（3.12+ 全局唯一）时不剖析
+    • tracemalloc: 进入内层前先把当前峰值计入外层，退出时内层峰值向外层上报，外层峰值不因 reset_peak 丢失
+    """
+    stack = _active_stages()
+    parent = stack[-1] if stack else None
+    frame = {"name": name, "profiler": None, "peak": 0}
+    if PROFILE and (parent is None or parent["profiler"] is None):
+        import cProfile
+        profiler = _profiles.setdefault(name, cProfile.Profile())
+        try:
+            profiler.enable()
+            frame["profiler"] = profiler
+        except ValueError:   # 其他线程的阶段正在剖析
+            pass
+    if TRACE_MEMORY:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if parent is not None:
+            parent["peak"] = max(parent["peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if frame["profiler"] is not None:
+            frame["profiler"].disable()
+        record = {"name": name, "seconds": round(elapsed, 6)}
+        if parent is not None:
+            record["parent"] = parent["name"]
+        if TRACE_MEMORY:
+            import tracemalloc
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_bytes"] = peak
+            if parent is not None:
+                parent["peak"] = max(parent["peak"], peak)
+        _stages.append(record)
+
+
+def stage(name: str):
+    """阶段计时（可选 cProfile / tracemalloc），未开启时为空上下文"""
+    return _stage(name) if ENABLED else _NULL_STAGE
+
+
+# === 正则调用统计 ===
+class _CountingPattern:
+    """正则代理: 统计每个模式的调用次数与耗时"""
+    __slots__ = ("_pattern", "_name")
+
+    def __init__(self, name: str, pattern):
+        self._pattern = pattern
+        self._name = f"regex.{name}"
+
+    def _call(self, method: str, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self._pattern, method)(*args, **kwargs)
+        finally:
+            timer = _timers[self._name]
+            timer[0] += 1
+            timer[1] += time.perf_counter() - start
+
+    def match(self, *args, **kwargs):
+        return self._call("match", *args, **kwargs)
+
+    def fullmatch(self, *args, **kwargs):
+        return self._call("fullmatch", *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self._call("search", *args, **kwargs)
+
+    def findall(self, *args, **kwargs):
+        return self._call("findall", *args, **kwargs)
+
+    def sub(self, *args, **kwargs):
+        return self._call("sub", *args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._pattern, attr)
+
+
+def pattern(name: str, compiled):
+    """包装预编译正则；未开启时原样返回，零额外开销"""
+    return _CountingPattern(name, compiled) if ENABLED else compiled
+
+
+# === 输出 ===
+def _folded_stacks():
+    """将 cProfile 调用关系转为火焰图折叠栈: 阶段;调用者;被调用者 自身耗时(微秒)"""
+    import pstats
+
+    def label(func):
+        filename, line, funcname = func
+        return f"{Path(filename).name}:{funcname}:{line}".replace(";", ",").replace(" ", "_")
+
+    lines = []
+    for stage_name, profiler in _profiles.items():
+        stats = pstats.Stats(profiler).stats
+        for func, (_, _, _, _, callers) in stats.items():
+            if not callers:
+                tt = stats[func][2]
+                if tt > 0:
+                    lines.append(f"{stage_name};{label(func)} {int(tt * 1e6)}")
+                continue
+            for caller, caller_stats in callers.items():
+                tt = caller_stats[2]
+                if tt > 0:
+                    lines.append(f"{stage_name};{label(caller)};{label(func)} {int(tt * 1e6)}")
+    return lines
+
+
+def dump():
+    """写出本次运行的 metrics JSON 与折叠栈（进程退出时自动调用）"""
+    if not ENABLED or not (_stages or _counters or _timers or _gauges):
+        return None
+    out_dir = Path(os.getenv(ENV_DIR, os.path.join(WORKSPACE, "tmp", "profile")))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    script = Path(sys.argv[0]).stem or "python"
+    run_id = f"{script}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+    metrics = {
+        "script": script,
+        "modes": sorted(_raw_modes),
+        "stages": _stages,
+        "counters": dict(_counters),
+        "timers": {k: {"calls": c, "seconds": round(s, 6)} for k, (c, s) in _timers.items()},
+        "gauges": {k: {"peak": peak} for k, (_, peak) in _gauges.items()},
+    }
+    metrics_path = out_dir / f"metrics-{run_id}.json"
+    with open(metrics_path, "w", encoding="utf-8") as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2)
+
+    if _profiles:
+        with open(out_dir / f"stacks-{run_id}.folded", "w", encoding="utf-8") as f:
+            f.write("\n".join(_folded_stacks()) + "\n")
+    print(f"📈 埋点数据已写入: {metrics_path}", file=sys.stderr)
+    return metrics_path
+
+
+if ENABLED:
+    atexit.register(dump)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+规则匹配器 (解析器查询模拟)
+• 将构建产物加载为解析器等价的内存结构: Hosts → 哈希集合 | ||domain^ / DOMAIN-SUFFIX → 后缀树
+• 判定: AdGuard 为 $important 例外 > $important 拦截 > 例外 > 拦截 | 原生解析器格式为最具体的条目生效
+• 支持文件: dns.txt, hosts.txt, ads.yaml, unbound.conf, dnsmasq.conf, rpz.zone, smartdns.conf
+• 供基准测试与离线查询回放使用
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from domains import normalize_domain
+
+# 预编译正则表达式
+ADG_SUFFIX = re.compile(r'^(@@)?\|\|([a-zA-Z0-9_.-]+)\^?(?:\$(.*))?$')
+ADG_WILDCARD = re.compile(r'^(@@)?\*\.([a-zA-Z0-9_.-]+)\^?(?:\$(.*))?$')
+ADG_PLAIN = re.compile(r'^(@@)?([a-zA-Z0-9_-]+(?:\.[a-zA-Z0-9_-]+)+)\^?(?:\$(.*))?$')
+ADG_REGEX = re.compile(r'^(@@)?/(.+)/$')
+HOSTS_LINE = re.compile(r'^\s*(\d+\.\d+\.\d+\.\d+)\s+([^#]+)')
+CLASH_LINE = re.compile(r'^\s*-\s*(DOMAIN-SUFFIX|DOMAIN),([^,\s]+),(\w+)')
+UNBOUND_ZONE = re.compile(r'^\s*local-zone:\s*"([^"]+)"\s+(\w+)')
+UNBOUND_DATA = re.compile(r'^\s*local-data:\s*"(\S+)\s+(?:IN\s+)?(?:A|AAAA)\s')
+DNSMASQ_LINE = re.compile(r'^(address|server)=/(.+)/([^/]*)$')
+RPZ_LINE = re.compile(r'^(\S+)\s+(?:\d+\s+)?(?:IN\s+)?CNAME\s+(\S+)')
+SMARTDNS_LINE = re.compile(r'^address\s+/(.+)/(\S*)$')
+UNBOUND_ALLOW_ZONES = {'transparent', 'typetransparent', 'nodefault'}
+
+# 解析器会忽略的修饰符之外，带其它修饰符的规则不参与查询匹配
+PASSTHROUGH_OPTIONS = {'', 'important'}
+TERMINAL = ''  # 后缀树终止标记（合法标签不可能为空串）
+
+
+class SuffixTrie:
+    """按反转标签组织的后缀树: com → example → ads"""
+    __slots__ = ('root', 'size')
+
+    def __init__(self):
+        self.root: Dict[str, dict] = {}
+        self.size = 0
+
+    def add(self, domain: str):
+        node = self.root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        if TERMINAL not in node:
+            node[TERMINAL] = True
+            self.size += 1
+
+    def match(self, domain: str) -> bool:
+        """域名本身或任一父域命中即返回True"""
+        node = self.root
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if TERMINAL in node:
+                return True
+        return False
+
+    def depth(self, domain: str) -> int:
+        """命中的最深后缀的标签数（未命中为0）"""
+        node, deepest = self.root, 0
+        for depth, label in enumerate(reversed(domain.split('.')), 1):
+            node = node.get(label)
+            if node is None:
+                break
+            if TERMINAL in node:
+                deepest = depth
+        return deepest
+
+    def __len__(self):
+        return self.size
+
+
+class DomainMatcher:
+    """解析器等价匹配器（拦截 + 例外）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.exact = set()         # Hosts/DOMAIN 精确匹配
+        self.suffix = SuffixTrie()  # ||domain^ / DOMAIN-SUFFIX
+        self.allow_exact = set()
+        self.allow_suffix = SuffixTrie()
+        self.important = SuffixTrie()        # ||domain^$important（优先于例外）
+        self.allow_important = SuffixTrie()  # @@||domain^$important
+        self.regexes: List[re.Pattern] = []
+        self.nearest = False  # 最具体的条目生效（原生解析器格式），否则例外优先
+        self.skipped = 0
+
+    def _add(self, target, domain: str):
+        """加入规范化后的域名（与解析器一致：不区分大小写，国际化域名按 punycode 匹配）"""
+        domain = normalize_domain(domain)
+        if domain is None:
+            self.skipped += 1
+        else:
+            target.add(domain)
+
+    @property
+    def rule_count(self) -> int:
+        return (len(self.exact) + len(self.suffix) + len(self.allow_exact)
+                + len(self.allow_suffix) + len(self.important) + len(self.allow_important) + len(self.regexes))
+
+    def is_blocked(self, domain: str) -> bool:
+        """模拟单次解析器查询"""
+        if self.nearest:
+            if domain in self.allow_exact:
+                return False
+            if domain in self.exact:
+                return True
+            return self.suffix.depth(domain) > self.allow_suffix.depth(domain)
+        if self.allow_important and self.allow_important.match(domain):
+            return False
+        if self.important and self.important.match(domain):
+            return True
+        if domain in self.allow_exact or self.allow_suffix.match(domain):
+            return False
+        if domain in self.exact or self.suffix.match(domain):
+            return True
+        for pattern in self.regexes:
+            if pattern.search(domain):
+                return True
+        return False
+
+    # === 加载器 ===
+    def load_adguard(self, lines: Iterable[str]) -> 'DomainMatcher':
+        """加载AdGuard DNS规则 (dns.txt)"""
+        for line in lines:
+            rule = line.strip()
+            if not rule or rule[0] in '!#[':
+                continue
+            if match := HOSTS_LINE.match(rule):
+                for domain in match.group(2).split():
+                    self._add(self.exact, domain)
+                continue
+            if match := ADG_REGEX.match(rule):
+                if match.group(1):
+                    self.skipped += 1
+                    continue
+                try:
+                    self.regexes.append(re.compile(match.group(2)))
+                except re.error:
+                    self.skipped += 1
+                continue
+            match = (ADG_SUFFIX.match(rule) or ADG_WILDCARD.match(rule)
+                     or ADG_PLAIN.match(rule))
+            options = match and (match.group(3) or '')
+            if not match or options not in PASSTHROUGH_OPTIONS:
+                self.skipped += 1
+                continue
+            if options == 'important':
+                trie = self.allow_important if match.group(1) else self.important
+            else:
+                trie = self.allow_suffix if match.group(1) else self.suffix
+            self._add(trie, match.group(2))
+        return self
+
+    def load_hosts(self, lines: Iterable[str]) -> 'DomainMatcher':
+        """加载Hosts规则 (hosts.txt)"""
+        for line in lines:
+            if match := HOSTS_LINE.match(line):
+                for domain in match.group(2).split():
+                    self._add(self.exact, domain)
+            elif line.strip() and line.lstrip()[0] not in '!#[':
+                self.skipped += 1
+        return self
+
+    def load_clash(self, lines: Iterable[str]) -> 'DomainMatcher':
+        """加载Clash规则集 (ads.yaml)"""
+        for line in lines:
+            match = CLASH_LINE.match(line)
+            if not match:
+                continue
+            kind, domain, action = match.groups()
+            allow = action == 'DIRECT'
+            if kind == 'DOMAIN':
+                self._add(self.allow_exact if allow else self.exact, domain)
+            else:
+                self._add(self.allow_suffix if allow else self.suffix, domain)
+        return self
+
+    def load_unbound(self, lines: Iterable[str]) -> 'DomainMatcher':
+        """加载 unbound 配置 (local-zone 为后缀语义，无 local-zone 的 local-data 为精确匹配)"""
+        self.nearest = True
+        for line in lines:
+            if match := UNBOUND_ZONE.match(line):
+                domain, zone_type = match.groups()
+                allow = zone_type in UNBOUND_ALLOW_ZONES
+                self._add(self.allow_suffix if allow else self.suffix, domain.rstrip('.'))
+            elif match := UNBOUND_DATA.match(line):
+                self._add(self.exact, match.group(1).rstrip('.'))
+        return self
+
+    def load_dnsmasq(self, lines: Iterable[str]) -> 'DomainMatcher':
+        """加载 dnsmasq 配置 (address=/域名/ 拦截，server=/域名/# 交回默认上游即放行)"""
+        self.nearest = True
+        for line in lines:
+            match = DNSMASQ_LINE.match(line.strip())
+            if not match:
+                continue
+            option, domains, target = match.groups()
+            allow = option == 'server'
+            if allow and target != '#':
+                continue
+            for domain in domains.split('/'):
+                self._add(self.allow_suffix if allow else self.suffix, domain)
+        return self
+
+    def load_rpz(self, lines: Iterable[str]) -> 'DomainMatcher':
+        """加载 RPZ 区域 (CNAME . 拦截 | CNAME rpz-passthru. 放行；同时有 x 与 *.x 视为后缀)"""
+        self.nearest = True
+        names: Dict[str, bool] = {}
+        wildcards: Dict[str, bool] = {}
+        for line in lines:
+            match = RPZ_LINE.match(line)
+            if not match or match.group(1) == '@':
+                continue
+            name, target = match.groups()
+            if target not in ('.', 'rpz-passthru.'):
+                self.skipped += 1
+                continue
+            if name.startswith('*.'):
+                wildcards[name[2:]] = target != '.'
+            else:
+                names[name] = target != '.'
+        for name, allow in names.items():
+            if wildcards.pop(name, None) == allow:
+                self._add(self.allow_suffix if allow else self.suffix, name)
+            else:
+                self._add(self.allow_exact if allow else self.exact, name)
+        self.skipped += len(wildcards)  # 仅子域的通配条目无等价结构
+        return self
+
+    def load_smartdns(self, lines: Iterable[str]) -> 'DomainMatcher':
+        """加载 smartdns 配置 (address /域名/# 拦截，address /域名/- 忽略规则即放行)"""
+        self.nearest = True
+        for line in lines:
+            if match := SMARTDNS_LINE.match(line.strip()):
+                domain, target = match.groups()
+                self._add(self.allow_suffix if target == '-' else self.suffix, domain)
+        return self
+
+
+LOADERS = {
+    'dns.txt': DomainMatcher.load_adguard,
+    'hosts.txt': DomainMatcher.load_hosts,
+    'ads.yaml': DomainMatcher.load_clash,
+    'unbound.conf': DomainMatcher.load_unbound,
+    'dnsmasq.conf': DomainMatcher.load_dnsmasq,
+    'rpz.zone': DomainMatcher.load_rpz,
+    'smartdns.conf': DomainMatcher.load_smartdns,
+}
+
+
+def load_matcher(path: Path) -> Optional[DomainMatcher]:
+    """按文件名选择加载器，文件不存在时返回None"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    loader = LOADERS.get(path.name, DomainMatcher.load_adguard)
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return loader(DomainMatcher(path.name), f)
@@ -4,60 +4,183 @@ import re
 from pathlib import Path
 import time
 
+import instrument
+from attribution import AttributionBuilder, index_path
+from rules import (KIND_COSMETIC, KIND_DOMAIN, KIND_HOSTS, KIND_PLAIN, KIND_REGEX, KIND_SCRIPTLET, KIND_URL,
+                   canonical_form, covering_key, semantic_key, tokenize)
+
 # 高性能路径设置
 WORKSPACE = os.getenv('WORKSPACE', os.getcwd())
 TEMP_DIR = os.path.join(WORKSPACE, "tmp")
 OUTPUT_DIR = WORKSPACE
 
-# 预编译高效正则表达式
-FULL_SYNTAX = re.compile(
-    r'^(\|\|)?[\w.-]+\^?(\$[\w,=-]+)?$|'          # 基础域名规则
-    r'^@@(\|\|)?[\w.-]+\^?(\$[\w,=-]+)?$|'        # 例外规则
-    r'^/[\w\W]+/$|^@@/[\w\W]+/$|'                # 正则规则
-    r'^##.+$|^@@##.+$|'                          # 元素隐藏规则
-    r'^\d+\.\d+\.\d+\.\d+\s+[\w.-]+$|'           # Hosts格式
-    r'^\|\|[\w.-]+\^\$dnstype=\w+$|'             # DNS类型规则
-    r'^@@\|\|[\w.-]+\^\$dnstype=\w+$|'           # DNS例外
-    r'^\|\|[\w.-]+\^\$dnsrewrite=\w+$|'          # DNS重写
-    r'^@@\|\|[\w.-]+\^\$dnsrewrite=NOERROR$'     # DNS重写例外
-)
+# 受支持语法的区间校验（在 rules.tokenize 分词结果上逐段匹配）
+DOMAIN_SPAN = instrument.pattern('merge.domain_span', re.compile(r'[\w.-]+'))       # Hosts域名
+OPTIONS_SPAN = instrument.pattern('merge.options_span', re.compile(r'[\w,=-]+'))    # 修饰符
+SCOPE_SPAN = instrument.pattern('merge.scope_span', re.compile(r'[\w.,~*-]+'))      # 元素隐藏限定域名
+URL_SPAN = instrument.pattern('merge.url_span', re.compile(r'[\w.-]+/\S*'))         # URL路径
+
+_option_checks = {}
 
-def clean_rules(content):
-    """极速规则清理（批量处理）"""
-    cleaned_lines = []
-    for line in content.splitlines():
-        stripped = line.strip()
-        if stripped and FULL_SYNTAX.match(stripped):
-            cleaned_lines.append(stripped)
-    return '\n'.join(cleaned_lines)
+def _options_supported(options):
+    """修饰符串字符集校验（按选项串缓存）"""
+    supported = _option_checks.get(options)
+    if supported is None:
+        supported = _option_checks[options] = bool(OPTIONS_SPAN.fullmatch(options))
+    return supported
 
-def merge_files(pattern, output_file):
-    """高性能文件合并（流式处理）"""
-    seen = set()  # 内存中去重
-    output_path = os.path.join(OUTPUT_DIR, output_file)
+def is_supported(rule):
+    """
+    判断规则是否属于受支持语法（rule 需已去除首尾空白）
+    • 域名规则 ||example.com^$opt / example.com (含 @@ 例外)
+    • 正则规则 /regex/ | URL路径规则 ||example.com/path
+    • 元素隐藏/脚本规则 ##.ad / example.com#%#script | Hosts格式 0.0.0.0 example.com
+    """
+    match = canonical_form(rule)
+    if match is not None:   # 规范形式: 仅 *. 通配与修饰符串需判定
+        if match[4] == '*.':
+            return False
+        options = match[7]
+        return options is None or _options_supported(options)
+    if rule[0] == '!':   # 注释
+        return False
+    kind, _, start, end, pattern_end, _, _ = tokenize(rule)
+    if kind == KIND_DOMAIN or kind == KIND_PLAIN:
+        # 分词器的主机名允许 '*'，受支持语法不允许；锚点后缀仅允许单个 '^'
+        if pattern_end - end > 1 or (pattern_end > end and rule[end] != '^'):
+            return False
+        if rule.find('*', start, end) >= 0:
+            return False
+        return pattern_end == len(rule) or _options_supported(rule[pattern_end + 1:])
+    if kind == KIND_REGEX:
+        return end > start
+    if kind == KIND_URL:
+        return rule.startswith('||', start) and bool(URL_SPAN.fullmatch(rule, start + 2))
+    if kind == KIND_COSMETIC or kind == KIND_SCRIPTLET:
+        if pattern_end == len(rule):
+            return False
+        if end == 0 or (end == 2 and rule.startswith('@@')):
+            return rule[end:pattern_end] == '##'
+        return bool(SCOPE_SPAN.fullmatch(rule, 0, end))
+    if kind == KIND_HOSTS:
+        return end == len(rule) and bool(DOMAIN_SPAN.fullmatch(rule, start, end))
+    return False
+
+def merge_rules(pattern, temp_dir=TEMP_DIR, attribution=None):
+    """
+    合并并去重规则，返回保持首次出现顺序的规则列表
+    • 先去重再校验语法：各上游互为镜像，重复行无需再次分词
+    • 语义去重: ||x^ / x / 0.0.0.0 x / 127.0.0.1 x 按语义键合并，保留优先级最高的表面形式
+    • 被同动作子树规则覆盖的精确/通配规则一并合并；按来源输出合并报告
+    • attribution: 可选 AttributionBuilder，记录每条规则的全部来源（含重复与被合并的出现）
+    """
+    seen = {}      # 小写文本 → 规则下标<<3 | 表面形式优先级（不受支持的规则为 -1）
+    slots = {}     # 语义键 → 规则下标
+    merged = []    # 规则文本
+    ranks = []     # 表面形式优先级
+    keys = []      # 语义键（无则为 None）
+    origins = []   # 来源文件下标
+    stats = []     # 各来源: [文件名, 行数, 保留, 文本重复, 语义合并]
+    
+    for file_path in sorted(glob.glob(os.path.join(temp_dir, pattern))):
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read()
+            instrument.count('merge.files')
+            instrument.count('merge.bytes_read', len(content))
+            
+            # 空文件跳过
+            if not content.strip():
+                continue
+            
+            # 逐行去重并清理
+            source = len(stats)
+            lines = content.splitlines()
+            stat = [os.path.basename(file_path), len(lines), 0, 0, 0]
+            stats.append(stat)
+            if attribution is not None:
+                attribution.add_source(stat[0])
+            for position, line in enumerate(lines):
+                stripped = line.strip()
+                if not stripped:
+                    continue
+                lower_line = stripped.lower()
+                packed = seen.get(lower_line)
+                if packed is not None:
+                    stat[3] += 1
+                    if attribution is not None and packed >= 0:
+                        attribution.record(packed >> 3, position, packed & 7, stripped)
+                    continue
+                if not is_supported(stripped):
+                    seen[lower_line] = -1
+                    continue
+                
+                key, rank = semantic_key(stripped)
+                index = slots.get(key) if key is not None else None
+                if index is not None:
+                    seen[lower_line] = index << 3 | rank
+                    stat[4] += 1
+                    if rank < ranks[index]:
+                        merged[index] = stripped
+                        ranks[index] = rank
+                    if attribution is not None:
+                        attribution.record(index, position, rank, stripped)
+                    continue
+                index = len(merged)
+                if key is not None:
+                    slots[key] = index
+                seen[lower_line] = index << 3 | rank
+                if attribution is not None:
+                    attribution.add_entry(key, stripped)
+                    attribution.record(index, position, rank, stripped)
+                merged.append(stripped)
+                ranks.append(rank)
+                keys.append(key)
+                origins.append(source)
+                stat[2] += 1
+        except Exception as e:
+            print(f"处理文件 {file_path} 时出错: {e}")
+            continue  # 跳过问题文件
     
+    # 子树规则覆盖的精确/通配规则
+    removed = set()
+    for index, key in enumerate(keys):
+        covering = covering_key(key) if key is not None else None
+        if covering in slots:
+            removed.add(index)
+            if attribution is not None:
+                attribution.cover(index, slots[covering])
+            stats[origins[index]][2] -= 1
+            stats[origins[index]][4] += 1
+    if removed:
+        merged = [rule for index, rule in enumerate(merged) if index not in removed]
+    
+    print_merge_report(stats)
+    return merged
+
+def print_merge_report(stats):
+    """按来源输出合并报告"""
+    for name, lines, kept, duplicates, collapsed in stats:
+        print(f"  📄 {name}: 行 {lines} | 保留 {kept} | 文本重复 {duplicates} | 语义合并 {collapsed}")
+    instrument.count('merge.lines_read', sum(s[1] for s in stats))
+    instrument.count('merge.rules_kept', sum(s[2] for s in stats))
+    instrument.count('merge.duplicates', sum(s[3] for s in stats))
+    instrument.count('merge.semantic_collapsed', sum(s[4] for s in stats))
+
+def write_rules(rules, output_file, output_dir=OUTPUT_DIR):
+    """写出规则文件"""
+    output_path = os.path.join(output_dir, output_file)
     with open(output_path, 'w', encoding='utf-8') as out:
-        for file_path in glob.glob(os.path.join(TEMP_DIR, pattern)):
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    
-                    # 空文件跳过
-                    if not content.strip():
-                        continue
-                        
-                    # 清理规则
-                    cleaned = clean_rules(content)
-                    
-                    # 逐行处理（避免大文件内存占用）
-                    for line in cleaned.splitlines():
-                        lower_line = line.lower()
-                        if lower_line not in seen:
-                            seen.add(lower_line)
-                            out.write(line + '\n')
-            except Exception as e:
-                print(f"处理文件 {file_path} 时出错: {e}")
-                continue  # 跳过问题文件
+        for line in rules:
+            out.write(line + '\n')
+
+def merge_files(pattern, output_file, temp_dir=TEMP_DIR, output_dir=OUTPUT_DIR):
+    """高性能文件合并，返回合并后的规则列表；来源归属索引写入 temp_dir/<输出名>.attr"""
+    attribution = AttributionBuilder()
+    rules = merge_rules(pattern, temp_dir, attribution)
+    write_rules(rules, output_file, output_dir)
+    attribution.write(index_path(temp_dir, output_file))
+    return rules
 
 def main():
     print("🚀 启动规则合并引擎")
@@ -69,10 +192,12 @@ def main():
     
     # 并行处理拦截规则和白名单
     print("⏳ 处理拦截规则...")
-    merge_files('adblock*.txt', 'adblock.txt')
+    with instrument.stage('merge:adblock'):
+        merge_files('adblock*.txt', 'adblock.txt')
     
     print("⏳ 处理白名单规则...")
-    merge_files('allow*.txt', 'allow.txt')
+    with instrument.stage('merge:allow'):
+        merge_files('allow*.txt', 'allow.txt')
     
     # 最终报告
     elapsed = time.time() - start_time
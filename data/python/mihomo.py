@@ -14,9 +14,12 @@ import logging
 import time
 import hashlib
 from pathlib import Path
+from typing import Optional
+
+import instrument
 
 # === 配置区 ===
-MIHOMO_BIN = "/data/mihomo-linux-amd64"  # 预置二进制路径
+MIHOMO_BIN = os.getenv("MIHOMO_BIN", "/data/mihomo-linux-amd64")  # 预置二进制路径（工作流环境变量优先）
 INPUT_FILE = "ads.yaml"                  # 根目录输入文件
 OUTPUT_FILE = "adb.mrs"             # 二进制规则输出
 TIMEOUT = 180                            # 转换超时时间(秒)
@@ -58,7 +61,9 @@ def setup_logger():
     logger.addHandler(handler)
     return logger
 
-log = setup_logger()
+# 导入时不注册处理器（由入口调用 setup_logger）
+log = logging.getLogger("mrs-converter")
+log.setLevel(logging.INFO)
 
 # === 路径处理 ===
 def get_root_dir() -> Path:
@@ -157,14 +162,14 @@ def convert_to_mrs(input_path: Path, output_path: Path) -> bool:
     return False
 
 # === 主流程 ===
-def main() -> int:
-    """工作流主控制器"""
+def main(root_dir: Optional[Path] = None, input_path: Optional[Path] = None) -> int:
+    """工作流主控制器（可指定工作目录与输入文件）"""
     # 获取工作目录
-    root_dir = get_root_dir()
+    root_dir = root_dir or get_root_dir()
     log.info(f"🏠 工作目录: {root_dir}")
     
     # 构建文件路径
-    input_path = root_dir / INPUT_FILE
+    input_path = input_path or root_dir / INPUT_FILE
     output_path = root_dir / OUTPUT_FILE
     
     # 验证输入文件
@@ -181,11 +186,13 @@ def main() -> int:
         return 1
     
     # 记录输入文件校验和
-    input_hash = file_checksum(input_path)
+    with instrument.stage('mrs:checksum'):
+        input_hash = file_checksum(input_path)
     log.info(f"🔒 输入校验和: SHA256:{input_hash[:12]}...")
     
     # 执行转换
-    success = convert_to_mrs(input_path, output_path)
+    with instrument.stage('mrs:convert'):
+        success = convert_to_mrs(input_path, output_path)
     
     # 验证输出
     if success:
@@ -199,6 +206,7 @@ def main() -> int:
     return 1
 
 if __name__ == "__main__":
+    setup_logger()
     start_time = time.time()
     exit_code = main()
     elapsed = time.time() - start_time
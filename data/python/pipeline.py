@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+规则流水线编排器 (单进程 DAG)
+• 下载 → 合并 → {正则成本分析 → DNS规则 → {Clash规则 → {头信息 → README, MRS}, 解析器原生格式, 紧凑二进制}, 源重叠分析}
+• 头信息 + 解析器原生格式 + 紧凑二进制 → 预压缩 (.gz/.br/.zst + manifest.json) | 头信息 → 输出分片 (SHARD_MODE 启用时)
+• 中间数据保留在内存 | 无依赖关系的阶段并发执行 | 工作区只解析一次
+• 运行时间预算 (PIPELINE_BUDGET / --budget): 下载、DNS验证有软截止，超时后按预定方式降级
+  （源沿用上次成功副本 / DNS停止查询并信任缓存 / 跳过MRS与源重叠分析），降级记录写入 data/stats/pipeline-run.json
+• 用法: python data/python/pipeline.py run [--only 阶段...] [--skip 阶段...] [--dry-run] [--budget 秒]
+        python data/python/pipeline.py <阶段名>       (单独运行，输入回退为磁盘文件)
+        cd data/python && python -m pipeline run
+"""
+
+import argparse
+import concurrent.futures
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import instrument
+
+# === 配置区 ===
+MAX_PARALLEL = 4                                 # 并发阶段上限
+TIMINGS_FILE = Path("tmp") / "pipeline-timings.json"  # 上次运行各阶段耗时（用于 --dry-run 估算）
+RUN_FILE = Path("data") / "stats" / "pipeline-run.json"  # 本次运行元数据: 各阶段状态、是否超出预算、触发的降级
+RUN_BUDGET = float(os.getenv('PIPELINE_BUDGET', 40 * 60))  # 整次运行时间预算（秒）
+STAGE_DEADLINES = {                              # 阶段软截止（距运行开始的秒数），超过后阶段内部降级
+    'download': 5 * 60,                          # 未完成的源沿用上次成功副本
+    'dns': 25 * 60,                              # 不再发起新查询，信任缓存与老化存储结论
+}
+RESERVE = 60                                     # 为收尾阶段保留的余量（秒）
+OPTIONAL_STAGES = {                              # 剩余预算不足时可整体跳过的阶段 → 降级方式
+    'mrs': "沿用上次 adb.mrs",
+    'sketch': "跳过源重叠分析",
+}
+KEEP_OUTPUTS = ('adb.mrs',)                      # 清理工作区时保留（跳过重新生成时沿用上次产物）
+
+
+def resolve_workspace(explicit: Optional[str] = None) -> Path:
+    """统一解析一次工作区路径，并导出给各阶段模块"""
+    workspace = explicit or os.getenv('WORKSPACE') or os.getenv('GITHUB_WORKSPACE') or os.getcwd()
+    workspace = Path(workspace).resolve()
+    os.environ['WORKSPACE'] = str(workspace)
+    return workspace
+
+
+def load_script(name: str):
+    """按文件名导入阶段脚本（兼容 filter-dns 等带连字符的文件名）"""
+    return importlib.import_module(name)
+
+
+class Budget:
+    """运行时间预算: 各阶段软截止取配置值与"为下游阶段预留上次耗时后的最晚结束点"中较早者"""
+
+    def __init__(self, total: float, timings: Dict[str, float], selected: Sequence[str]):
+        self.total = total
+        self.timings = timings
+        self.start = time.monotonic()
+        self.tails: Dict[str, float] = {}   # 阶段 → 下游必需阶段的最长预计耗时
+        for stage in reversed(STAGES):
+            children = [s.name for s in STAGES if stage.name in s.deps
+                        and s.name in selected and s.name not in OPTIONAL_STAGES]
+            self.tails[stage.name] = max((timings.get(c, 0.0) + self.tails[c] for c in children), default=0.0)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        return self.total - self.elapsed()
+
+    def offset(self, name: str) -> float:
+        """阶段软截止（距运行开始的秒数）"""
+        latest = self.total - self.tails.get(name, 0.0) - RESERVE
+        return max(0.0, min(STAGE_DEADLINES.get(name, self.total), latest))
+
+    def deadline(self, name: str) -> float:
+        """阶段软截止（time.monotonic() 时刻，传给阶段内部）"""
+        return self.start + self.offset(name)
+
+    def fits(self, name: str) -> bool:
+        """按上次耗时估算，阶段能否在软截止前完成"""
+        return self.elapsed() + self.timings.get(name, 0.0) <= self.offset(name)
+
+
+class Context:
+    """流水线上下文：工作区路径、阶段间的内存数据、运行预算与已触发的降级"""
+
+    def __init__(self, workspace: Path, budget: Optional[Budget] = None):
+        self.workspace = workspace
+        self.temp_dir = workspace / "tmp"
+        self.data: Dict[str, object] = {}
+        self.budget = budget or Budget(RUN_BUDGET, {}, [])
+        self.fallbacks: List[dict] = []
+
+    def fallback(self, stage: str, action: str, detail: str):
+        """记录一次降级（写入运行元数据）"""
+        print(f"🪂 [{stage}] 降级: {detail}")
+        self.fallbacks.append({'stage': stage, 'action': action, 'detail': detail,
+                               'at': round(self.budget.elapsed(), 1)})
+
+    def rules(self, key: str, filename: str) -> List[str]:
+        """读取上游阶段的内存结果；单独运行时回退到磁盘文件"""
+        if key not in self.data:
+            with open(self.workspace / filename, 'r', encoding='utf-8', errors='ignore') as f:
+                self.data[key] = [line.strip() for line in f if line.strip()]
+        return self.data[key]
+
+
+# === 阶段实现 ===
+def stage_download(ctx: Context) -> bool:
+    dl = load_script('dl')
+    dl.clean_files(str(ctx.workspace), keep=KEEP_OUTPUTS)
+    dl.create_temp_dir(str(ctx.temp_dir), str(ctx.workspace / "data" / "mod"))
+    restored: List[str] = []
+    success = dl.download_rules(temp_dir=str(ctx.temp_dir), deadline=ctx.budget.deadline('download'),
+                                last_good_dir=str(ctx.workspace / "data" / "cache" / "sources"), restored=restored)
+    if restored:
+        ctx.fallback('download', 'last-good-source', f"{len(restored)} 个源沿用上次成功副本: {', '.join(sorted(restored))}")
+    return success + len(restored) > 0
+
+
+def stage_merge(ctx: Context) -> bool:
+    merge = load_script('merge')
+    ctx.data['adblock'] = merge.merge_files('adblock*.txt', 'adblock.txt', str(ctx.temp_dir), str(ctx.workspace))
+    ctx.data['allow'] = merge.merge_files('allow*.txt', 'allow.txt', str(ctx.temp_dir), str(ctx.workspace))
+    return True
+
+
+def stage_regex(ctx: Context) -> bool:
+    regexcost = load_script('regexcost')
+    lists = {filename: ctx.rules(key, filename) for key, filename in (('adblock', 'adblock.txt'), ('allow', 'allow.txt'))}
+    try:
+        output = regexcost.run(lists, ctx.workspace)
+    except Exception as e:   # 分析器故障不应阻断出规则，原样保留列表
+        print(f"⚠️ 正则成本分析失败，保留原列表: {type(e).__name__}: {e}")
+        return True
+    for key, filename in (('adblock', 'adblock.txt'), ('allow', 'allow.txt')):
+        if output[filename] is not lists[filename]:
+            ctx.data[key] = output[filename]
+            regexcost.write_rules(output[filename], ctx.workspace / filename)
+    return True
+
+
+def stage_dns(ctx: Context) -> bool:
+    import asyncio
+    dns = load_script('filter-dns')
+    processor = dns.BlacklistProcessor(deadline=ctx.budget.deadline('dns'))
+    asyncio.run(processor.process(ctx.rules('adblock', 'adblock.txt'), ctx.workspace))
+    ctx.data['dns'] = sorted(processor.adguard_rules, key=dns.order_key)
+    skipped = processor.dns_validator.deadline_skipped
+    if skipped:
+        ctx.fallback('dns', 'trust-cache', f"{skipped} 个域名超过验证截止时间未查询，信任已有结论并按有效保留")
+    return True
+
+
+def stage_clash(ctx: Context) -> bool:
+    clash = load_script('clash')
+    converted = clash.convert_rules(ctx.rules('dns', clash.INPUT_FILE))
+    content = clash.build_ads_yaml(converted)
+    ctx.data['ads_yaml'] = content
+    return clash.write_ads_yaml(content, ctx.workspace / clash.OUTPUT_FILE)
+
+
+def stage_mrs(ctx: Context) -> bool:
+    mihomo = load_script('mihomo')
+    input_path = None
+    if 'ads_yaml' in ctx.data:
+        # 使用内存快照作为输入，避免与头信息阶段对 ads.yaml 的原地改写竞争
+        ctx.temp_dir.mkdir(parents=True, exist_ok=True)
+        input_path = ctx.temp_dir / mihomo.INPUT_FILE
+        input_path.write_text(ctx.data['ads_yaml'], encoding='utf-8')
+    return mihomo.main(ctx.workspace, input_path) == 0
+
+
+def stage_emit(ctx: Context) -> bool:
+    emit = load_script('emit')
+    return bool(emit.generate(ctx.rules('dns', emit.INPUT_FILE), ctx.workspace))
+
+
+def stage_compact(ctx: Context) -> bool:
+    compact = load_script('compact')
+    stats = compact.generate(ctx.rules('dns', compact.INPUT_FILE), ctx.workspace)
+    ctx.data['compact'] = stats
+    return bool(stats)
+
+
+def stage_compress(ctx: Context) -> bool:
+    compress = load_script('compress')
+    return bool(compress.compress_outputs(ctx.workspace))
+
+
+def stage_shard(ctx: Context) -> bool:
+    shard = load_script('shard')
+    return not shard.SHARD_MODE or bool(shard.generate(ctx.workspace))
+
+
+def stage_sketch(ctx: Context) -> bool:
+    dl = load_script('dl')
+    sketch = load_script('sketch')
+    report = sketch.run(ctx.workspace, dl.ADBLOCK_SOURCES, dl.ALLOW_SOURCES)
+    ctx.data['source_overlap'] = report
+    return any(r['sources'] for r in report.values())
+
+
+def stage_title(ctx: Context) -> bool:
+    title = load_script('title')
+    return title.stamp_files(ctx.workspace, title.get_beijing_time()) > 0
+
+
+def stage_readme(ctx: Context) -> bool:
+    readme = load_script('clean-readme')
+    return readme.refresh_readme(ctx.workspace)
+
+
+class Stage(NamedTuple):
+    name: str
+    func: Callable[[Context], bool]
+    deps: tuple
+    description: str
+
+
+STAGES: List[Stage] = [
+    Stage('download', stage_download, (), "下载上游规则"),
+    Stage('merge', stage_merge, ('download',), "合并去重"),
+    Stage('regex', stage_regex, ('merge',), "正则规则成本分析与隔离"),
+    Stage('dns', stage_dns, ('regex',), "生成DNS/Hosts规则"),
+    Stage('clash', stage_clash, ('dns',), "生成Clash规则"),
+    Stage('mrs', stage_mrs, ('clash',), "生成Mihomo二进制规则"),
+    Stage('title', stage_title, ('clash',), "写入规则头信息"),
+    Stage('readme', stage_readme, ('title',), "更新README统计"),
+    Stage('emit', stage_emit, ('dns',), "生成解析器原生格式"),
+    Stage('compact', stage_compact, ('dns',), "生成紧凑二进制查询产物"),
+    Stage('compress', stage_compress, ('title', 'emit', 'compact'), "预压缩输出与清单"),
+    Stage('shard', stage_shard, ('title',), "输出分片与分片索引"),
+    Stage('sketch', stage_sketch, ('merge',), "源重叠与冗余分析"),
+]
+STAGE_MAP = {stage.name: stage for stage in STAGES}
+
+
+# === 调度 ===
+def execute(stage: Stage, ctx: Context) -> dict:
+    """执行单个阶段并记录耗时（阶段内的 sys.exit 视为失败）"""
+    print(f"▶️ [{stage.name}] {stage.description}")
+    start = time.perf_counter()
+    try:
+        with instrument.stage(f'pipeline:{stage.name}'):
+            ok = bool(stage.func(ctx))
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        traceback.print_exc()
+        print(f"🔥 [{stage.name}] 异常: {type(e).__name__}: {e}")
+        ok = False
+    elapsed = time.perf_counter() - start
+    print(f"{'✅' if ok else '❌'} [{stage.name}] 耗时 {elapsed:.1f}s")
+    return {'status': 'ok' if ok else 'failed', 'seconds': round(elapsed, 3)}
+
+
+def run_pipeline(ctx: Context, selected: List[str]) -> Dict[str, dict]:
+    """
+    按依赖关系调度阶段；依赖失败的阶段跳过，其余阶段照常执行
+    可选阶段在剩余预算不足时不再启动（degraded，沿用上次产物），其下游按成功处理
+    """
+    pending = [name for name in selected]
+    results: Dict[str, dict] = {}
+    running: Dict[concurrent.futures.Future, str] = {}
+
+    # cProfile 剖析时串行执行: 每个流水线阶段独占剖析器，阶段内子阶段计入其中（3.12+ 同一时刻只能有一个剖析器）
+    workers = 1 if instrument.PROFILE else MAX_PARALLEL
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in list(pending):
+                    deps = [d for d in STAGE_MAP[name].deps if d in selected]
+                    if any(results.get(d, {}).get('status') in ('failed', 'skipped') for d in deps):
+                        print(f"⏭️ [{name}] 依赖阶段未成功，跳过")
+                        results[name] = {'status': 'skipped', 'seconds': 0.0}
+                    elif not all(results.get(d, {}).get('status') in ('ok', 'degraded') for d in deps):
+                        continue
+                    elif name in OPTIONAL_STAGES and not ctx.budget.fits(name):
+                        ctx.fallback(name, 'skip-stage', f"剩余预算 {ctx.budget.remaining():.0f}s 不足，{OPTIONAL_STAGES[name]}")
+                        results[name] = {'status': 'degraded', 'seconds': 0.0}
+                    else:
+                        running[pool.submit(execute, STAGE_MAP[name], ctx)] = name
+                    pending.remove(name)
+                    progressed = True
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+
+# === 计划 / 计时 ===
+def load_timings(ctx: Context) -> Dict[str, float]:
+    path = ctx.workspace / TIMINGS_FILE
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_timings(ctx: Context, results: Dict[str, dict]):
+    timings = load_timings(ctx)
+    timings.update({name: r['seconds'] for name, r in results.items() if r['status'] == 'ok'})
+    path = ctx.workspace / TIMINGS_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(timings, f, ensure_ascii=False, indent=2)
+
+
+def save_run(ctx: Context, selected: List[str], results: Dict[str, dict]):
+    """写出本次运行元数据（随仓库持久化，记录哪些降级生效）"""
+    budget = ctx.budget
+    elapsed = budget.elapsed()
+    meta = {
+        'started': int(time.time() - elapsed),
+        'budget': budget.total,
+        'seconds': round(elapsed, 1),
+        'over_budget': elapsed > budget.total,
+        'stages': {name: results.get(name, {'status': 'skipped', 'seconds': 0.0}) for name in selected},
+        'fallbacks': ctx.fallbacks,
+    }
+    path = ctx.workspace / RUN_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def print_plan(ctx: Context, selected: List[str]):
+    """打印执行计划：依赖、上次耗时、按关键路径估算的起止时间与软截止"""
+    budget = ctx.budget
+    timings = budget.timings
+    finish: Dict[str, float] = {}
+    print("\n" + "=" * 74)
+    print(f"{'阶段':<10}{'依赖':<16}{'预计耗时':>10}{'预计开始':>10}{'预计结束':>10}{'软截止':>10}")
+    for name in selected:
+        deps = [d for d in STAGE_MAP[name].deps if d in selected]
+        start = max((finish[d] for d in deps), default=0.0)
+        estimate = timings.get(name)
+        finish[name] = start + (estimate or 0.0)
+        shown = f"{estimate:.1f}s" if estimate is not None else "未知"
+        print(f"{name:<10}{','.join(deps) or '-':<16}{shown:>10}{start:>9.1f}s{finish[name]:>9.1f}s"
+              f"{budget.offset(name):>9.0f}s")
+    serial = sum(timings.get(name, 0.0) for name in selected)
+    print("=" * 74)
+    print(f"预计总耗时: {max(finish.values(), default=0.0):.1f}s (串行 {serial:.1f}s) | 运行预算 {budget.total:.0f}s")
+
+
+def select_stages(only: Optional[List[str]], skip: Optional[List[str]]) -> List[str]:
+    names = [stage.name for stage in STAGES]
+    if only:
+        names = [n for n in names if n in only]
+    if skip:
+        names = [n for n in names if n not in skip]
+    return names
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="EasyAds 规则流水线编排器")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help="按DAG运行流水线")
+    run.add_argument('--only', nargs='+', choices=list(STAGE_MAP), help="仅运行指定阶段")
+    run.add_argument('--skip', nargs='+', choices=list(STAGE_MAP), help="跳过指定阶段")
+    for stage in STAGES:
+        single = sub.add_parser(stage.name, help=f"单独运行: {stage.description}")
+        single.set_defaults(only=[stage.name], skip=None)
+    for subparser in sub.choices.values():
+        subparser.add_argument('--workspace', help="工作区路径（默认 WORKSPACE / GITHUB_WORKSPACE / 当前目录）")
+        subparser.add_argument('--dry-run', action='store_true', help="仅打印执行计划与预计耗时")
+        subparser.add_argument('--budget', type=float, default=RUN_BUDGET,
+                               help=f"运行时间预算（秒，默认 PIPELINE_BUDGET 或 {RUN_BUDGET:.0f}）")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    workspace = resolve_workspace(args.workspace)
+    selected = select_stages(args.only, args.skip)
+    ctx = Context(workspace)
+    ctx.budget = Budget(args.budget, load_timings(ctx), selected)
+
+    print("🚀 规则流水线启动")
+    print(f"工作目录: {ctx.workspace}")
+    if args.dry_run:
+        print_plan(ctx, selected)
+        return 0
+
+    results = run_pipeline(ctx, selected)
+    save_timings(ctx, results)
+    save_run(ctx, selected, results)
+
+    failed = [name for name, r in results.items() if r['status'] not in ('ok', 'degraded')]
+    print("\n" + "=" * 50)
+    for name in selected:
+        r = results.get(name, {'status': 'skipped', 'seconds': 0.0})
+        print(f"{name:<10}{r['status']:<10}{r['seconds']:>8.1f}s")
+    elapsed = ctx.budget.elapsed()
+    print(f"总耗时: {elapsed:.1f}s / 预算 {ctx.budget.total:.0f}s{' ⏰ 超出预算' if elapsed > ctx.budget.total else ''}")
+    for fallback in ctx.fallbacks:
+        print(f"🪂 {fallback['stage']}: {fallback['detail']}")
+    print("=" * 50)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+公共后缀列表 (Public Suffix List)
+• 随仓库附带 data/psl/public_suffix_list.dat 快照（环境变量 EASYADS_PSL 可指定其它路径）
+• registrable_domain(): 可注册域名 (eTLD+1)，如 ads.tracker.example.co.uk → example.co.uk
+• 支持通配 (*.ck) 与例外 (!www.ck) 规则；列表首次使用时加载，结果 LRU 缓存
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Set, Tuple
+
+from domains import normalize_domain
+
+# === 配置区 ===
+PSL_FILE = Path(os.getenv('EASYADS_PSL', Path(__file__).resolve().parent.parent / "psl" / "public_suffix_list.dat"))
+PSL_CACHE_SIZE = 1 << 16   # 可注册域名 LRU 缓存上限
+
+_rules: Optional[Tuple[Set[str], Set[str], Set[str]]] = None   # (普通规则, 通配规则父域, 例外规则)
+
+
+def load_rules(path: Path = PSL_FILE) -> Tuple[Set[str], Set[str], Set[str]]:
+    """解析后缀列表（规则统一为规范化的 punycode 形式）"""
+    exact, wildcard, exception = set(), set(), set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            rule = line.split(None, 1)[0] if line.strip() else ''
+            if not rule or rule.startswith('//'):
+                continue
+            target = exact
+            if rule.startswith('!'):
+                target, rule = exception, rule[1:]
+            elif rule.startswith('*.'):
+                target, rule = wildcard, rule[2:]
+            domain = normalize_domain(rule)
+            if domain is not None:
+                target.add(domain)
+    return exact, wildcard, exception
+
+
+def _get_rules() -> Tuple[Set[str], Set[str], Set[str]]:
+    global _rules
+    if _rules is None:
+        _rules = load_rules()
+    return _rules
+
+
+@lru_cache(maxsize=PSL_CACHE_SIZE)
+def public_suffix(domain: str) -> str:
+    """域名的公共后缀（未列出的顶级域按默认规则 '*' 处理；domain 需已规范化）"""
+    exact, wildcard, exception = _get_rules()
+    labels = domain.split('.')
+    for i in range(len(labels)):
+        candidate = '.'.join(labels[i:])
+        if candidate in exception:
+            return '.'.join(labels[i + 1:])
+        if candidate in exact or (i + 1 < len(labels) and '.'.join(labels[i + 1:]) in wildcard):
+            return candidate
+    return labels[-1]
+
+
+def registrable_domain(domain: str) -> Optional[str]:
+    """可注册域名 (eTLD+1)；域名本身是公共后缀时返回 None（domain 需已规范化）"""
+    suffix = public_suffix(domain)
+    if len(suffix) >= len(domain):
+        return None
+    head = domain[:len(domain) - len(suffix) - 1]
+    return f"{head.rsplit('.', 1)[-1]}.{suffix}"
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+正则规则成本分析 (合并之后、DNS规则生成之前)
+• 上游的 /.../ 正则规则原样进入输出，单条病态正则会拖慢加载本列表的每次查询
+• 静态检查: 嵌套量词（灾难性回溯）| 相邻通配链（多项式回溯）| 前后瞻/反向引用（RE2 类引擎不支持）| 无法编译
+• 动态测量: 每条正则在固定域名语料（含长重复标签等对抗样本）上的平均单次匹配耗时；在子进程中执行，超过单条时间上限即终止
+• 超出成本预算或超时的规则从输出中移出并写入报告（隔离，供人工复核）；与纯域名规则等价的正则改写为 ||domain^
+• 输出: data/stats/regex-report.json（汇总、被标记/改写/隔离的规则、最耗时的规则）
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from domains import normalize_domain
+from rules import KIND_REGEX, tokenize
+
+# === 配置区 ===
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+INPUT_FILES = ('adblock.txt', 'allow.txt')  # 分析并原地改写的根目录文件
+REPORT_FILE = Path("data") / "stats" / "regex-report.json"  # 报告位置（相对工作区）
+CORPUS_SIZE = 2000                # 固定域名语料规模（含对抗样本）
+CORPUS_SEED = 20240601            # 语料随机种子（固定，使各次运行的成本可比）
+COST_BUDGET_US = 20.0             # 单条正则平均单次匹配耗时预算（微秒），超出即隔离
+RULE_TIME_CAP = 1.0               # 单条正则测量总时长上限（秒），超时即终止并隔离
+WORKER_STARTUP = 10.0             # 测量子进程启动等待上限（秒）
+LARGE_REPEAT = 8                  # 上限不小于该值（或无上限）的量词视为"大量词"
+WILDCARD_CHAIN = 3                # 同一序列中大通配量词达到该数量即标记
+MAX_EXPANSION = 16                # 改写时分支展开得到的域名数上限
+REPORT_TOP = 20                   # 报告中列出的最耗时规则数
+
+FLAG_NESTED = 'nested-quantifier'
+FLAG_CHAIN = 'wildcard-chain'
+FLAG_LOOKAROUND = 'lookaround'
+FLAG_BACKREF = 'backreference'
+FLAG_INVALID = 'invalid'
+
+
+def _sre_parse():
+    try:
+        import re._parser as sre_parse   # Python 3.11+
+    except ImportError:
+        import sre_parse
+    return sre_parse
+
+
+def build_corpus(size: int = CORPUS_SIZE, seed: int = CORPUS_SEED) -> List[str]:
+    """固定域名语料: 常见形态的随机域名 + 长重复标签/深层子域等回溯对抗样本"""
+    rng = random.Random(seed)
+    labels = ['www', 'ads', 'api', 'cdn', 'static', 'img', 'm', 'track', 'analytics', 'mail', 'log', 'pixel']
+    tlds = ['com', 'net', 'org', 'cn', 'io', 'co.uk', 'com.cn', 'xyz', 'top']
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    adversarial = []
+    for ch in 'a0-':
+        for length in (16, 32, 63):
+            adversarial.append(f"{'a' if ch == '-' else ''}{ch * length}a.com")
+    for depth in (8, 16, 40):
+        adversarial.append('.'.join(['a'] * depth) + '.com')
+        adversarial.append('.'.join(['ab-1'] * depth) + '.net')
+    adversarial.append('.'.join(['a' * 63] * 3) + '.' + 'b' * 61)   # 接近 253 字节上限
+    corpus = list(adversarial)
+    while len(corpus) < size:
+        name = ''.join(rng.choice(alphabet) for _ in range(rng.randint(3, 15)))
+        prefix = [rng.choice(labels) for _ in range(rng.choice((0, 0, 1, 1, 2, 3)))]
+        corpus.append('.'.join(prefix + [name, rng.choice(tlds)]))
+    return corpus[:size]
+
+
+# === 静态检查 ===
+def _children(name: str, av) -> list:
+    """子表达式序列（按 sre 操作码名称取，兼容各 Python 版本的解析树）"""
+    if name == 'SUBPATTERN':
+        return [av[-1]]
+    if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+        return [av[2]]
+    if name == 'BRANCH':
+        return list(av[1])
+    if name in ('ASSERT', 'ASSERT_NOT'):
+        return [av[1]]
+    if name == 'ATOMIC_GROUP':
+        return [av]
+    if name == 'GROUPREF_EXISTS':
+        return [sub for sub in av[1:] if sub is not None]
+    return []
+
+
+def _is_large(av, maxrepeat) -> bool:
+    return av[1] is maxrepeat or av[1] >= LARGE_REPEAT
+
+
+def _delimited(repeat_body, follower) -> bool:
+    """内层量词之后紧跟一个它无法匹配的字面字符（如 [^.]+\\.），回溯被该字符截断"""
+    items = list(repeat_body)
+    if len(items) != 1 or follower is None or str(follower[0]) != 'LITERAL':
+        return False
+    op, av = items[0]
+    char = follower[1]
+    if str(op) == 'NOT_LITERAL':
+        return av == char
+    if str(op) == 'IN':
+        return str(av[0][0]) == 'NEGATE' and any(str(o) == 'LITERAL' and v == char for o, v in av[1:])
+    return False
+
+
+def static_flags(body: str) -> Set[str]:
+    """正则结构风险标记"""
+    sre_parse = _sre_parse()
+    try:
+        tree = sre_parse.parse(body)
+    except (re.error, RecursionError, OverflowError):
+        return {FLAG_INVALID}
+    flags: Set[str] = set()
+
+    def walk(items, inside_large: bool):
+        items = list(items)
+        chain = 0
+        for i, (op, av) in enumerate(items):
+            name = str(op)
+            if name in ('ASSERT', 'ASSERT_NOT'):
+                flags.add(FLAG_LOOKAROUND)
+            elif name in ('GROUPREF', 'GROUPREF_EXISTS'):
+                flags.add(FLAG_BACKREF)
+            if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') and _is_large(av, sre_parse.MAXREPEAT):
+                follower = items[i + 1] if i + 1 < len(items) else None
+                if inside_large and not _delimited(av[2], follower):
+                    flags.add(FLAG_NESTED)
+                body_items = list(av[2])
+                if len(body_items) == 1 and str(body_items[0][0]) in ('ANY', 'NOT_LITERAL', 'IN'):
+                    chain += 1
+                walk(av[2], True)
+                continue
+            for child in _children(name, av):
+                walk(child, inside_large)
+        if chain >= WILDCARD_CHAIN:
+            flags.add(FLAG_CHAIN)
+
+    walk(tree, False)
+    return flags
+
+
+# === 等价改写 ===
+def _literal_text(items) -> Optional[List[str]]:
+    """纯字面序列（可含字面分支）→ 展开后的全部字符串；含其它结构时返回 None"""
+    variants = ['']
+    for op, av in items:
+        name = str(op)
+        if name == 'LITERAL':
+            variants = [v + chr(av) for v in variants]
+            continue
+        if name == 'SUBPATTERN':
+            options = _literal_text(av[-1])
+        elif name == 'BRANCH':
+            options = []
+            for branch in av[1]:
+                expanded = _literal_text(branch)
+                if expanded is None:
+                    return None
+                options.extend(expanded)
+        else:
+            return None
+        if options is None:
+            return None
+        variants = [v + option for v in variants for option in options]
+        if len(variants) > MAX_EXPANSION:
+            return None
+    return variants
+
+
+def _is_at(item, where: str) -> bool:
+    return str(item[0]) == 'AT' and str(item[1]) == where
+
+
+def _is_dot(item) -> bool:
+    return str(item[0]) == 'LITERAL' and item[1] == 46
+
+
+def _is_subdomain_prefix(op, av, maxrepeat) -> bool:
+    """可选子域前缀: (.+\\.)? / (.*\\.)? / ([^.]+\\.)* / (.+\\.)*"""
+    if str(op) != 'MAX_REPEAT' or av[0] != 0 or not (av[1] == 1 or av[1] is maxrepeat):
+        return False
+    inner = list(av[2])
+    if len(inner) == 1 and str(inner[0][0]) == 'SUBPATTERN':
+        inner = list(inner[0][1][-1])
+    if len(inner) != 2 or not _is_dot(inner[1]):
+        return False
+    rop, rav = inner[0]
+    if str(rop) != 'MAX_REPEAT' or rav[1] is not maxrepeat:
+        return False
+    element = list(rav[2])
+    return len(element) == 1 and (str(element[0][0]) == 'ANY' or _delimited(rav[2], inner[1]))
+
+
+def _is_boundary(op, av) -> bool:
+    """(^|\\.) / (?:\\.|^) 形式的域名边界"""
+    if str(op) == 'SUBPATTERN':
+        inner = list(av[-1])
+        if len(inner) != 1:
+            return False
+        op, av = inner[0]
+    if str(op) != 'BRANCH':
+        return False
+    branches = [list(branch) for branch in av[1]]
+    if len(branches) != 2 or any(len(branch) != 1 for branch in branches):
+        return False
+    (a,), (b,) = branches
+    return (_is_at(a, 'AT_BEGINNING') and _is_dot(b)) or (_is_dot(a) and _is_at(b, 'AT_BEGINNING'))
+
+
+def rewrite_hosts(body: str) -> Optional[List[str]]:
+    """与 ||domain^ 等价的正则 → 域名列表（^(.+\\.)?example\\.com$、(^|\\.)(a|b)\\.com$ 等）；否则 None"""
+    sre_parse = _sre_parse()
+    try:
+        items = list(sre_parse.parse(body))
+    except (re.error, RecursionError, OverflowError):
+        return None
+    if len(items) < 3 or not _is_at(items[-1], 'AT_END'):
+        return None
+    first = items[0]
+    if _is_at(first, 'AT_BEGINNING') and _is_subdomain_prefix(*items[1], sre_parse.MAXREPEAT):
+        middle = items[2:-1]
+    elif _is_boundary(*first):
+        middle = items[1:-1]
+    else:
+        return None
+    hosts = _literal_text(middle)
+    if not hosts or any(normalize_domain(host) != host for host in hosts):
+        return None
+    return hosts
+
+
+# === 动态测量 ===
+def _worker(conn, bodies: List[str], corpus: List[str]):
+    """测量子进程: 逐条发送 (是否可编译, 平均单次匹配微秒)"""
+    conn.send(None)
+    for body in bodies:
+        try:
+            search = re.compile(body).search
+        except (re.error, RecursionError, OverflowError):
+            conn.send((False, 0.0))
+            continue
+        start = time.perf_counter()
+        for domain in corpus:
+            search(domain)
+        conn.send((True, (time.perf_counter() - start) / len(corpus) * 1e6))
+    conn.close()
+
+
+def measure(bodies: List[str], corpus: List[str], cap: float = RULE_TIME_CAP) -> List[Tuple[bool, Optional[float]]]:
+    """各正则的 (可编译, 平均单次匹配微秒)；超过时间上限的为 (True, None)，测量子进程随即重建"""
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')   # 流水线为多线程进程，不使用 fork
+    results: List[Tuple[bool, Optional[float]]] = []
+    while len(results) < len(bodies):
+        parent, child = context.Pipe(duplex=False)
+        worker = context.Process(target=_worker, args=(child, bodies[len(results):], corpus), daemon=True)
+        worker.start()
+        child.close()
+        try:
+            if parent.poll(WORKER_STARTUP):
+                parent.recv()
+                while len(results) < len(bodies) and parent.poll(cap):
+                    results.append(parent.recv())
+        except EOFError:
+            pass
+        finally:
+            worker.kill()
+            worker.join()
+            parent.close()
+        if len(results) < len(bodies):
+            results.append((True, None))   # 当前规则超时（或测量进程异常退出）
+    return results
+
+
+# === 分析 ===
+def analyze(lists: Dict[str, List[str]], corpus: Optional[List[str]] = None) -> Tuple[Dict[str, List[str]], dict]:
+    """分析各列表中的正则规则，返回 (改写后的列表, 报告)"""
+    corpus = corpus or build_corpus()
+    located = []   # (文件名, 行号, 规则, 正则体)
+    for name, rules in lists.items():
+        for i, rule in enumerate(rules):
+            kind, _, start, end, _, _, _ = tokenize(rule)
+            if kind == KIND_REGEX:
+                located.append((name, i, rule, rule[start:end]))
+
+    started = time.perf_counter()
+    unique = list(dict.fromkeys(body for _, _, _, body in located))
+    costs = dict(zip(unique, measure(unique, corpus)))
+    flags = {body: static_flags(body) for body in unique}
+
+    entries, replaced = [], {}
+    counts = {'regex': len(located), 'flagged': 0, 'rewritten': 0, 'quarantined': 0, 'invalid': 0}
+    for name, i, rule, body in located:
+        compiled, cost = costs[body]
+        entry = {'rule': rule, 'list': name, 'cost_us': None if cost is None else round(cost, 3),
+                 'flags': sorted(flags[body] | (set() if compiled else {FLAG_INVALID})), 'action': 'kept'}
+        hosts = rewrite_hosts(body) if compiled else None
+        if hosts:   # 等价改写优先（改写后无论原正则成本如何都不再有回溯）
+            _, exception, _, _, pattern_end, _, _ = tokenize(rule)
+            prefix, options = '@@' if exception else '', rule[pattern_end:]
+            entry['action'] = 'rewritten'
+            entry['replacement'] = [f"{prefix}||{host}^{options}" for host in hosts]
+            replaced[(name, i)] = entry['replacement']
+        elif not compiled:
+            entry['action'] = 'invalid'
+            replaced[(name, i)] = []
+        elif cost is None or cost > COST_BUDGET_US:
+            entry['action'] = 'quarantined'
+            replaced[(name, i)] = []
+        counts['flagged'] += bool(entry['flags'])
+        if entry['action'] != 'kept':
+            counts[entry['action']] += 1
+        entries.append(entry)
+
+    output = {}
+    for name, rules in lists.items():
+        if not any(key[0] == name for key in replaced):
+            output[name] = rules
+            continue
+        present = set(rules)
+        result = []
+        for i, rule in enumerate(rules):
+            if (name, i) not in replaced:
+                result.append(rule)
+                continue
+            for new_rule in replaced[(name, i)]:
+                if new_rule not in present:   # 已有同名域名规则时不重复添加
+                    present.add(new_rule)
+                    result.append(new_rule)
+        output[name] = result
+
+    measured = [e for e in entries if e['cost_us'] is not None]
+    report = {
+        'generated': int(time.time()),
+        'corpus': len(corpus),
+        'budget_us': COST_BUDGET_US,
+        'cap_seconds': RULE_TIME_CAP,
+        'seconds': round(time.perf_counter() - started, 3),
+        'counts': counts,
+        'total_cost_us': round(sum(e['cost_us'] for e in measured if e['action'] in ('kept',)), 3),
+        'rules': [e for e in entries if e['flags'] or e['action'] != 'kept'],
+        'slowest': [{'rule': e['rule'], 'cost_us': e['cost_us']}
+                    for e in sorted(measured, key=lambda e: -e['cost_us'])[:REPORT_TOP]],
+    }
+    return output, report
+
+
+def write_report(report: dict, workspace: Path) -> Path:
+    path = Path(workspace) / REPORT_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(path.name + '.tmp')
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(temp, path)
+    return path
+
+
+def print_report(report: dict):
+    c = report['counts']
+    print(f"🧮 正则规则: {c['regex']} 条 | 风险标记 {c['flagged']} | 改写为域名规则 {c['rewritten']} | "
+          f"隔离 {c['quarantined']} | 无法编译 {c['invalid']} | 耗时 {report['seconds']:.1f}s")
+    for entry in report['rules']:
+        if entry['action'] == 'quarantined':
+            cost = '超时' if entry['cost_us'] is None else f"{entry['cost_us']:.1f}µs"
+            print(f"  🚧 隔离 [{cost}] {entry['rule']} {','.join(entry['flags'])}")
+    print(f"⏱️ 保留正则的单次查询总成本: {report['total_cost_us']:.1f}µs（{report['corpus']} 个域名语料上的平均）")
+
+
+def run(lists: Dict[str, List[str]], workspace: str = WORKSPACE) -> Dict[str, List[str]]:
+    """分析并写出报告，返回改写后的列表（调用方负责写回文件）"""
+    import instrument
+    with instrument.stage('regexcost:analyze'):
+        output, report = analyze(lists)
+    instrument.count('regexcost.quarantined', report['counts']['quarantined'])
+    instrument.count('regexcost.rewritten', report['counts']['rewritten'])
+    path = write_report(report, Path(workspace))
+    print_report(report)
+    print(f"💾 {path}")
+    return output
+
+
+def write_rules(rules: Iterable[str], path: Path):
+    temp = path.with_name(path.name + '.tmp')
+    with open(temp, 'w', encoding='utf-8') as f:
+        for rule in rules:
+            f.write(rule + '\n')
+    os.replace(temp, path)
+
+
+if __name__ == "__main__":
+    print("🚀 正则规则成本分析")
+    print(f"工作目录: {WORKSPACE}")
+    workspace = Path(WORKSPACE)
+    lists = {}
+    for filename in INPUT_FILES:
+        if (workspace / filename).exists():
+            with open(workspace / filename, 'r', encoding='utf-8') as f:
+                lists[filename] = [line.strip() for line in f if line.strip()]
+    if not lists:
+        print("❌ 未找到输入文件")
+        sys.exit(1)
+    for filename, rules in run(lists).items():
+        if rules is not lists[filename]:
+            write_rules(rules, workspace / filename)
+    sys.exit(0)
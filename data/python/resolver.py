@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+多上游 DNS 解析器池 (对冲查询)
+• 每个上游独立解析器: EWMA 时延 | EWMA 错误率 | 令牌桶限速，按得分选择最优上游
+• 对冲: 首个查询超过该上游时延分位数仍未返回时，向次优上游补发一次，先到先得
+• 结果分类: 存在 | 不存在 (NXDOMAIN / NODATA) | 暂时失败 (SERVFAIL / 超时 / 拒绝)
+• 暂时失败不代表域名失效，由调用方放入重试队列
+"""
+
+import random
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+import instrument
+
+# === 配置区 ===
+EWMA_ALPHA = 0.2          # EWMA 平滑系数
+LATENCY_WINDOW = 128      # 计算对冲分位数的最近时延样本数
+HEDGE_PERCENTILE = 0.9    # 超过该分位数仍未返回则对冲（None 关闭对冲）
+HEDGE_MIN_DELAY = 0.02    # 对冲等待下限（秒）
+ERROR_PENALTY = 4.0       # 得分 = EWMA时延 × (1 + 错误率 × 惩罚系数)
+RATE_LIMIT = 100.0        # 每上游每秒查询数
+RATE_BURST = 20           # 令牌桶容量
+
+# 查询结果
+RESULT_FOUND = 'found'
+RESULT_NXDOMAIN = 'nxdomain'
+RESULT_NODATA = 'nodata'
+RESULT_TRANSIENT = 'transient'
+CONCLUSIVE = (RESULT_FOUND, RESULT_NXDOMAIN, RESULT_NODATA)
+
+
+class TokenBucket:
+    """令牌桶限速（单事件循环内使用，无需加锁）"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """距下一个令牌可用的等待秒数"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        import asyncio
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class Upstream:
+    """单个上游服务器的解析器与健康统计"""
+
+    def __init__(self, address: str, timeout: float, rate: float, burst: int):
+        self.address = address
+        self.timeout = timeout
+        self.resolver = None
+        self.bucket = TokenBucket(rate, burst)
+        self.latency = 0.0               # 乐观先验: 未测量的上游优先被选中一次
+        self.error_rate = 0.0
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.queries = 0
+        self.failures = 0
+        self.hedges = 0                  # 作为对冲目标被补发的次数
+        self.hedge_wins = 0              # 对冲查询先于首个查询返回的次数
+
+    @property
+    def score(self) -> float:
+        return self.latency * (1 + self.error_rate * ERROR_PENALTY)
+
+    def hedge_delay(self, percentile: float) -> float:
+        """对冲等待时间: 最近时延样本的分位数（无样本时取超时的一半）"""
+        if not self.samples:
+            return self.timeout / 2
+        ordered = sorted(self.samples)
+        return max(HEDGE_MIN_DELAY, ordered[min(len(ordered) - 1, int(len(ordered) * percentile))])
+
+    def censor(self, elapsed: float):
+        """查询被对冲取消: 已等待时长是时延下限，仅在高于当前估计时计入"""
+        if elapsed > self.latency:
+            self.latency += EWMA_ALPHA * (elapsed - self.latency)
+
+    def record(self, elapsed: float, ok: bool):
+        self.queries += 1
+        self.latency += EWMA_ALPHA * (elapsed - self.latency)
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.samples.append(elapsed)
+        else:
+            self.failures += 1
+
+
+class ResolverPool:
+    """多上游解析器池: 选择最优上游，慢查询对冲，暂时失败与不存在分开报告"""
+
+    def __init__(self, servers: Sequence[str], timeout: float,
+                 rate: float = RATE_LIMIT, burst: int = RATE_BURST,
+                 hedge_percentile: Optional[float] = HEDGE_PERCENTILE):
+        self.upstreams = [Upstream(address, timeout, rate, burst) for address in servers]
+        random.shuffle(self.upstreams)  # 得分相同时的初始顺序随机化
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.query_errors = ()
+        self.nxdomain_codes = ()
+        self.nodata_codes = ()
+
+    async def setup(self):
+        """为每个上游创建独立解析器（仅在开启DNS验证时加载 aiodns）"""
+        import asyncio
+        import aiodns
+        loop = asyncio.get_running_loop()
+        for upstream in self.upstreams:
+            upstream.resolver = aiodns.DNSResolver(
+                nameservers=[upstream.address], loop=loop, timeout=self.timeout, tries=1)
+        self.query_errors = (aiodns.error.DNSError, asyncio.TimeoutError)
+        self.nxdomain_codes = (aiodns.error.ARES_ENOTFOUND, aiodns.error.ARES_ENONAME)
+        self.nodata_codes = (aiodns.error.ARES_ENODATA,)
+
+    async def close(self):
+        """关闭各上游解析器（c-ares 通道须在事件循环关闭前释放，否则回调落在已关闭的循环上）"""
+        for upstream in self.upstreams:
+            resolver, upstream.resolver = upstream.resolver, None
+            if resolver is None:
+                continue
+            close = getattr(resolver, 'close', None)   # aiodns 4: async close()；旧版本仅有 cancel()
+            if close is not None:
+                await close()
+            else:
+                resolver.cancel()
+
+    def ranked(self) -> List[Upstream]:
+        """按 得分 + 限速等待 排序（最优上游令牌耗尽时，仅在等待比换用次优上游更慢时才换用）"""
+        return sorted(self.upstreams, key=lambda u: u.score + u.bucket.wait_time())
+
+    async def _query_upstream(self, upstream: Upstream, name: str, qtype: str, hedge: bool = False) -> str:
+        """向单个上游查询一次并记录健康统计（hedge: 是否为对冲补发）"""
+        import asyncio
+        await upstream.bucket.acquire()
+        if hedge:
+            upstream.hedges += 1
+            instrument.count('dns.hedged')
+        resolver = upstream.resolver
+        query = getattr(resolver, 'query_dns', None) or resolver.query
+        instrument.count('dns.queries')
+        start = time.monotonic()
+        try:
+            with instrument.inflight('dns.queries_in_flight'):
+                await asyncio.wait_for(query(name, qtype), self.timeout * 2)
+            result = RESULT_FOUND
+        except asyncio.CancelledError:
+            upstream.censor(time.monotonic() - start)
+            raise
+        except self.query_errors as e:
+            code = e.args[0] if e.args else None
+            if code in self.nxdomain_codes:
+                result = RESULT_NXDOMAIN
+            elif code in self.nodata_codes:
+                result = RESULT_NODATA
+            else:
+                result = RESULT_TRANSIENT
+        upstream.record(time.monotonic() - start, result != RESULT_TRANSIENT)
+        return result
+
+    async def query(self, name: str, qtype: str = 'A') -> str:
+        """对冲查询: 首选上游超过时延分位数未返回、或暂时失败时，补发到次优上游"""
+        import asyncio
+        first, *backups = self.ranked()[:2]
+        tasks = {asyncio.ensure_future(self._query_upstream(first, name, qtype)): first}
+        delay = first.hedge_delay(self.hedge_percentile) if self.hedge_percentile and backups else None
+        hedge = None
+        result = RESULT_TRANSIENT
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    upstream = tasks.pop(task)
+                    result = task.result()
+                    if result in CONCLUSIVE:
+                        if upstream is hedge and tasks:
+                            hedge.hedge_wins += 1
+                        return result
+                if backups and (not done or not tasks):
+                    hedge = backups.pop()
+                    tasks[asyncio.ensure_future(self._query_upstream(hedge, name, qtype, True))] = hedge
+                    delay = None
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def report(self) -> List[Dict[str, object]]:
+        """各上游的健康统计"""
+        return [{
+            'server': u.address,
+            'queries': u.queries,
+            'failures': u.failures,
+            'latency_ms': round(u.latency * 1000, 1),
+            'error_rate': round(u.error_rate, 3),
+            'hedges': u.hedges,
+            'hedge_wins': u.hedge_wins,
+        } for u in self.upstreams]
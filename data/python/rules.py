@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+规则语法公共模块
+• 单遍分词: tokenize() 一次扫描得到 例外标记 | 模式类型 | 域名区间 | 修饰符位掩码
+• 分词结果按规则文本缓存: 同一进程内的合并/DNS/Clash/Hosts 各阶段共享，每条规则只扫描一次
+• 规则族路由: DNS可执行 | 网络(URL路径/请求修饰符) | 元素隐藏 | 脚本注入
+• 语义键: (动作, 规范化域名, 匹配范围, 修饰符)，跨语法识别 ||x^ / x / 0.0.0.0 x 等等价规则
+• 快速通道: canonical_form() 单次匹配识别规范形式的域名/Hosts 规则，各使用方共用，命中时无需分词与规范化
+• 仅 DNS 族规则可被 AdGuard Home 等解析器执行，其余规则分流到各自输出
+"""
+
+import re
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from domains import MAX_DOMAIN_LENGTH, clear_cache as _clear_domain_cache, label_key, normalize_domain
+
+# === 规则族 ===
+FAMILY_COMMENT = 'comment'
+FAMILY_DNS = 'dns'
+FAMILY_NETWORK = 'network'
+FAMILY_COSMETIC = 'cosmetic'
+FAMILY_SCRIPTLET = 'scriptlet'
+
+# === 模式类型 ===
+KIND_COMMENT = 0      # 注释 / 头部声明
+KIND_DOMAIN = 1       # ||example.com^
+KIND_ANCHOR = 2       # |example.com^ (单竖线锚点)
+KIND_PLAIN = 3        # example.com
+KIND_WILDCARD = 4     # *.example.com
+KIND_HOSTS = 5        # 0.0.0.0 example.com
+KIND_REGEX = 6        # /regex/
+KIND_URL = 7          # URL路径 / 非主机名模式
+KIND_COSMETIC = 8     # example.com##.ad
+KIND_SCRIPTLET = 9    # example.com#%#script
+
+# === 修饰符位 ===
+MOD_IMPORTANT = 1 << 0
+MOD_BADFILTER = 1 << 1
+MOD_CLIENT = 1 << 2
+MOD_CTAG = 1 << 3
+MOD_DENYALLOW = 1 << 4
+MOD_DNSTYPE = 1 << 5
+MOD_DNSREWRITE = 1 << 6
+MOD_CNAME = 1 << 7
+MOD_REDIRECT = 1 << 8
+MOD_APP = 1 << 9
+MOD_EXTENSION = 1 << 10
+MOD_DOCUMENT = 1 << 11
+MOD_THIRD_PARTY = 1 << 12
+MOD_DOMAIN = 1 << 13
+MOD_OTHER = 1 << 31   # 未登记的修饰符
+
+MODIFIER_BITS = {
+    'important': MOD_IMPORTANT,
+    'badfilter': MOD_BADFILTER,
+    'client': MOD_CLIENT,
+    'ctag': MOD_CTAG,
+    'denyallow': MOD_DENYALLOW,
+    'dnstype': MOD_DNSTYPE,
+    'dnsrewrite': MOD_DNSREWRITE,
+    'cname': MOD_CNAME,
+    'redirect': MOD_REDIRECT,
+    'app': MOD_APP,
+    'extension': MOD_EXTENSION,
+    'document': MOD_DOCUMENT,
+    'doc': MOD_DOCUMENT,
+    'third-party': MOD_THIRD_PARTY,
+    '3p': MOD_THIRD_PARTY,
+    'domain': MOD_DOMAIN,
+}
+
+# AdGuard Home 支持的DNS修饰符（其余修饰符的规则在解析器中被忽略）
+DNS_MODIFIERS = {'important', 'badfilter', 'client', 'ctag', 'denyallow', 'dnstype', 'dnsrewrite'}
+DNS_MODIFIER_MASK = (MOD_IMPORTANT | MOD_BADFILTER | MOD_CLIENT | MOD_CTAG
+                     | MOD_DENYALLOW | MOD_DNSTYPE | MOD_DNSREWRITE)
+
+# 需要保留取值的修饰符
+VALUED_MODIFIERS = {'dnsrewrite', 'dnstype', 'client', 'ctag', 'denyallow', 'domain'}
+MODIFIER_CACHE_SIZE = 4096   # 选项串 → (位掩码, 取值) 缓存上限
+TOKEN_CACHE_SIZE = 1 << 19   # 规则 → 分词结果 缓存上限（满后整体清空）
+
+# 元素隐藏 / 脚本注入分隔符（含例外形式）
+SCRIPTLET_MARKERS = ('#%#', '#@%#', '##+js(', '#@#+js(')
+COSMETIC_MARKERS = ('##', '#@#', '#?#', '#@?#', '#$#', '#@$#', '#$?#', '#@$?#')
+# 分隔符 → (类型, 分隔符本身长度)；按长度降序匹配，脚本注入的 +js( 属于规则体
+_MARKERS = sorted(
+    [(m, KIND_SCRIPTLET, len(m)) for m in ('#%#', '#@%#')]
+    + [(m, KIND_SCRIPTLET, len(m) - 4) for m in ('##+js(', '#@#+js(')]
+    + [(m, KIND_COSMETIC, len(m)) for m in COSMETIC_MARKERS],
+    key=lambda item: -len(item[0])
+)
+# 按 '#' 后的首字符分组（'##' 只需比对 ##+js( 与 ## 两项）
+_MARKERS_BY_SECOND = {second: [item for item in _MARKERS if item[0][1] == second]
+                      for second in {item[0][1] for item in _MARKERS}}
+
+# === 语义去重 ===
+ACTION_BLOCK = 'block'
+ACTION_ALLOW = 'allow'
+ACTION_REWRITE = 'rewrite'             # Hosts 指向非拦截地址，等同 DNS 重写
+SCOPE_SUBTREE = 'subtree'              # ||example.com^ / example.com: 域名及全部子域
+SCOPE_EXACT = 'exact'                  # 0.0.0.0 example.com: 仅该域名
+SCOPE_WILDCARD = 'wildcard'            # *.example.com: 仅子域
+BLOCK_IPS = ('0.0.0.0', '127.0.0.1', '::', '::1')  # 拦截地址（按表面形式优先级排列）
+# (模式类型, 锚点后缀) → 表面形式优先级，越小越优先
+SURFACE_RANKS = {
+    (KIND_DOMAIN, '^'): 0, (KIND_DOMAIN, ''): 1, (KIND_DOMAIN, '^|'): 2,
+    (KIND_PLAIN, ''): 3, (KIND_PLAIN, '^'): 4, (KIND_PLAIN, '^|'): 5,
+    (KIND_WILDCARD, '^'): 0, (KIND_WILDCARD, ''): 1, (KIND_WILDCARD, '^|'): 2,
+}
+
+ORDERED_KINDS = (KIND_DOMAIN, KIND_ANCHOR, KIND_PLAIN, KIND_WILDCARD, KIND_HOSTS)  # 按主机名排序输出的规则类型
+
+HOSTS_HEAD = re.compile(r'(\d+\.\d+\.\d+\.\d+)[ \t]+([^\s#]+)')
+# 域名类规则一次扫描: 例外 | 锚点 | 主机名 | 锚点后缀 | 修饰符（缺省的例外/锚点为空区间）
+# 主机名以 (?=(...))\3 整体匹配、不回溯（其后只能是 ^ | $ 或行尾）: URL/元素隐藏等规则失败时无需逐字符退回
+DOMAIN_RULE = re.compile(r'(@@|)(\|\|?|\*\.|)(?=([\w*.-]+))\3[\^|]*(?:\$(.*)|)')
+
+# 规范形式主机名: 小写 ASCII、1-63 字符标签、字母顶级域、总长不超过上限 —— 规范化结果即原文
+# （首标签置于循环外: 二级域名无需进入重复分组）
+CANONICAL_HOST = (rf'(?=[a-z0-9.-]{{1,{MAX_DOMAIN_LENGTH}}}(?![a-z0-9.-]))'
+                  r'[a-z0-9-]{1,63}\.(?:[a-z0-9-]{1,63}\.)*[a-z]{2,63}')
+# 规范形式规则（DOMAIN_RULE / HOSTS_HEAD 的子集，Hosts 置首以免 IP 被主机名分支吞下后回溯）
+# 分组: 1 IP | 2 Hosts主机名 ‖ 3 @@ | 4 锚点 (|| / *.) | 5 主机名 | 6 ^ | 7 修饰符串（无 $ 时为 None）
+# 可选部分写作 (x|) 而非 (x)?（缺省时为空串，免去可选分组的重复计数开销）
+CANONICAL_RULE = re.compile(
+    rf'(\d+\.\d+\.\d+\.\d+)[ \t]+({CANONICAL_HOST})'
+    rf'|(@@|)(\|\||\*\.|)({CANONICAL_HOST})(\^|)(?:\$(.*)|)')
+canonical_form = CANONICAL_RULE.fullmatch   # 规则 → 匹配对象 | None（命中时与 tokenize 的分词结果一致）
+
+
+class Token(NamedTuple):
+    """
+    单条规则的分词结果（区间均为原规则字符串的下标）
+    • start/end: 域名(模式)区间；元素隐藏/脚本规则为限定域名列表区间
+    • pattern_end: 模式结束位置（'$' 修饰符分隔符位置，或元素隐藏规则体起点）
+    • values: 带取值的修饰符（与缓存共享，只读）
+    """
+    kind: int
+    exception: bool
+    start: int
+    end: int
+    pattern_end: int
+    modifiers: int
+    values: Optional[Dict[str, str]]
+
+    def domain(self, rule: str) -> str:
+        return rule[self.start:self.end]
+
+    def suffix(self, rule: str) -> str:
+        """域名之后、修饰符之前的部分（如 '^'）"""
+        return rule[self.end:self.pattern_end]
+
+
+_new_token = tuple.__new__   # 绕过 NamedTuple.__new__ 的Python层调用
+_COMMENT_TOKEN = Token(KIND_COMMENT, False, 0, 0, 0, 0, None)
+_modifier_cache: Dict[str, Tuple[int, Optional[Dict[str, str]]]] = {}
+_token_cache: Dict[str, Token] = {}
+_option_keys: Dict[str, str] = {}
+
+
+def clear_caches():
+    """清空分词、修饰符与域名规范化缓存（基准测试冷启动用）"""
+    _token_cache.clear()
+    _modifier_cache.clear()
+    _option_keys.clear()
+    _clear_domain_cache()
+
+
+def parse_modifiers(options: str) -> Tuple[int, Optional[Dict[str, str]]]:
+    """解析修饰符串为 (位掩码, 取值)；同一选项串只解析一次"""
+    cached = _modifier_cache.get(options)
+    if cached is not None:
+        return cached
+
+    mask = 0
+    values = None
+    for option in options.split(','):
+        name, sep, value = option.strip().partition('=')
+        name = name.lstrip('~').lower()
+        if not name:
+            continue
+        mask |= MODIFIER_BITS.get(name, MOD_OTHER)
+        if sep and name in VALUED_MODIFIERS:
+            if values is None:
+                values = {}
+            values[name] = value
+
+    if len(_modifier_cache) >= MODIFIER_CACHE_SIZE:
+        _modifier_cache.clear()
+    cached = _modifier_cache[options] = (mask, values)
+    return cached
+
+
+def _tokenize_cosmetic(rule: str) -> Optional[Token]:
+    """识别元素隐藏 / 脚本注入规则（以首个 '#' 为分隔符起点）"""
+    pos = rule.find('#')
+    for marker, kind, length in _MARKERS_BY_SECOND.get(rule[pos + 1:pos + 2], ()):
+        if rule.startswith(marker, pos):
+            exception = '@' in marker or rule.startswith('@@')
+            return _new_token(Token, (kind, exception, 0, pos, pos + length, 0, None))
+    return None
+
+
+def tokenize(rule: str) -> Token:
+    """单遍分词（rule 需已去除首尾空白）"""
+    token = _token_cache.get(rule)
+    if token is not None:
+        return token
+
+    match = DOMAIN_RULE.fullmatch(rule)
+    if match is None:
+        token = _tokenize_other(rule)
+    else:
+        _, exception, anchor, host, options = match.regs
+        if anchor[0] == anchor[1]:
+            kind = KIND_PLAIN
+        elif anchor[1] - anchor[0] == 1:
+            kind = KIND_ANCHOR
+        elif rule[anchor[0]] == '|':
+            kind = KIND_DOMAIN
+        else:
+            kind = KIND_WILDCARD
+        if options[0] < 0:
+            pattern_end, modifiers, values = len(rule), 0, None
+        else:
+            pattern_end = options[0] - 1
+            modifiers, values = parse_modifiers(rule[options[0]:])
+        token = _new_token(Token, (kind, exception[1] > 0, host[0], host[1], pattern_end, modifiers, values))
+
+    if len(_token_cache) >= TOKEN_CACHE_SIZE:
+        _token_cache.clear()
+    _token_cache[rule] = token
+    return token
+
+
+def _tokenize_other(rule: str) -> Token:
+    """非域名形态规则：注释 | 正则 | 元素隐藏/脚本 | Hosts | URL路径"""
+    n = len(rule)
+    if not n or rule[0] in '![':
+        return _COMMENT_TOKEN
+
+    exception = rule.startswith('@@')
+    pos = 2 if exception else 0
+
+    # 正则规则（AdGuard Home 以主机名匹配）
+    if n - pos > 1 and rule[pos] == '/' and rule[-1] == '/':
+        return _new_token(Token, (KIND_REGEX, exception, pos + 1, n - 1, n, 0, None))
+
+    if '#' in rule:
+        token = _tokenize_cosmetic(rule)
+        if token is not None:
+            return token
+        if rule[0] == '#':
+            return _COMMENT_TOKEN
+
+    if rule[0].isdigit():
+        match = HOSTS_HEAD.match(rule)
+        if match:
+            return _new_token(Token, (KIND_HOSTS, False, match.start(2), match.end(2), n, 0, None))
+
+    # 其余均为URL路径 / 非主机名模式（域名形态已由 DOMAIN_RULE 识别）
+    dollar = rule.find('$', pos)
+    if dollar == -1:
+        return _new_token(Token, (KIND_URL, exception, pos, n, n, 0, None))
+    modifiers, values = parse_modifiers(rule[dollar + 1:])
+    return _new_token(Token, (KIND_URL, exception, pos, dollar, dollar, modifiers, values))
+
+
+def token_family(token: Token) -> str:
+    """根据分词结果判断规则族"""
+    kind = token.kind
+    if kind == KIND_COMMENT:
+        return FAMILY_COMMENT
+    if kind == KIND_COSMETIC:
+        return FAMILY_COSMETIC
+    if kind == KIND_SCRIPTLET:
+        return FAMILY_SCRIPTLET
+    if kind == KIND_HOSTS or kind == KIND_REGEX:
+        return FAMILY_DNS
+    if kind == KIND_URL or token.modifiers & ~DNS_MODIFIER_MASK:
+        return FAMILY_NETWORK
+    return FAMILY_DNS
+
+
+def order_key(rule: str) -> Tuple[int, Tuple[str, ...], str]:
+    """输出排序键: 带主机名的规则按反转标签排序（兄弟子域相邻），其余规则排在其后按原文排序"""
+    kind, _, start, end, _, _, _ = tokenize(rule)
+    if kind in ORDERED_KINDS and end > start:
+        return 0, label_key(rule[start:end].lower()), rule
+    return 1, (), rule
+
+
+def classify_rule(rule: str) -> str:
+    """判断规则所属族（rule 需已去除首尾空白）"""
+    return token_family(tokenize(rule))
+
+
+def _options_key(options: str) -> str:
+    """修饰符的规范形式：去空白、小写、排序"""
+    key = _option_keys.get(options)
+    if key is None:
+        if len(_option_keys) >= MODIFIER_CACHE_SIZE:
+            _option_keys.clear()
+        key = _option_keys[options] = ','.join(sorted(
+            option.strip().lower() for option in options.split(',') if option.strip()))
+    return key
+
+
+def semantic_key(rule: str, token: Optional[Token] = None) -> Tuple[Optional[tuple], int]:
+    """
+    规则的语义键与表面形式优先级（越小越优先）
+    • 语义键: (动作, 规范化域名, 匹配范围, 规范化修饰符)，Unicode 与 xn-- 形式视为同一域名
+    • 无法跨语法比较的规则（正则/URL/元素隐藏/多域名Hosts/非法域名等）返回 (None, 0)
+    """
+    if token is None:
+        match = canonical_form(rule)
+        if match is not None:
+            ip = match[1]
+            if ip is not None:
+                if ip in BLOCK_IPS:
+                    return (ACTION_BLOCK, match[2], SCOPE_EXACT, ''), BLOCK_IPS.index(ip)
+                return (ACTION_REWRITE, match[2], SCOPE_EXACT, ip), 0
+            anchor, options = match[4], match[7]
+            kind = KIND_DOMAIN if anchor == '||' else KIND_WILDCARD if anchor else KIND_PLAIN
+            scope = SCOPE_WILDCARD if kind == KIND_WILDCARD else SCOPE_SUBTREE
+            return ((ACTION_ALLOW if match[3] else ACTION_BLOCK, match[5], scope,
+                     '' if options is None else _options_key(options)), SURFACE_RANKS[kind, match[6]])
+
+    kind, exception, start, end, pattern_end, _, _ = token or tokenize(rule)
+    n = len(rule)
+    if kind == KIND_HOSTS:
+        if end != n:
+            return None, 0
+        ip = rule.split(None, 1)[0]
+        domain = normalize_domain(rule[start:end])
+        if domain is None:
+            return None, 0
+        if ip in BLOCK_IPS:
+            return (ACTION_BLOCK, domain, SCOPE_EXACT, ''), BLOCK_IPS.index(ip)
+        return (ACTION_REWRITE, domain, SCOPE_EXACT, ip), 0
+
+    rank = SURFACE_RANKS.get((kind, rule[end:pattern_end]))
+    if rank is None or rule.find('*', start, end) >= 0:
+        return None, 0
+    domain = normalize_domain(rule[start:end])
+    if domain is None:
+        return None, 0
+    action = ACTION_ALLOW if exception else ACTION_BLOCK
+    scope = SCOPE_WILDCARD if kind == KIND_WILDCARD else SCOPE_SUBTREE
+    options = _options_key(rule[pattern_end + 1:]) if pattern_end < n else ''
+    return (action, domain, scope, options), rank
+
+
+def covering_key(key: tuple) -> Optional[tuple]:
+    """可覆盖该语义键的子树键（精确/通配 → 同动作同修饰符的子树规则）"""
+    action, domain, scope, options = key
+    if scope == SCOPE_SUBTREE or action == ACTION_REWRITE:
+        return None
+    return (action, domain, SCOPE_SUBTREE, options)
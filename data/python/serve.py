@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+本地规则发布服务器 (http.server，HTTP/1.1 长连接)
+• 发布根目录输出文件: 强 ETag 取自构建清单 manifest.json 的 SHA-256（清单过期时按文件内容计算）
+• If-None-Match → 304 | Range / If-Range → 206 (单区间) | Accept-Encoding 协商到预压缩的 .br / .zst / .gz 文件
+• 响应体经 socket.sendfile 零拷贝发送；文件被构建原子替换时按打开的文件句柄描述，不会出现 ETag 与内容错配
+• 启用输出分片时同时发布 shards/ 下的分片与索引
+• 用法: python serve.py [--host 0.0.0.0] [--port 8080] [--root 工作区] [--quiet]
+"""
+
+import argparse
+import http.server
+import json
+import os
+import sys
+import threading
+from email.utils import formatdate
+from pathlib import Path
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from compress import MANIFEST_FILE, OUTPUT_FILES, sha256
+from shard import SHARD_DIR
+
+# === 配置区 ===
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+HOST = "0.0.0.0"                  # 监听地址
+PORT = 8080                       # 监听端口
+SERVE_FILES = OUTPUT_FILES + ('adb.mrs', 'dns.bin', MANIFEST_FILE)  # 可发布的根目录文件
+SERVE_DIRS = (SHARD_DIR,)         # 可发布的子目录（仅限其中的文件，不含上级路径）
+CACHE_CONTROL = "public, max-age=300"
+ENCODINGS = (('br', 'br'), ('zstd', 'zst'), ('gzip', 'gz'))  # 服务端偏好顺序: (Content-Encoding, 预压缩扩展名)
+CONTENT_TYPES = {
+    '.txt': 'text/plain; charset=utf-8',
+    '.conf': 'text/plain; charset=utf-8',
+    '.zone': 'text/plain; charset=utf-8',
+    '.yaml': 'application/yaml; charset=utf-8',
+    '.json': 'application/json',
+}
+
+
+class Representation(NamedTuple):
+    """一个可发送的表示（原文件或某个预压缩版本）"""
+    path: Path
+    size: int
+    mtime: float
+    etag: str
+    encoding: Optional[str]
+
+
+class Catalog:
+    """可发布文件目录: 按 (mtime, 大小) 缓存各表示的 ETag，文件更新后惰性刷新"""
+
+    def __init__(self, root: Path, files=SERVE_FILES, dirs=SERVE_DIRS):
+        self.root = Path(root)
+        self.files = set(files)
+        self.dirs = set(dirs)
+        self._etags: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._manifest: Tuple[int, dict] = (0, {})
+        self._lock = threading.Lock()
+
+    def publishable(self, name: str) -> bool:
+        """根目录发布文件，或发布子目录下的普通路径"""
+        if name in self.files:
+            return True
+        parts = name.split('/')
+        return parts[0] in self.dirs and len(parts) > 1 and all(part not in ('', '.', '..') for part in parts)
+
+    def _manifest_files(self) -> Tuple[int, dict]:
+        """(清单 mtime_ns, 文件记录)；清单变化时重新读取"""
+        path = self.root / MANIFEST_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return 0, {}
+        if mtime != self._manifest[0]:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._manifest = (mtime, json.load(f).get('files', {}))
+            except (OSError, ValueError):
+                self._manifest = (mtime, {})
+        return self._manifest
+
+    def _checksum(self, name: str, ext: Optional[str], f: BinaryIO, stat: os.stat_result) -> str:
+        """清单晚于文件且大小一致时直接采用构建校验和，否则读取文件计算"""
+        with self._lock:
+            manifest_mtime, records = self._manifest_files()
+        record = records.get(name, {})
+        if ext:
+            record = record.get('variants', {}).get(ext, {})
+        if record.get('sha256') and record.get('bytes') == stat.st_size and manifest_mtime >= stat.st_mtime_ns:
+            return record['sha256']
+        data = f.read()
+        f.seek(0)
+        return sha256(data)
+
+    def open(self, name: str, encoding: Optional[str] = None) -> Optional[Tuple[BinaryIO, Representation]]:
+        """打开文件并按句柄描述（与发送内容一致）；不存在时返回 None"""
+        ext = dict(ENCODINGS)[encoding] if encoding else None
+        filename = f"{name}.{ext}" if ext else name
+        path = self.root / filename
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return None
+        stat = os.fstat(f.fileno())
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._etags.get(filename)
+        if cached is None or cached[0] != key:
+            cached = (key, f'"{self._checksum(name, ext, f, stat)[:32]}"')
+            self._etags[filename] = cached
+        return f, Representation(path, stat.st_size, stat.st_mtime, cached[1], encoding)
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Accept-Encoding 中可接受的预压缩编码（按服务端偏好排序，q=0 视为拒绝）"""
+    weights = {}
+    for item in header.split(','):
+        token, _, params = item.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if token:
+            weights[token.strip().lower()] = q
+    wildcard = weights.get('*', 0.0)
+    return [encoding for encoding, _ in ENCODINGS if weights.get(encoding, wildcard) > 0]
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """单区间 Range → [起点, 终点]（含）；多区间/非法格式返回 None（按完整内容响应）；不可满足返回 (-1, -1)"""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return -1, -1
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return -1, -1
+    return start, end
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 弱比较（忽略 W/ 前缀）"""
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return '*' in tags or etag in tags
+
+
+class PublishHandler(http.server.BaseHTTPRequestHandler):
+    """GET / HEAD: 条件请求、区间请求与编码协商"""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'EasyAds'
+    quiet = False
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _select(self, catalog: Catalog, name: str) -> Optional[Tuple[BinaryIO, Representation]]:
+        """选择表示: 客户端可接受且比原文件小、不早于原文件的预压缩版本优先"""
+        opened = catalog.open(name)
+        if opened is None:
+            return None
+        identity = opened[1]
+        for encoding in accepted_encodings(self.headers.get('Accept-Encoding', '')):
+            variant = catalog.open(name, encoding)
+            if variant is None:
+                continue
+            if variant[1].size < identity.size and variant[1].mtime >= identity.mtime:
+                opened[0].close()
+                return variant
+            variant[0].close()
+        return opened
+
+    def _serve(self, send_body: bool):
+        catalog: Catalog = self.server.catalog
+        name = unquote(urlsplit(self.path).path).lstrip('/')
+        opened = self._select(catalog, name) if catalog.publishable(name) else None
+        if opened is None:
+            self.send_error(404, "Not Found")
+            return
+        f, rep = opened
+        with f:
+            headers = {
+                'ETag': rep.etag,
+                'Last-Modified': formatdate(rep.mtime, usegmt=True),
+                'Cache-Control': CACHE_CONTROL,
+                'Vary': 'Accept-Encoding',
+                'Accept-Ranges': 'bytes',
+            }
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match and etag_matches(if_none_match, rep.etag):
+                self._respond(304, headers)
+                return
+
+            headers['Content-Type'] = CONTENT_TYPES.get(rep.path.suffix if not rep.encoding
+                                                        else Path(name).suffix, 'application/octet-stream')
+            if rep.encoding:
+                headers['Content-Encoding'] = rep.encoding
+            start, end, status = 0, rep.size - 1, 200
+            range_header = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            if range_header and (not if_range or if_range.strip() == rep.etag):
+                span = parse_range(range_header, rep.size)
+                if span == (-1, -1):
+                    headers['Content-Range'] = f"bytes */{rep.size}"
+                    headers['Content-Length'] = '0'
+                    self._respond(416, headers)
+                    return
+                if span is not None:
+                    (start, end), status = span, 206
+                    headers['Content-Range'] = f"bytes {start}-{end}/{rep.size}"
+            headers['Content-Length'] = str(end - start + 1)
+            self._respond(status, headers)
+            if send_body and end >= start:
+                self.connection.sendfile(f, start, end - start + 1)
+
+    def _respond(self, status: int, headers: Dict[str, str]):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+
+class PublishServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], root: Path, quiet: bool = False):
+        handler = type('Handler', (PublishHandler,), {'quiet': quiet})
+        super().__init__(address, handler)
+        self.catalog = Catalog(root)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="本地规则发布服务器（ETag / Range / 预压缩协商）")
+    parser.add_argument('--host', default=HOST, help=f"监听地址（默认 {HOST}）")
+    parser.add_argument('--port', type=int, default=PORT, help=f"监听端口（默认 {PORT}）")
+    parser.add_argument('--root', default=WORKSPACE, help="发布目录（默认工作区）")
+    parser.add_argument('--quiet', action='store_true', help="不输出访问日志")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    server = PublishServer((args.host, args.port), Path(args.root), args.quiet)
+    host, port = server.server_address[:2]
+    print(f"🚀 规则发布服务器: http://{host}:{port}/ (目录 {args.root})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("⏹️ 已停止")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+输出分片 (单文件过大、整表重载阻塞解析器的客户端用，可选)
+• 每个输出按稳定哈希 (hash) 或顶级域分组 (tld) 拆分为若干分片，单分片行数不超过上限
+• 分片键为规则主机名的可注册域（同一站点的拦截/例外规则落在同一分片）；无主机名的规则按原文哈希
+• 分片数取 2 的幂，规则增长时每个分片恰好一分为二，其余分片内容不受影响
+• 分片内容不含时间戳: 内容未变的分片不重写（mtime 与 ETag 不变），客户端只需重新加载变化的分片
+• 索引 shards/index.json 记录各分片的路径、行数、大小与 SHA-256
+• 用法: python shard.py [hash|tld]       (默认读取 SHARD_MODE，未设置时不启用)
+"""
+
+import json
+import os
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psl import public_suffix, registrable_domain
+from rules import KIND_COMMENT, ORDERED_KINDS, tokenize
+
+# === 配置区 ===
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+SHARD_MODE = os.getenv('SHARD_MODE', '')         # 分片方式: hash / tld（空 = 不启用）
+SHARD_FILES = ('adblock.txt', 'allow.txt', 'dns.txt', 'hosts.txt')  # 需要分片的根目录输出文件
+SHARD_DIR = "shards"              # 分片目录（相对工作区）
+INDEX_FILE = "index.json"         # 分片索引（位于分片目录）
+MIN_SHARDS = 8                    # hash 方式的最少分片数（2 的幂）
+MAX_SHARD_LINES = 20_000          # 单分片规则行数上限
+TLD_GROUPS = ('com', 'net', 'org', 'cn', 'io', 'xyz', 'top', 'info', 'cc', 'ru')  # tld 方式单独成组的顶级域，其余归入 other
+MODES = ('hash', 'tld')
+
+
+def shard_key(rule: str) -> Tuple[str, Optional[str]]:
+    """(哈希键, 顶级域)；带主机名的规则以可注册域为键"""
+    kind, _, start, end, _, _, _ = tokenize(rule)
+    if kind in ORDERED_KINDS and end > start:
+        host = rule[start:end].lower().strip('.')
+        if host:
+            return registrable_domain(host) or host, public_suffix(host).rsplit('.', 1)[-1]
+    return rule, None
+
+
+def parts_for(lines: int) -> int:
+    """行数上限下所需的分片数（向上取 2 的幂）"""
+    parts = 1
+    while parts * MAX_SHARD_LINES < lines:
+        parts *= 2
+    return parts
+
+
+def split(rules: Iterable[str], mode: str) -> Dict[str, List[str]]:
+    """规则 → {分片标签: 规则列表}（保持输入顺序；注释与头信息不进入分片）"""
+    keyed = []
+    for line in rules:
+        rule = line.strip()
+        if rule and tokenize(rule).kind != KIND_COMMENT:   # 含 Hosts 的 # 注释；## 元素隐藏规则保留
+            key, tld = shard_key(rule)
+            keyed.append((zlib.crc32(key.encode()), tld if tld in TLD_GROUPS else 'other', rule))
+
+    if mode == 'hash':
+        groups = {'': keyed}
+        minimum = {'': MIN_SHARDS}
+    else:
+        groups = {}
+        for item in keyed:
+            groups.setdefault(item[1], []).append(item)
+        minimum = {}
+
+    shards: Dict[str, List[str]] = {}
+    for group, items in sorted(groups.items()):
+        parts = max(minimum.get(group, 1), parts_for(len(items)))
+        while True:
+            buckets = [[] for _ in range(parts)]
+            for h, _, rule in items:
+                buckets[h % parts].append(rule)
+            if max(len(bucket) for bucket in buckets) <= MAX_SHARD_LINES:
+                break
+            parts *= 2   # 哈希分布不均导致超限时继续加倍
+        width = len(str(parts - 1))
+        for i, bucket in enumerate(buckets):
+            if mode == 'hash':
+                label = f"{i:0{width}d}"
+            else:
+                label = group if parts == 1 else f"{group}-{i:0{width}d}"
+            shards[label] = bucket
+    return shards
+
+
+def render(name: str, label: str, rules: List[str]) -> bytes:
+    """分片内容（头信息不含时间戳，内容不变则字节不变）"""
+    c = '#' if name == 'hosts.txt' else '!'
+    head = [f"{c} Title: EasyAds {name} [{label}]", f"{c} Homepage: https://github.com/045200/EasyAds",
+            f"{c} Rules: {len(rules)}"]
+    return ("\n".join(head + rules) + "\n").encode('utf-8')
+
+
+def load_index(path: Path) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_shards(workspace: Path, name: str, shards: Dict[str, List[str]],
+                 previous: Dict[str, dict]) -> Tuple[Dict[str, dict], int, int]:
+    """写出单个输出的分片（未变化的跳过），返回 (分片记录, 重写数, 重写字节数)"""
+    from compress import sha256
+    stem, ext = os.path.splitext(name)
+    directory = workspace / SHARD_DIR / stem
+    directory.mkdir(parents=True, exist_ok=True)
+    records, changed, written = {}, 0, 0
+    for label, rules in shards.items():
+        data = render(name, label, rules)
+        relative = f"{SHARD_DIR}/{stem}/{label}{ext}"
+        record = {'path': relative, 'lines': len(rules), 'bytes': len(data), 'sha256': sha256(data)}
+        records[label] = record
+        path = workspace / relative
+        old = previous.get(label, {})
+        if old.get('sha256') == record['sha256'] and path.exists() and path.stat().st_size == len(data):
+            continue
+        temp = path.with_name(path.name + '.tmp')
+        temp.write_bytes(data)
+        os.replace(temp, path)
+        changed += 1
+        written += len(data)
+    live = {Path(record['path']).name for record in records.values()}
+    for stale in directory.iterdir():
+        if stale.name not in live:
+            stale.unlink()   # 分片布局变化后不再使用的旧分片
+    return records, changed, written
+
+
+def generate(workspace: str = WORKSPACE, mode: str = SHARD_MODE,
+             files: Tuple[str, ...] = SHARD_FILES) -> Optional[dict]:
+    """按 mode 分片全部输出并更新索引，返回索引（mode 为空时不启用）"""
+    if not mode:
+        print("⏭️ 未设置 SHARD_MODE，跳过分片")
+        return None
+    if mode not in MODES:
+        print(f"❌ 未知分片方式: {mode}（可选 {' / '.join(MODES)}）")
+        return None
+    workspace = Path(workspace)
+    index_path = workspace / SHARD_DIR / INDEX_FILE
+    previous = load_index(index_path)
+    if previous.get('mode') != mode:
+        previous = {}
+    index = {'generated': int(time.time()), 'mode': mode, 'max_lines': MAX_SHARD_LINES, 'files': {}}
+    for name in files:
+        source = workspace / name
+        if not source.exists():
+            continue
+        with open(source, 'r', encoding='utf-8') as f:
+            shards = split(f, mode)
+        old = previous.get('files', {}).get(name, {}).get('shards', {})
+        records, changed, written = write_shards(workspace, name, shards, old)
+        index['files'][name] = {'shards': records}
+        total = sum(record['bytes'] for record in records.values())
+        print(f"🧱 {name}: {len(records)} 个分片 | 重写 {changed} 个 ({written / 1024:.0f}KB / 共 {total / 1024:.0f}KB)")
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    temp = index_path.with_name(index_path.name + '.tmp')
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(temp, index_path)
+    print(f"💾 {SHARD_DIR}/{INDEX_FILE}: {len(index['files'])} 个输出 | 方式 {mode} | 单分片上限 {MAX_SHARD_LINES} 行")
+    return index
+
+
+if __name__ == "__main__":
+    print("🚀 输出分片")
+    print(f"工作目录: {WORKSPACE}")
+    sys.exit(0 if generate(mode=(sys.argv[1] if len(sys.argv) > 1 else SHARD_MODE)) else 1)
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+上游规则源重叠与冗余分析 (MinHash / HyperLogLog 草图)
+• 每个源的规范化域名集合 → HyperLogLog 基数估计 + bottom-k MinHash 签名，内存与源大小无关
+• 报告: 两两 Jaccard 相似度 | 包含度 (A 中有多少也在 B 中) | 各源独有贡献 | 行数/字节占比（处理成本）
+• 草图持久化到 data/stats/source-sketches.json: 本次下载失败的源沿用上次草图，并与上次基数对比
+• 用法: python sketch.py   (读取 tmp/adblockNN.txt / allowNN.txt，需先运行下载阶段)
+"""
+
+import base64
+import datetime
+import heapq
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import instrument
+from rules import semantic_key
+
+# === 配置区 ===
+WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
+SKETCH_FILE = Path("data") / "stats" / "source-sketches.json"  # 跨运行持久化的草图
+HLL_PRECISION = 12        # HyperLogLog 寄存器数 2^12（4KB/源，标准误差约 1.6%）
+MINHASH_SIZE = 256        # bottom-k MinHash 签名长度（Jaccard 标准误差约 1/√k）
+REDUNDANT_CONTAINMENT = 0.9   # 某源 ≥90% 的域名已被另一源覆盖时提示可移除
+TOP_PAIRS = 10            # 报告中列出的最相似源对数
+
+SKETCH_FORMAT = 'easyads-sketch/1'
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计（寄存器按位取最大值即可合并）"""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, hashed: int):
+        rest_bits = 64 - self.precision
+        index = hashed >> rest_bits
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """并集草图（不修改自身）"""
+        return HyperLogLog(self.precision, bytes(map(max, self.registers, other.registers)))
+
+    def estimate(self) -> float:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)  # 小基数: 线性计数
+        return raw
+
+
+class MinHash:
+    """bottom-k MinHash: 保留单一哈希下最小的 k 个值"""
+
+    def __init__(self, size: int = MINHASH_SIZE, values: Iterable[int] = ()):
+        self.size = size
+        self._heap = [-v for v in sorted(set(values))[:size]]  # 大顶堆（取负），堆顶为当前第 k 小
+        heapq.heapify(self._heap)
+        self._members = {-v for v in self._heap}
+
+    def add(self, hashed: int):
+        heap = self._heap
+        if len(heap) < self.size:
+            if hashed not in self._members:
+                heapq.heappush(heap, -hashed)
+                self._members.add(hashed)
+        elif hashed < -heap[0] and hashed not in self._members:
+            self._members.discard(-heapq.heapreplace(heap, -hashed))
+            self._members.add(hashed)
+
+    @property
+    def values(self) -> List[int]:
+        return sorted(self._members)
+
+    @property
+    def exact(self) -> bool:
+        """集合不足 k 个元素时签名即完整集合，相似度为精确值"""
+        return len(self._members) < self.size
+
+    def jaccard(self, other: 'MinHash') -> float:
+        """并集的 bottom-k 中同时出现在两个签名里的比例"""
+        union = heapq.nsmallest(min(self.size, other.size), self._members | other._members)
+        if not union:
+            return 0.0
+        return sum(1 for v in union if v in self._members and v in other._members) / len(union)
+
+
+class SourceSketch:
+    """单个规则源的草图与处理成本"""
+
+    def __init__(self, name: str, group: str, url: str):
+        self.name = name
+        self.group = group
+        self.url = url
+        self.lines = 0
+        self.bytes = 0
+        self.hll = HyperLogLog()
+        self.minhash = MinHash()
+        self.updated = None
+        self.stale = False            # 本次未下载成功，沿用上次草图
+        self.previous: Optional[float] = None  # 上次运行的基数估计
+
+    def add(self, hashed: int):
+        """加入一个域名的 64 位哈希"""
+        self.hll.add(hashed)
+        self.minhash.add(hashed)
+
+    @property
+    def cardinality(self) -> float:
+        if self.minhash.exact:
+            return float(len(self.minhash.values))
+        return self.hll.estimate()
+
+    def to_json(self) -> dict:
+        return {
+            'name': self.name,
+            'group': self.group,
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'domains': round(self.cardinality),
+            'updated': self.updated,
+            'hll': base64.b64encode(bytes(self.hll.registers)).decode('ascii'),
+            'minhash': [format(v, 'x') for v in self.minhash.values],
+        }
+
+    @classmethod
+    def from_json(cls, url: str, data: dict) -> 'SourceSketch':
+        sketch = cls(data['name'], data['group'], url)
+        sketch.lines = data['lines']
+        sketch.bytes = data['bytes']
+        sketch.updated = data['updated']
+        sketch.hll = HyperLogLog(HLL_PRECISION, base64.b64decode(data['hll']))
+        sketch.minhash = MinHash(MINHASH_SIZE, (int(v, 16) for v in data['minhash']))
+        sketch.previous = data['domains']
+        return sketch
+
+
+# === 构建 ===
+def source_files(temp_dir: Path, adblock_sources: Sequence[str], allow_sources: Sequence[str]) -> List[Tuple[str, str, Path]]:
+    """(分组, 源URL, 下载文件) 列表；编号与 dl.download_rules 一致，01 为仓库内置规则"""
+    entries = []
+    for group, sources in (('adblock', adblock_sources), ('allow', allow_sources)):
+        entries.append((group, f"data/mod/{'adblock' if group == 'adblock' else 'whitelist'}.txt",
+                        temp_dir / f"{group}01.txt"))
+        for i, url in enumerate(sources, 2):
+            entries.append((group, url, temp_dir / f"{group}{i:02d}.txt"))
+    return entries
+
+
+def build_sketch(group: str, url: str, path: Path) -> SourceSketch:
+    """扫描一个源文件: 每条可跨语法比较的规则取其规范化域名，以 64 位 BLAKE2b 哈希加入草图"""
+    from hashlib import blake2b  # 按需加载: hashlib 初始化 OpenSSL 较慢，仅在构建草图时需要
+    sketch = SourceSketch(path.name, group, url)
+    sketch.bytes = path.stat().st_size
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            sketch.lines += 1
+            stripped = line.strip()
+            if not stripped:
+                continue
+            key, _ = semantic_key(stripped)
+            if key is not None:
+                sketch.add(int.from_bytes(blake2b(key[1].encode(), digest_size=8).digest(), 'big'))
+    sketch.updated = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    instrument.count('sketch.sources')
+    instrument.count('sketch.lines', sketch.lines)
+    return sketch
+
+
+def load_sketches(path: Path) -> Dict[str, SourceSketch]:
+    """读取上次运行的草图（格式或参数不一致时忽略）"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (data.get('format') != SKETCH_FORMAT or data.get('hll_precision') != HLL_PRECISION
+            or data.get('minhash_size') != MINHASH_SIZE):
+        return {}
+    sketches = {}
+    for url, entry in data.get('sources', {}).items():
+        try:
+            sketches[url] = SourceSketch.from_json(url, entry)
+        except (KeyError, ValueError, TypeError):
+            continue
+    return sketches
+
+
+def save_sketches(path: Path, sketches: List[SourceSketch]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        'format': SKETCH_FORMAT,
+        'hll_precision': HLL_PRECISION,
+        'minhash_size': MINHASH_SIZE,
+        'sources': {s.url: s.to_json() for s in sketches},
+    }
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def collect(temp_dir: Path, sketch_path: Path, adblock_sources: Sequence[str],
+            allow_sources: Sequence[str]) -> List[SourceSketch]:
+    """构建本次草图；未下载成功的源沿用上次草图"""
+    previous = load_sketches(sketch_path)
+    sketches = []
+    for group, url, path in source_files(temp_dir, adblock_sources, allow_sources):
+        old = previous.get(url)
+        if path.exists() and path.stat().st_size:
+            sketch = build_sketch(group, url, path)
+            sketch.previous = old.previous if old is not None else None
+        elif old is not None:
+            sketch = old
+            sketch.name = path.name
+            sketch.stale = True
+            sketch.previous = None
+        else:
+            continue
+        sketches.append(sketch)
+    return sketches
+
+
+# === 分析 ===
+def containment(a: SourceSketch, b: SourceSketch, jaccard: float) -> float:
+    """|A∩B| / |A|，由 Jaccard 与两侧基数推得"""
+    if a.cardinality <= 0:
+        return 0.0
+    intersection = jaccard * (a.cardinality + b.cardinality) / (1 + jaccard)
+    return min(1.0, intersection / a.cardinality)
+
+
+def unique_contributions(sketches: List[SourceSketch]) -> List[float]:
+    """各源独有域名数 ≈ |全部源并集| - |除该源外的并集|（前缀/后缀并集，O(N) 次合并）"""
+    n = len(sketches)
+    if n == 0:
+        return []
+    empty = HyperLogLog()
+    prefix = [empty]
+    for s in sketches:
+        prefix.append(prefix[-1].merge(s.hll))
+    suffix = [empty]
+    for s in reversed(sketches):
+        suffix.append(suffix[-1].merge(s.hll))
+    suffix.reverse()
+    total = prefix[-1].estimate()
+    return [max(0.0, total - prefix[i].merge(suffix[i + 1]).estimate()) for i in range(n)]
+
+
+def analyze(sketches: List[SourceSketch]) -> dict:
+    """按分组计算两两相似度、包含度、独有贡献与成本占比"""
+    report = {}
+    for group in ('adblock', 'allow'):
+        members = [s for s in sketches if s.group == group]
+        uniques = unique_contributions(members)
+        total_lines = sum(s.lines for s in members) or 1
+        total_bytes = sum(s.bytes for s in members) or 1
+        union = HyperLogLog()
+        for s in members:
+            union = union.merge(s.hll)
+        sources = [{
+            'name': s.name,
+            'url': s.url,
+            'domains': round(s.cardinality),
+            'previous': None if s.previous is None else round(s.previous),
+            'unique': round(min(unique, s.cardinality)),
+            'lines': s.lines,
+            'line_share': round(s.lines / total_lines, 4),
+            'byte_share': round(s.bytes / total_bytes, 4),
+            'stale': s.stale,
+        } for s, unique in zip(members, uniques)]
+
+        pairs = []
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                jaccard = a.minhash.jaccard(b.minhash)
+                pairs.append({
+                    'a': a.name,
+                    'b': b.name,
+                    'jaccard': round(jaccard, 4),
+                    'a_in_b': round(containment(a, b, jaccard), 4),
+                    'b_in_a': round(containment(b, a, jaccard), 4),
+                })
+        pairs.sort(key=lambda p: p['jaccard'], reverse=True)
+
+        # 每对只提示包含度更高的一侧；仓库内置规则 (01) 不参与
+        builtin = {s.name for s in members if s.url.startswith('data/')}
+        redundant = {}
+        for p in pairs:
+            name, other, value = max((p['a'], p['b'], p['a_in_b']), (p['b'], p['a'], p['b_in_a']),
+                                     key=lambda c: c[2])
+            if value >= REDUNDANT_CONTAINMENT and name not in builtin and other not in redundant:
+                if value > redundant.get(name, {}).get('containment', 0):
+                    redundant[name] = {'name': name, 'covered_by': other, 'containment': value}
+        report[group] = {
+            'union': round(union.estimate()),
+            'sources': sources,
+            'pairs': pairs,
+            'redundant': list(redundant.values()),
+        }
+    return report
+
+
+def print_report(report: dict):
+    for group, result in report.items():
+        print(f"\n📊 {group} 源: {len(result['sources'])} 个 | 并集约 {result['union']} 个域名")
+        for s in sorted(result['sources'], key=lambda s: s['lines'], reverse=True):
+            delta = '' if s['previous'] is None else f" ({s['domains'] - s['previous']:+d})"
+            stale = ' ⚠️ 沿用上次草图' if s['stale'] else ''
+            print(f"  📄 {s['name']}: 域名≈{s['domains']}{delta} | 独有≈{s['unique']} | "
+                  f"行数占比 {s['line_share']:.1%} | 字节占比 {s['byte_share']:.1%}{stale}")
+        if result['pairs']:
+            print(f"  🔗 最相似的 {min(TOP_PAIRS, len(result['pairs']))} 对:")
+            for p in result['pairs'][:TOP_PAIRS]:
+                print(f"    {p['a']} ↔ {p['b']}: Jaccard {p['jaccard']:.2f} | "
+                      f"包含度 {p['a_in_b']:.0%} / {p['b_in_a']:.0%}")
+        for r in result['redundant']:
+            print(f"  💡 {r['name']} 的 {r['containment']:.0%} 域名已被 {r['covered_by']} 覆盖，可考虑移除")
+
+
+def run(workspace: Path, adblock_sources: Sequence[str], allow_sources: Sequence[str]) -> dict:
+    """构建草图、输出报告并持久化，返回分析结果"""
+    start = time.perf_counter()
+    sketch_path = workspace / SKETCH_FILE
+    sketches = collect(workspace / "tmp", sketch_path, adblock_sources, allow_sources)
+    report = analyze(sketches)
+    print_report(report)
+    save_sketches(sketch_path, sketches)
+    print(f"\n✅ 草图已保存: {sketch_path} | 耗时 {time.perf_counter() - start:.1f}s")
+    return report
+
+
+def main() -> int:
+    import dl
+    print("🚀 规则源重叠分析启动")
+    with instrument.stage('sketch'):
+        report = run(Path(WORKSPACE), dl.ADBLOCK_SOURCES, dl.ALLOW_SOURCES)
+    return 0 if any(r['sources'] for r in report.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,7 +2,7 @@
 """
 规则文件头信息处理器 (GitHub CI优化版)
 • 自动更新规则文件头信息 | 智能处理 | 高性能
-• 支持文件: adblock.txt, allow.txt, dns.txt, hosts.txt, ads.yaml
+• 支持文件: adblock.txt, allow.txt, dns.txt, hosts.txt, ads.yaml, network.txt, cosmetic.txt, scriptlet.txt
 • 自动检测文件编码 | 保留原始换行符
 """
 
@@ -12,9 +12,12 @@ import sys
 from pathlib import Path
 from typing import Set, List, Tuple, Optional
 
+import instrument
+
 # === 配置区 ===
 WORKSPACE = os.getenv('WORKSPACE', os.getcwd())  # 统一工作区路径
-TARGET_FILES = {'adblock.txt', 'allow.txt', 'dns.txt', 'hosts.txt', 'ads.yaml'}
+TARGET_FILES = {'adblock.txt', 'allow.txt', 'dns.txt', 'hosts.txt', 'ads.yaml',
+                'network.txt', 'cosmetic.txt', 'scriptlet.txt'}
 
 HEADER_TEMPLATE = """[Adblock Plus 2.0]
 ! Title: EasyAds
@@ -26,16 +29,23 @@ HEADER_TEMPLATE = """[Adblock Plus 2.0]
 """
 
 # === 时区处理 ===
-try:
-    from zoneinfo import ZoneInfo
-    beijing_tz = ZoneInfo("Asia/Shanghai")
-except ImportError:
-    import pytz
-    beijing_tz = pytz.timezone("Asia/Shanghai")
+_beijing_tz = None
+
+def get_beijing_tz():
+    """按需加载北京时区（zoneinfo 不可用时回退 pytz）"""
+    global _beijing_tz
+    if _beijing_tz is None:
+        try:
+            from zoneinfo import ZoneInfo
+            _beijing_tz = ZoneInfo("Asia/Shanghai")
+        except ImportError:
+            import pytz
+            _beijing_tz = pytz.timezone("Asia/Shanghai")
+    return _beijing_tz
 
 def get_beijing_time() -> str:
     """获取当前北京时间（高效版）"""
-    return datetime.datetime.now(beijing_tz).strftime('%Y-%m-%d %H:%M:%S')
+    return datetime.datetime.now(get_beijing_tz()).strftime('%Y-%m-%d %H:%M:%S')
 
 def detect_encoding(file_path: Path) -> str:
     """智能检测文件编码"""
@@ -83,6 +93,7 @@ def process_file(file_path: Path, timestamp: str) -> bool:
         # 读取文件内容
         with file_path.open('r', encoding=encoding) as f:
             content = f.read()
+        instrument.count('title.bytes_read', len(content))
         
         # 分离现有头信息
         _, rule_content = extract_existing_header(content)
@@ -97,9 +108,11 @@ def process_file(file_path: Path, timestamp: str) -> bool:
         )
         new_content = new_header + rule_content
         
-        # 写入文件（保留原始编码）
-        with file_path.open('w', encoding=encoding) as f:
+        # 写入临时文件后原子替换（保留原始编码，并发读取方不会读到半截文件）
+        temp_path = file_path.with_name(file_path.name + '.tmp')
+        with temp_path.open('w', encoding=encoding) as f:
             f.write(new_content)
+        temp_path.replace(file_path)
         
         print(f"✅ 已更新 {file_path.name} (规则数: {line_count})")
         return True
@@ -108,13 +121,22 @@ def process_file(file_path: Path, timestamp: str) -> bool:
         print(f"❌ 处理 {file_path.name} 失败: {str(e)}")
         return False
 
+def stamp_files(rules_dir: Path, timestamp: str) -> int:
+    """为所有目标文件写入头信息，返回成功数量"""
+    success_count = 0
+    for filename in TARGET_FILES:
+        file_path = rules_dir / filename
+        with instrument.stage(f'title:{filename}'):
+            if process_file(file_path, timestamp):
+                success_count += 1
+    return success_count
+
 def main():
     """主处理流程"""
     print("🚀 规则文件头信息处理器启动")
     print(f"工作目录: {WORKSPACE}")
     
     timestamp = get_beijing_time()
-    success_count = 0
     rules_dir = Path(WORKSPACE)
     
     # 验证目录
@@ -123,10 +145,7 @@ def main():
         sys.exit(1)
     
     # 处理所有目标文件
-    for filename in TARGET_FILES:
-        file_path = rules_dir / filename
-        if process_file(file_path, timestamp):
-            success_count += 1
+    success_count = stamp_files(rules_dir, timestamp)
     
     # 结果摘要
     print("\n" + "=" * 50)